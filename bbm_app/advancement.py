@@ -0,0 +1,189 @@
+import threading
+
+from .models import Player
+from .rules import get_rules
+
+ADVANCEMENT_CHUNK_SIZE = 2000
+# The characteristics a level-up may improve; agility and passing are target numbers, so they improve downwards.
+CHARACTERISTICS = ('movement', 'strength', 'armor', 'agility', 'passing')
+LOWER_IS_BETTER = ('agility', 'passing')
+
+_lock = threading.Lock()
+_engine = None
+
+
+def popcount(mask):
+    """
+    Returns the number of skills in a skill mask.
+    """
+    return bin(mask).count('1')
+
+
+class AdvancementEngine:
+    """
+    The legal skill picks of level-ups, computed with bitmasks over the skills of the rules data.
+
+    Every skill is given one bit, every skill category the mask of its skills, and every position the masks
+    of its primary and secondary categories and of its starting skills. The legal picks of a player are then
+    the masks of its position minus the mask of the skills it already has: a few bitwise operations, with no
+    query once the skills of the player are known. A player picks its skills from the categories of its
+    position, which are the ones it is given when it is hired.
+    """
+
+    def __init__(self, rules):
+        """
+        Builds the masks from the rules data.
+        """
+        self.version = rules.version
+        self.skill_ids = sorted(rules.skills)
+        self.skill_bits = {skill_id: 1 << bit for bit, skill_id in enumerate(self.skill_ids)}
+        self.category_masks = {category_id: self.mask(skill_ids)
+                               for category_id, skill_ids in rules.category_skills.items()}
+        self.primary_masks = self._position_masks(rules.primary_categories)
+        self.secondary_masks = self._position_masks(rules.secondary_categories)
+        self.starting_masks = {position_id: self.mask(skill_ids)
+                               for position_id, skill_ids in rules.starting_skills.items()}
+        self.characteristics = {position.pk: tuple(getattr(position, name) for name in CHARACTERISTICS)
+                                for position in rules.positions.values()}
+
+    def _position_masks(self, position_categories):
+        """
+        Returns a dict mapping each position to the union of the masks of its categories.
+        """
+        masks = {}
+        for position_id, category_ids in position_categories.items():
+            mask = 0
+            for category_id in category_ids:
+                mask |= self.category_masks.get(category_id, 0)
+            masks[position_id] = mask
+        return masks
+
+    def mask(self, skill_ids):
+        """
+        Returns the mask of the skills 'skill_ids'. Skills unknown to the rules data are ignored.
+        """
+        mask = 0
+        for skill_id in skill_ids:
+            mask |= self.skill_bits.get(skill_id, 0)
+        return mask
+
+    def skills(self, mask):
+        """
+        Returns the ids of the skills in 'mask', in ascending order.
+        """
+        skill_ids = []
+        while mask:
+            lowest = mask & -mask
+            skill_ids.append(self.skill_ids[lowest.bit_length() - 1])
+            mask ^= lowest
+        return skill_ids
+
+    def legal_masks(self, position_id, known_mask):
+        """
+        Returns the (primary, secondary) masks of the skills a player at 'position_id' knowing 'known_mask'
+        may pick. A skill of both a primary and a secondary category is a primary pick.
+        """
+        primary = self.primary_masks.get(position_id, 0) & ~known_mask
+        secondary = self.secondary_masks.get(position_id, 0) & ~known_mask & ~primary
+        return primary, secondary
+
+    def legal_picks(self, position_id, skill_ids):
+        """
+        Returns the (primary, secondary) lists of the ids of the skills a player at 'position_id' knowing
+        the skills 'skill_ids' may pick.
+        """
+        primary, secondary = self.legal_masks(position_id, self.mask(skill_ids))
+        return self.skills(primary), self.skills(secondary)
+
+    def improvements(self, player):
+        """
+        Returns how many characteristic increases the player has taken over the base characteristics of its
+        position. A characteristic lowered by a lasting injury is not an increase, so an injury and an
+        increase of the same characteristic cancel out.
+        """
+        base = self.characteristics.get(player.position_id)
+        if base is None:
+            return 0
+        count = 0
+        for name, base_value in zip(CHARACTERISTICS, base):
+            value = getattr(player, name)
+            if value is None or base_value is None:
+                continue
+            count += max(base_value - value if name in LOWER_IS_BETTER else value - base_value, 0)
+        return count
+
+    def pending(self, level, position_id, known_mask, improvements=0):
+        """
+        Returns how many advances a player of 'level' at 'position_id' knowing 'known_mask' has earned but not
+        taken yet: one per level above Rookie, minus the skills it knows beyond the starting ones and the
+        'improvements' of its characteristics, each of which used a level-up too.
+        """
+        learned = popcount(known_mask & ~self.starting_masks.get(position_id, 0))
+        return max(level - 1 - learned - improvements, 0)
+
+
+def get_engine():
+    """
+    Returns the advancement engine of the current rules data, rebuilding it when the rules data has changed.
+    """
+    global _engine
+    rules = get_rules()
+    engine = _engine
+    if engine is not None and engine.version == rules.version:
+        return engine
+    with _lock:
+        if _engine is None or _engine.version != rules.version:
+            _engine = AdvancementEngine(rules)
+        return _engine
+
+
+def skill_masks(player_ids, engine=None):
+    """
+    Returns a dict mapping each of 'player_ids' to the mask of its skills, read with one query.
+    """
+    engine = engine or get_engine()
+    masks = dict.fromkeys(player_ids, 0)
+    for player_id, skill_id in (Player.skills.through.objects.filter(player_id__in=masks)
+                                .values_list('player_id', 'skill_id')):
+        masks[player_id] |= engine.skill_bits.get(skill_id, 0)
+    return masks
+
+
+def advancements(players, chunk_size=ADVANCEMENT_CHUNK_SIZE, pending_only=True):
+    """
+    Yields (player, pending, primary skill ids, secondary skill ids) for the players of the queryset, with
+    the number of advances each has earned but not taken yet, as skills or characteristic increases, and
+    the skills it may pick, only for the players with a pending advance unless 'pending_only' is False.
+
+    The players are read in chunks of 'chunk_size', ordered by id, with one more query per chunk for their
+    skills; the picks are computed with the masks of the engine.
+    """
+    engine = get_engine()
+    players = players.only('pk', 'name', 'number', 'level', 'position', 'player_team',
+                           *CHARACTERISTICS).order_by('pk')
+    last_pk = None
+    while True:
+        chunk = players if last_pk is None else players.filter(pk__gt=last_pk)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+        last_pk = chunk[-1].pk
+        masks = skill_masks([player.pk for player in chunk], engine)
+        for player in chunk:
+            known = masks[player.pk]
+            pending = engine.pending(player.level, player.position_id, known, engine.improvements(player))
+            if pending or not pending_only:
+                primary, secondary = engine.legal_masks(player.position_id, known)
+                yield player, pending, engine.skills(primary), engine.skills(secondary)
+
+
+def legal_picks(player):
+    """
+    Returns the (primary, secondary) lists of the skills the player may pick at its next level-up,
+    with one query for the skills it already has.
+    """
+    rules = get_rules()
+    engine = get_engine()
+    primary, secondary = engine.legal_masks(player.position_id, skill_masks([player.pk], engine)[player.pk])
+    return ([rules.skills[skill_id] for skill_id in engine.skills(primary)],
+            [rules.skills[skill_id] for skill_id in engine.skills(secondary)])
@@ -0,0 +1,497 @@
+import base64
+import hashlib
+import json
+
+from django.core.exceptions import PermissionDenied
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.views import View
+
+from .advancement import advancements
+from .archive import ARCHIVE_REASONS
+from .models import ArchivedPlayer, Coach, Player, Team
+from .roster import RosterReadModel
+from .rules import get_rules
+from .slots import RosterSlots
+
+API_VERSION = 'v1'
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(key):
+    """
+    Returns the opaque cursor pointing after the row with keyset value 'key'.
+    """
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Returns the keyset value encoded in 'cursor'. Raises ValueError for a cursor that was not made by
+    encode_cursor.
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor.')
+    if not isinstance(key, int):
+        raise ValueError('Invalid cursor.')
+    return key
+
+
+def page_hash(*parts):
+    """
+    Returns a short hash of 'parts', used to build the ETag of a page of results.
+    """
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+
+
+def serialize_team(team, private=False):
+    """
+    Returns the JSON representation of a team. The coach and race must be loaded with the team.
+    The treasury is only included when 'private' is True, for the coach of the team.
+    """
+    data = {
+        'id': team.pk,
+        'name': team.team_name,
+        'revision': team.revision,
+        'coach': {'id': team.coach_id, 'name': team.coach.coach_name},
+        'race': {'id': team.race_id, 'name': str(team.race)},
+        'team_re_rolls': team.team_re_roll,
+        'fan_factor': team.fan_factor,
+        'assistant_coaches': team.assistant_coaches,
+        'cheerleaders': team.cheerleaders,
+        'apothecary': team.apothecary,
+        'ctv': team.ctv,
+        'wins': team.wins,
+        'draws': team.draws,
+        'losses': team.losses,
+        'players_url': reverse('api_team_players', kwargs={'team_pk': team.pk}),
+        'archive_url': reverse('api_team_archive', kwargs={'team_pk': team.pk}),
+    }
+    if private:
+        data['treasury'] = team.treasury
+    return data
+
+
+def serialize_player(player):
+    """
+    Returns the JSON representation of a player. The position, skills and traits must be loaded with the player.
+    """
+    return {
+        'id': player.pk,
+        'number': player.number,
+        'name': player.name,
+        'position': {'id': player.position_id, 'name': player.position.name},
+        'level': player.get_level_display(),
+        'spp': player.spp,
+        'value': player.value,
+        'movement': player.movement,
+        'strength': player.strength,
+        'agility': player.agility,
+        'armor': player.armor,
+        'passing': player.passing,
+        'skills': [skill.name for skill in player.skills.all()],
+        'traits': [trait.name for trait in player.traits.all()],
+        'status': player.status,
+        'niggling_injuries': player.niggling_injuries,
+        'is_journeyman': player.is_journeyman,
+    }
+
+
+def serialize_archived_player(player):
+    """
+    Returns the JSON representation of an archived player. The position, skills and traits must be loaded
+    with the player.
+    """
+    return {
+        'id': player.original_id,
+        'reason': player.reason,
+        'archived_at': player.archived_at.isoformat(),
+        'number': player.number,
+        'name': player.name,
+        'position': {'id': player.position_id, 'name': player.position.name},
+        'level': player.get_level_display(),
+        'spp': player.spp,
+        'value': player.value,
+        'movement': player.movement,
+        'strength': player.strength,
+        'agility': player.agility,
+        'armor': player.armor,
+        'passing': player.passing,
+        'skills': [skill.name for skill in player.skills.all()],
+        'traits': [trait.name for trait in player.traits.all()],
+        'niggling_injuries': player.niggling_injuries,
+        'is_journeyman': player.is_journeyman,
+    }
+
+
+class ApiView(View):
+    """
+    Base class of the read-only JSON API views.
+
+    A view first computes a strong ETag with get_etag(), which must be cheap (typically one small query
+    for revision counters). When the request carries a matching If-None-Match header a 304 response is
+    returned without building the body; otherwise get_data() builds it. Clients are asked to revalidate
+    on every use, so they always see the current data while polling costs almost nothing.
+
+    The API is public, except for the treasury of a team, which only its coach sees: the ETag of a
+    response holding it includes whether the client is the coach.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        This method handles GET requests.
+
+        It returns the JSON body with its ETag, a 304 response if the client already has it, a 400
+        response with an error message for invalid parameters, or a 403 response for private data.
+        """
+        try:
+            etag = quote_etag(f'{API_VERSION}-{self.get_etag()}')
+        except ValueError as error:
+            return JsonResponse({'error': str(error)}, status=400)
+        except PermissionDenied as error:
+            return JsonResponse({'error': str(error)}, status=403)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = JsonResponse(self.get_data())
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def is_coach(self, coach_id):
+        """
+        Returns True if the client is logged in as the coach with id 'coach_id'.
+        """
+        return coach_id is not None and coach_id == self.request.coach_id
+
+    def get_page_params(self):
+        """
+        Returns the (cursor key, limit) of the requested page. Raises ValueError for invalid parameters.
+        """
+        cursor = self.request.GET.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+        try:
+            limit = int(self.request.GET.get('limit', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            raise ValueError("'limit' must be a number.")
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise ValueError(f"'limit' must be between 1 and {MAX_PAGE_SIZE}.")
+        return after, limit
+
+    def keyset_page(self, queryset, key_field):
+        """
+        Returns the requested page of 'queryset', ordered by the unique 'key_field', as a list of at most
+        'limit' rows, together with the cursor of the next page or None on the last page.
+
+        Pages are selected with WHERE key > cursor, so reading a page costs the same wherever it is.
+        """
+        after, limit = self.get_page_params()
+        if after is not None:
+            queryset = queryset.filter(**{f'{key_field}__gt': after})
+        rows = list(queryset.order_by(key_field)[:limit + 1])
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        last = rows[-1]
+        key = last[0] if isinstance(last, tuple) else getattr(last, key_field)
+        return rows, encode_cursor(key)
+
+    def next_url(self, cursor):
+        """
+        Returns the URL of the next page for 'cursor', keeping the other query parameters.
+        """
+        if cursor is None:
+            return None
+        query = self.request.GET.copy()
+        query['cursor'] = cursor
+        return f'{self.request.path}?{query.urlencode()}'
+
+
+class RaceListApiView(ApiView):
+    """
+    This view returns every race with the positions available to it, read from the rules cache.
+    """
+
+    def get_etag(self):
+        """
+        Returns the ETag of the response: the version of the rules data.
+        """
+        return f'rules-{get_rules().version}'
+
+    def get_data(self):
+        """
+        Returns the JSON body of the response.
+        """
+        rules = get_rules()
+        return {'results': [
+            {
+                'id': race.pk,
+                'code': race.race_type,
+                'name': str(race),
+                'reroll_cost': race.reroll_cost,
+                'has_apothecary': race.has_apothecary,
+                'positions': [{'id': position_id, 'max_count': rules.position_limit(race.pk, position_id)}
+                              for position_id in rules.race_positions.get(race.pk, [])],
+            }
+            for race in sorted(rules.races.values(), key=lambda race: race.pk)
+        ]}
+
+
+class PositionListApiView(ApiView):
+    """
+    This view returns every position with its characteristics, skills, traits and skill categories,
+    read from the rules cache.
+    """
+
+    def get_etag(self):
+        """
+        Returns the ETag of the response: the version of the rules data.
+        """
+        return f'rules-{get_rules().version}'
+
+    def get_data(self):
+        """
+        Returns the JSON body of the response.
+        """
+        rules = get_rules()
+        return {'results': [
+            {
+                'id': position.pk,
+                'name': position.name,
+                'cost': position.cost,
+                'movement': position.movement,
+                'strength': position.strength,
+                'agility': position.agility,
+                'armor': position.armor,
+                'passing': position.passing,
+                'skills': [rules.skills[pk].name for pk in rules.starting_skills.get(position.pk, [])],
+                'traits': [rules.traits[pk].name for pk in rules.position_traits.get(position.pk, [])],
+                'primary_skill_categories': [rules.skill_categories[pk].name
+                                             for pk in rules.primary_categories.get(position.pk, [])],
+                'secondary_skill_categories': [rules.skill_categories[pk].name
+                                               for pk in rules.secondary_categories.get(position.pk, [])],
+            }
+            for position in rules.positions.values()
+        ]}
+
+
+class CoachApiView(ApiView):
+    """
+    This view returns a coach and the revisions of its teams.
+    """
+
+    def get_etag(self):
+        """
+        Returns the ETag of the response: a hash of the coach and the names and revisions of its teams.
+        """
+        self.coach = get_object_or_404(Coach, pk=self.kwargs['coach_pk'])
+        self.teams = list(self.coach.teams.order_by('pk').values_list('pk', 'team_name', 'revision'))
+        return f'coach-{self.coach.pk}-{page_hash(self.coach.coach_name, self.coach.club, self.teams)}'
+
+    def get_data(self):
+        """
+        Returns the JSON body of the response.
+        """
+        return {
+            'id': self.coach.pk,
+            'name': self.coach.coach_name,
+            'club': self.coach.club,
+            'teams': [{'id': pk, 'name': name, 'revision': revision,
+                       'url': reverse('api_team', kwargs={'team_pk': pk})}
+                      for pk, name, revision in self.teams],
+        }
+
+
+class TeamListApiView(ApiView):
+    """
+    This view returns a page of teams, optionally of one coach or race, ordered by id.
+    Pages are chained with the opaque 'cursor' returned as 'next'.
+    """
+
+    def get_queryset(self):
+        """
+        Returns the teams matching the 'coach' and 'race' query parameters.
+        """
+        queryset = Team.objects.all()
+        for parameter in ('coach', 'race'):
+            value = self.request.GET.get(parameter)
+            if value:
+                if not value.isdigit():
+                    raise ValueError(f"'{parameter}' must be an id.")
+                queryset = queryset.filter(**{f'{parameter}_id': int(value)})
+        return queryset
+
+    def get_etag(self):
+        """
+        Returns the ETag of the response: a hash of the ids, revisions and coach names of the teams on the page,
+        of the version of the rules data, which holds the race names, and of the teams of the client.
+        """
+        rows, cursor = self.keyset_page(
+            self.get_queryset().values_list('pk', 'revision', 'coach__coach_name', 'coach_id'), 'pk')
+        self.page_keys = [row[0] for row in rows]
+        self.next_cursor = cursor
+        own = [row[0] for row in rows if self.is_coach(row[3])]
+        return f'teams-{page_hash(rows, cursor, own, get_rules().version)}'
+
+    def get_data(self):
+        """
+        Returns the JSON body of the response.
+        """
+        teams = RosterReadModel.team_queryset().filter(pk__in=self.page_keys).order_by('pk')
+        return {'results': [serialize_team(team, self.is_coach(team.coach_id)) for team in teams],
+                'next': self.next_url(self.next_cursor)}
+
+
+class TeamApiView(ApiView):
+    """
+    This view returns one team. Its ETag is the revision of the team, the name of its coach and the version
+    of the rules data, which holds the race names.
+    """
+
+    def get_etag(self):
+        """
+        Returns the ETag of the response: the id and revision of the team and a hash of the name of its coach,
+        the version of the rules data and whether the client is the coach.
+        """
+        row = (Team.objects.filter(pk=self.kwargs['team_pk'])
+               .values_list('revision', 'coach__coach_name', 'coach_id').first())
+        if row is None:
+            raise Http404('No team matches the given query.')
+        revision, coach_name, coach_id = row
+        self.private = self.is_coach(coach_id)
+        return f'team-{self.kwargs["team_pk"]}-r{revision}-{page_hash(coach_name, get_rules().version, self.private)}'
+
+    def get_data(self):
+        """
+        Returns the JSON body of the response.
+        """
+        return serialize_team(get_object_or_404(RosterReadModel.team_queryset(), pk=self.kwargs['team_pk']),
+                              self.private)
+
+
+class PlayerListApiView(ApiView):
+    """
+    This view returns a page of the roster of a team ordered by number, optionally only the players with
+    the given 'status'. Its ETag is the revision of the team and the requested page.
+    """
+
+    def get_etag(self):
+        """
+        Returns the ETag of the response: the id and revision of the team and a hash of the query parameters.
+        """
+        revision = Team.objects.filter(pk=self.kwargs['team_pk']).values_list('revision', flat=True).first()
+        if revision is None:
+            raise Http404('No team matches the given query.')
+        self.get_page_params()
+        return f'team-{self.kwargs["team_pk"]}-r{revision}-players-{page_hash(self.request.GET.urlencode())}'
+
+    def get_data(self):
+        """
+        Returns the JSON body of the response.
+        """
+        team = Team(pk=self.kwargs['team_pk'])
+        players = RosterReadModel(team).players
+        status = self.request.GET.get('status')
+        if status:
+            players = players.filter(status=status)
+        players, cursor = self.keyset_page(players, 'number')
+        return {'results': [serialize_player(player) for player in players], 'next': self.next_url(cursor)}
+
+
+class TeamSlotsApiView(ApiView):
+    """
+    This view returns what a team can still hire: its free numbers and, for every position of its race,
+    the remaining count and whether the treasury covers it. Since it tells the treasury, only the coach
+    of the team may read it. Its ETag is the revision of the team and the version of the rules data.
+    """
+
+    def get_etag(self):
+        """
+        Returns the ETag of the response: the id and revision of the team and the version of the rules data.
+        Raises PermissionDenied when the client is not the coach of the team.
+        """
+        self.team = get_object_or_404(Team.objects.only('pk', 'coach_id', 'race_id', 'treasury', 'revision'),
+                                      pk=self.kwargs['team_pk'])
+        if not self.is_coach(self.team.coach_id):
+            raise PermissionDenied('Only the coach of the team may read its slots.')
+        return f'team-{self.team.pk}-r{self.team.revision}-slots-{get_rules().version}'
+
+    def get_data(self):
+        """
+        Returns the JSON body of the response.
+        """
+        return RosterSlots.for_team(self.team).as_dict()
+
+
+class ArchivedPlayerListApiView(ApiView):
+    """
+    This view returns a page of the archived players of a team, dead, retired and fired, in the order they
+    were archived, optionally only those archived for the given 'reason': 'dead' for the graveyard.
+    Its ETag is the revision of the team, which archiving a player bumps, and the requested page.
+    """
+
+    def get_etag(self):
+        """
+        Returns the ETag of the response: the id and revision of the team and a hash of the query parameters.
+        """
+        revision = Team.objects.filter(pk=self.kwargs['team_pk']).values_list('revision', flat=True).first()
+        if revision is None:
+            raise Http404('No team matches the given query.')
+        reason = self.request.GET.get('reason')
+        if reason and reason not in ARCHIVE_REASONS:
+            raise ValueError(f"'reason' must be one of: {', '.join(ARCHIVE_REASONS)}.")
+        self.get_page_params()
+        return f'team-{self.kwargs["team_pk"]}-r{revision}-archive-{page_hash(self.request.GET.urlencode())}'
+
+    def get_data(self):
+        """
+        Returns the JSON body of the response.
+        """
+        players = (ArchivedPlayer.objects.filter(team_id=self.kwargs['team_pk'])
+                   .select_related('position')
+                   .prefetch_related('skills', 'traits'))
+        reason = self.request.GET.get('reason')
+        if reason:
+            players = players.filter(reason=reason)
+        players, cursor = self.keyset_page(players, 'pk')
+        return {'results': [serialize_archived_player(player) for player in players], 'next': self.next_url(cursor)}
+
+
+class AdvancementListApiView(ApiView):
+    """
+    This view returns the players of a team with skills earned but not picked yet, ordered by number,
+    with the number of pending picks and the primary and secondary skills each may pick.
+    Its ETag is the revision of the team and the version of the rules data.
+    """
+
+    def get_etag(self):
+        """
+        Returns the ETag of the response: the id and revision of the team and the version of the rules data.
+        """
+        revision = Team.objects.filter(pk=self.kwargs['team_pk']).values_list('revision', flat=True).first()
+        if revision is None:
+            raise Http404('No team matches the given query.')
+        return f'team-{self.kwargs["team_pk"]}-r{revision}-advancements-{get_rules().version}'
+
+    def get_data(self):
+        """
+        Returns the JSON body of the response.
+        """
+        rules = get_rules()
+        players = Player.objects.filter(player_team_id=self.kwargs['team_pk']).exclude(status='dead')
+        results = [{
+            'id': player.pk,
+            'number': player.number,
+            'name': player.name,
+            'position': {'id': player.position_id, 'name': rules.positions[player.position_id].name},
+            'level': player.get_level_display(),
+            'pending': pending,
+            'primary': [{'id': skill_id, 'name': rules.skills[skill_id].name} for skill_id in primary],
+            'secondary': [{'id': skill_id, 'name': rules.skills[skill_id].name} for skill_id in secondary],
+        } for player, pending, primary, secondary in advancements(players)]
+        return {'results': sorted(results, key=lambda player: player['number'])}
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class BbmAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bbm_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
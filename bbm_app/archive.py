@@ -0,0 +1,113 @@
+from django.db import transaction
+from django.db.models import Q
+
+from .history import track
+from .matches import _increment
+from .models import ArchivedPlayer, Player, SPPAward, Team
+
+ARCHIVE_CHUNK_SIZE = 2000
+ARCHIVE_REASONS = tuple(reason for reason, _ in ArchivedPlayer.REASON_CHOICES)
+# The fields copied from a player to its archived record as they are.
+ARCHIVED_FIELDS = ('name', 'position_id', 'number', 'level', 'spp', 'value', 'movement', 'strength', 'agility',
+                   'armor', 'passing', 'niggling_injuries', 'is_journeyman')
+
+
+def archivable(players):
+    """
+    Returns the players of the queryset that can be archived: those with no SPP awarded in a match
+    that has not been processed yet, since archiving a player deletes its awards.
+    """
+    return players.exclude(spp_awards__match__processed=False)
+
+
+def _copy_links(through, archived_through, field, archived_ids):
+    """
+    Copies the rows of the Player many-to-many table 'through' to the ArchivedPlayer one, for the players
+    whose archived record id is given in 'archived_ids', a dict mapping player ids to archived record ids.
+    """
+    archived_through.objects.bulk_create([
+        archived_through(**{'archivedplayer_id': archived_ids[player_id], field: target_id})
+        for player_id, target_id in (through.objects.filter(player_id__in=archived_ids)
+                                     .order_by('pk').values_list('player_id', field))
+    ])
+
+
+@transaction.atomic
+def archive_players(players, reason):
+    """
+    Moves 'players', loaded Player instances, from the Player table to the ArchivedPlayer table with
+    'reason' ('dead', 'retired' or 'fired'), keeping their stats, skills and traits. Their SPP awards are
+    deleted with them and kept as [match id, SPP] pairs on the archived records; since an award of a match
+    that is not processed yet would then never be applied, callers pick the players with archivable().
+
+    Everything is written in bulk. The value of active players is taken off their team, and the revision
+    of every team losing a player is bumped. Returns the list of the archived records.
+    Raises ValueError for an unknown reason.
+    """
+    if reason not in ARCHIVE_REASONS:
+        raise ValueError(f"Unknown reason '{reason}', expected one of: {', '.join(ARCHIVE_REASONS)}.")
+    players = list(players)
+    if not players:
+        return []
+    awards = {player.pk: [] for player in players}
+    for player_id, match_id, spp in (SPPAward.objects.filter(player_id__in=awards).order_by('match_id')
+                                     .values_list('player_id', 'match_id', 'spp')):
+        awards[player_id].append([match_id, spp])
+    archived = ArchivedPlayer.objects.bulk_create([
+        ArchivedPlayer(original_id=player.pk, team_id=player.player_team_id or player.graveyard_id, reason=reason,
+                       spp_awards=awards[player.pk], **{field: getattr(player, field) for field in ARCHIVED_FIELDS})
+        for player in players
+    ])
+    archived_ids = {record.original_id: record.pk for record in archived}
+    _copy_links(Player.skills.through, ArchivedPlayer.skills.through, 'skill_id', archived_ids)
+    _copy_links(Player.traits.through, ArchivedPlayer.traits.through, 'trait_id', archived_ids)
+
+    value_changes = {}
+    for player in players:
+        if player.player_team_id is not None:
+            change = value_changes.get(player.player_team_id, 0)
+            value_changes[player.player_team_id] = change - player.ctv_contribution
+    Player.objects.filter(pk__in=archived_ids).delete()
+    _increment(Team.objects.all(), 'ctv', value_changes)
+    Team.bump_revisions({record.team_id for record in archived})
+    track(team_id for team_id, change in value_changes.items() if change)
+    return archived
+
+
+def fire_player(player):
+    """
+    Fires a player: removes it from its team and archives it. Returns the archived record.
+    """
+    return archive_players([player], 'fired')[0]
+
+
+def retire_player(player):
+    """
+    Retires a player: removes it from its team and archives it. Returns the archived record.
+    """
+    return archive_players([player], 'retired')[0]
+
+
+def archive_dead_players(teams=None, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """
+    Archives every dead player, or only those of the 'teams' queryset, in chunks of 'chunk_size' players,
+    each in its own transaction. Players with SPP awards in unprocessed matches are left for a later run.
+    Returns the number of players archived.
+    """
+    dead = archivable(Player.objects.filter(status='dead'))
+    if teams is not None:
+        dead = dead.filter(Q(player_team__in=teams) | Q(graveyard__in=teams))
+    count = 0
+    while chunk := list(dead.order_by('pk')[:chunk_size]):
+        count += len(archive_players(chunk, 'dead'))
+    return count
+
+
+def graveyard(team):
+    """
+    Returns the list of the dead players of the team, most recent first: the dead players not archived yet,
+    kept in the Player table until archive_dead_players() runs, then the archived ones. Both have the same
+    stats, skills and traits, with two queries plus the skills and traits when read.
+    """
+    return (list(team.dead_players.filter(status='dead').order_by('-pk'))
+            + list(team.archived_players.filter(reason='dead').order_by('-archived_at', '-pk')))
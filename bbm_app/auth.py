@@ -0,0 +1,93 @@
+from django.contrib.auth import SESSION_KEY, get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+# The session key holding the id of the coach of the logged-in user.
+COACH_SESSION_KEY = '_coach_id'
+
+
+def users_with_coach():
+    """
+    Returns the User queryset that loads every user together with its coach, if it has one.
+    """
+    return get_user_model()._default_manager.select_related('coach')
+
+
+def user_coach_id(user):
+    """
+    Returns the id of the coach of a user loaded with users_with_coach, or None for a user with no coach.
+    """
+    try:
+        return user.coach.pk
+    except get_user_model().coach.RelatedObjectDoesNotExist:
+        return None
+
+
+class CoachBackend(ModelBackend):
+    """
+    An authentication backend that loads the user together with its coach in one query,
+    both when a user logs in and when the user of a session is loaded on every request,
+    so reading request.user.coach never runs a query.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        """
+        Returns the user with the given username and password, with its coach loaded, or None.
+        """
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = users_with_coach().get(**{UserModel.USERNAME_FIELD: username})
+        except UserModel.DoesNotExist:
+            # Run the password hasher once to reduce the timing difference with an existing user.
+            UserModel().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    def get_user(self, user_id):
+        """
+        Returns the active user with the given id, with its coach loaded, or None.
+        """
+        try:
+            user = users_with_coach().get(pk=user_id)
+        except get_user_model().DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+
+def remember_coach(request, user):
+    """
+    Stores the id of the coach of the user that just logged in in the session and on the request.
+    """
+    request.coach_id = user_coach_id(user)
+    if request.coach_id is not None:
+        request.session[COACH_SESSION_KEY] = request.coach_id
+
+
+class CoachMiddleware:
+    """
+    Sets request.coach_id to the id of the coach of the logged-in user, or None, from the session,
+    so ownership checks compare ids without loading the user, the coach or the teams.
+
+    The id is stored in the session at login. For a session started before it was, it is read once from
+    request.user, which CoachBackend loads together with its coach. Must come after AuthenticationMiddleware.
+    """
+
+    def __init__(self, get_response):
+        """
+        Initialize the middleware.
+        """
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """
+        Sets request.coach_id and handles the request.
+        """
+        request.coach_id = request.session.get(COACH_SESSION_KEY)
+        if request.coach_id is None and SESSION_KEY in request.session and request.user.is_authenticated:
+            remember_coach(request, request.user)
+        return self.get_response(request)
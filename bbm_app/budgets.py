@@ -0,0 +1,143 @@
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+
+class Budget:
+    """
+    The number of queries and the wall time a hot path may use.
+
+    Query budgets are exact limits: a change adding a query per player, team or row goes over them.
+    Time budgets are generous ceilings that only catch gross regressions, since machines vary; they are
+    only checked when asked for, by the benchmark tests, so the unit suite does not depend on the machine.
+    """
+
+    def __init__(self, queries, milliseconds):
+        """
+        Initialize the budget.
+        """
+        self.queries = queries
+        self.milliseconds = milliseconds
+
+    def __repr__(self):
+        """
+        Returns a debugging representation of the budget.
+        """
+        return f'Budget(queries={self.queries!r}, milliseconds={self.milliseconds!r})'
+
+
+# The budgets of the hot paths, measured with a full roster of 16 players with skills and traits,
+# a coach with 10 teams and the whole rules data loaded, and the rules cache warm unless said otherwise.
+# The queries include those of the on-commit callbacks: recording a team history point takes five.
+BUDGETS = {
+    # Session, user, team, the roster slots, then the roster: players, skills and traits.
+    'manage_team.get': Budget(queries=7, milliseconds=500),
+    # The same with the roster slots and fragments cached at the current revision of the team: session, user, team.
+    'manage_team.get.cached': Budget(queries=3, milliseconds=500),
+    # The GET queries plus the conditional UPDATE of the purchase, the refresh of the team and the history point.
+    'manage_team.post.reroll': Budget(queries=14, milliseconds=500),
+    # The GET queries plus the hire: charge, limit, insert, value, position links and the history point.
+    'manage_team.post.player': Budget(queries=24, milliseconds=500),
+    # The roster slots, read once per revision of the team; the positions come from the rules cache.
+    'add_player_form.init': Budget(queries=1, milliseconds=50),
+    # The limits, numbers and funds are checked against the roster slots.
+    'add_player_form.clean': Budget(queries=0, milliseconds=50),
+    # The staff fields and the team value delta, however big the roster, then the history point.
+    'team.save': Budget(queries=7, milliseconds=50),
+    # The teams of the coach, once for the choices and the validation.
+    'select_team_form': Budget(queries=1, milliseconds=50),
+    # The load commands read each table once and write with bulk inserts and updates.
+    'load_skills': Budget(queries=10, milliseconds=1000),
+    'load_traits': Budget(queries=5, milliseconds=1000),
+    'load_races': Budget(queries=4, milliseconds=1000),
+    'load_positions': Budget(queries=24, milliseconds=2000),
+    'load_rules': Budget(queries=30, milliseconds=3000),
+}
+
+
+class BudgetExceeded(AssertionError):
+    """
+    Raised when a hot path uses more queries or time than its budget.
+    """
+
+
+class Measurement:
+    """
+    The queries and wall time used by one run of a hot path.
+    """
+
+    def __init__(self, name):
+        """
+        Initialize an empty measurement of the hot path called 'name'.
+        """
+        self.name = name
+        self.queries = []
+        self.seconds = 0.0
+
+    @property
+    def milliseconds(self):
+        """
+        Returns the wall time of the run in milliseconds.
+        """
+        return self.seconds * 1000
+
+    def __str__(self):
+        """
+        Returns a one line summary of the measurement.
+        """
+        return f'{self.name}: {len(self.queries)} queries in {self.milliseconds:.1f} ms'
+
+
+def check(measurement, budget, timed=False):
+    """
+    Raises BudgetExceeded, listing the queries that were run, if 'measurement' goes over the query budget
+    of 'budget', or over its time budget when 'timed' is True.
+    """
+    problems = []
+    if len(measurement.queries) > budget.queries:
+        problems.append(f'{len(measurement.queries)} queries, budget {budget.queries}')
+    if timed and measurement.milliseconds > budget.milliseconds:
+        problems.append(f'{measurement.milliseconds:.1f} ms, budget {budget.milliseconds} ms')
+    if problems:
+        queries = '\n'.join(f'  {query["sql"]}' for query in measurement.queries)
+        raise BudgetExceeded(f'{measurement.name} is over budget: {"; ".join(problems)}\n{queries}')
+
+
+class QueryRecorder:
+    """
+    A database execute wrapper that records the SQL and parameters of every query run through the connection,
+    for the budgets and the query plan checks.
+    """
+
+    def __init__(self, queries):
+        """
+        Initialize the recorder, appending the queries to the list 'queries'.
+        """
+        self.queries = queries
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        Records the query, then runs it.
+        """
+        self.queries.append({'sql': sql, 'params': params})
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def within_budget(name, budget=None, timed=False):
+    """
+    Measures the queries and wall time of the block. Raises BudgetExceeded when they go over the budget of
+    the hot path 'name' (from BUDGETS unless 'budget' is given); the time budget is only checked when
+    'timed' is True. Yields the measurement.
+
+    The queries of the on-commit callbacks the block registers are only measured if they run inside it;
+    the tests run them there with the within_budget fixture, as their transaction never commits.
+    """
+    budget = budget or BUDGETS[name]
+    measurement = Measurement(name)
+    with connection.execute_wrapper(QueryRecorder(measurement.queries)):
+        start = time.perf_counter()
+        yield measurement
+        measurement.seconds = time.perf_counter() - start
+    check(measurement, budget, timed)
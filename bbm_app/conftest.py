@@ -1,8 +1,36 @@
+from contextlib import contextmanager
+
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
 from .models import Coach, Race, Position, Team, RacePositionLimit
+from . import budgets, rules
 import pytest
 
 
+@pytest.fixture(autouse=True)
+def fresh_rules_cache():
+    """Make sure no test sees rules data or rosters cached by a previous test."""
+    cache.clear()
+    rules.bump_version()
+    yield
+    cache.clear()
+    rules.bump_version()
+
+
+@pytest.fixture
+def within_budget(django_capture_on_commit_callbacks):
+    """
+    Return budgets.within_budget, running the on-commit callbacks of the block inside it so their queries
+    are measured, although the test transaction never commits.
+    """
+    @contextmanager
+    def measure(name, budget=None, timed=False):
+        with budgets.within_budget(name, budget, timed) as measurement, \
+                django_capture_on_commit_callbacks(execute=True):
+            yield measurement
+    return measure
+
+
 @pytest.fixture
 def client():
     """Create a Django test client."""
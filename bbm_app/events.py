@@ -0,0 +1,220 @@
+import asyncio
+import json
+import threading
+from datetime import timedelta
+
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.utils import timezone
+
+from .models import LeagueEvent, Standing
+
+POLL_INTERVAL = 2.0
+HEARTBEAT_INTERVAL = 15.0
+MAX_QUEUED_EVENTS = 100
+# How long the events of a league are kept: a client away for longer reloads the standings page instead.
+EVENT_RETENTION = timedelta(days=7)
+
+_feeds = {}
+_feeds_lock = threading.Lock()
+
+
+def standings_data(league):
+    """
+    Returns the standings table of a league as a list of dicts, in standings order, with one query.
+    """
+    from .matches import standings_order
+    return [
+        {
+            'team': standing.team_id,
+            'name': standing.team.team_name,
+            'played': standing.played,
+            'wins': standing.wins,
+            'draws': standing.draws,
+            'losses': standing.losses,
+            'touchdown_difference': standing.touchdown_difference,
+            'casualty_difference': standing.casualty_difference,
+            'strength_of_schedule': standing.strength_of_schedule,
+            'points': standing.points,
+        }
+        for standing in Standing.objects.filter(league=league).select_related('team').order_by(*standings_order())
+    ]
+
+
+def publish(league, kind, data):
+    """
+    Adds an event to the change feed of a league, in the current transaction. Once the transaction commits,
+    the live feed of the league in this process is woken up; feeds in other processes pick the event up
+    on their next poll.
+    """
+    event = LeagueEvent.objects.create(league=league, kind=kind, data=data)
+    transaction.on_commit(lambda: notify(league.pk), robust=True)
+    return event
+
+
+def is_live(request):
+    """
+    Returns True when the request is served by the ASGI entry point, the only one that can hold the
+    long-lived connections of the change feed: under WSGI every open connection would hold a worker.
+    """
+    return isinstance(request, ASGIRequest)
+
+
+def prune_events(league, before=None):
+    """
+    Deletes the events of a league created before 'before', by default EVENT_RETENTION ago, with one query.
+    """
+    before = before or timezone.now() - EVENT_RETENTION
+    return LeagueEvent.objects.filter(league=league, created_at__lt=before).delete()[0]
+
+
+def publish_result(match):
+    """
+    Publishes a recorded match result and the new standings of its league, and deletes the events of the
+    league older than EVENT_RETENTION, so the change feed does not grow with every match ever played.
+    """
+    prune_events(match.league)
+    publish(match.league, 'result', {
+        'match': match.pk,
+        'round': match.round_number,
+        'home_team': match.home_team_id,
+        'away_team': match.away_team_id,
+        'home_score': match.home_score,
+        'away_score': match.away_score,
+        'home_casualties': match.home_casualties,
+        'away_casualties': match.away_casualties,
+    })
+    publish(match.league, 'standings', standings_data(match.league))
+
+
+def notify(league_id):
+    """
+    Wakes up the live feed of the league in this process, if it has one. Safe to call from any thread.
+    """
+    with _feeds_lock:
+        feed = _feeds.get(league_id)
+    if feed is not None:
+        feed.loop.call_soon_threadsafe(feed.wakeup.set)
+
+
+class LeagueFeed:
+    """
+    The live feed of one league in this process.
+
+    A single task reads new events from the LeagueEvent table, when woken up by notify() or every
+    POLL_INTERVAL seconds, and fans them out to the queues of every subscribed client. However many
+    clients are connected, the process runs one query per change instead of one per client.
+    """
+
+    def __init__(self, league_id, last_id):
+        """
+        Initialize the feed of the league, starting after the event with id 'last_id'.
+        """
+        self.league_id = league_id
+        self.last_id = last_id
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        self.subscribers = set()
+        self.task = None
+
+    def subscribe(self):
+        """
+        Returns a new queue receiving every event after the current one, and starts the feed if needed.
+        """
+        queue = asyncio.Queue(MAX_QUEUED_EVENTS)
+        self.subscribers.add(queue)
+        if self.task is None or self.task.done():
+            self.task = self.loop.create_task(self.run())
+        return queue
+
+    def unsubscribe(self, queue):
+        """
+        Removes a client queue; the feed stops once it has no subscribers left.
+        """
+        self.subscribers.discard(queue)
+        if not self.subscribers:
+            self.wakeup.set()
+
+    async def run(self):
+        """
+        Reads new events and fans them out until no client is subscribed. A client too slow to keep up
+        is sent None and dropped, and reconnects with the id of the last event it received.
+        """
+        try:
+            while self.subscribers:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self.wakeup.clear()
+                if not self.subscribers:
+                    break
+                events = [event async for event in
+                          LeagueEvent.objects.filter(league_id=self.league_id, pk__gt=self.last_id).order_by('pk')]
+                for event in events:
+                    self.last_id = event.pk
+                    for queue in list(self.subscribers):
+                        try:
+                            queue.put_nowait(event)
+                        except asyncio.QueueFull:
+                            self.subscribers.discard(queue)
+                            queue.get_nowait()
+                            queue.put_nowait(None)
+        finally:
+            with _feeds_lock:
+                if _feeds.get(self.league_id) is self:
+                    del _feeds[self.league_id]
+
+
+async def get_feed(league_id):
+    """
+    Returns the live feed of the league in this process, creating it if needed.
+    """
+    with _feeds_lock:
+        feed = _feeds.get(league_id)
+    if feed is not None and feed.loop is asyncio.get_running_loop():
+        return feed
+    last_event = await LeagueEvent.objects.filter(league_id=league_id).order_by('-pk').values_list('pk', flat=True).afirst()
+    with _feeds_lock:
+        feed = _feeds.get(league_id)
+        if feed is None or feed.loop is not asyncio.get_running_loop():
+            feed = _feeds[league_id] = LeagueFeed(league_id, last_event or 0)
+    return feed
+
+
+def format_event(event):
+    """
+    Returns an event in the Server-Sent Events wire format.
+    """
+    return f'id: {event.pk}\nevent: {event.kind}\ndata: {json.dumps(event.data, separators=(",", ":"))}\n\n'
+
+
+async def event_stream(league_id, last_event_id=None, heartbeat=HEARTBEAT_INTERVAL):
+    """
+    Yields the events of a league in the Server-Sent Events format, forever.
+
+    A client reconnecting with the id of the last event it received first gets the events it missed,
+    read from the LeagueEvent table. A comment line is sent every 'heartbeat' seconds without events
+    so proxies keep the connection open.
+    """
+    feed = await get_feed(league_id)
+    queue = feed.subscribe()
+    boundary = feed.last_id
+    try:
+        yield f'retry: {int(POLL_INTERVAL * 1000)}\n\n'
+        if last_event_id is not None:
+            async for event in (LeagueEvent.objects
+                                .filter(league_id=league_id, pk__gt=last_event_id, pk__lte=boundary)
+                                .order_by('pk')):
+                yield format_event(event)
+        while True:
+            try:
+                event = await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            if event is None:
+                return
+            yield format_event(event)
+    finally:
+        feed.unsubscribe(queue)
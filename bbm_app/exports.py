@@ -0,0 +1,188 @@
+import csv
+import json
+
+from django.db.models import Q
+
+from .advancement import advancements
+from .models import ArchivedPlayer, Player, Team
+from .rules import get_rules
+
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_FORMATS = {'csv': 'text/csv', 'jsonl': 'application/x-ndjson'}
+
+TEAM_COLUMNS = ('id', 'name', 'coach', 'race', 'treasury', 'team_re_rolls', 'fan_factor', 'assistant_coaches',
+                'cheerleaders', 'apothecary', 'ctv', 'wins', 'draws', 'losses')
+PLAYER_COLUMNS = ('id', 'team_id', 'team', 'number', 'name', 'position', 'status', 'level', 'spp', 'value',
+                  'movement', 'strength', 'agility', 'armor', 'passing', 'skills', 'traits', 'niggling_injuries',
+                  'is_journeyman')
+ADVANCEMENT_COLUMNS = ('id', 'team_id', 'team', 'number', 'name', 'position', 'level', 'pending', 'primary',
+                      'secondary')
+EXPORT_COLUMNS = {'teams': TEAM_COLUMNS, 'players': PLAYER_COLUMNS, 'advancements': ADVANCEMENT_COLUMNS}
+
+
+class _Echo:
+    """
+    A file-like object whose write() returns the value written, so csv.writer produces lines
+    that can be yielded one by one instead of collected in a buffer.
+    """
+
+    def write(self, value):
+        return value
+
+
+def league_teams(league):
+    """
+    Returns the teams of a league ordered by id, with their coach and race.
+    """
+    return Team.objects.filter(leagues=league).select_related('coach', 'race').order_by('pk')
+
+
+def team_rows(league, coach_id=None, private=False):
+    """
+    Yields one dict per team of the league. As in the API, the treasury of a team is only included for
+    its coach, the coach with id 'coach_id', or for every team when 'private' is True.
+    """
+    for team in league_teams(league).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        row = {
+            'id': team.pk,
+            'name': team.team_name,
+            'coach': team.coach.coach_name,
+            'race': str(team.race),
+            'team_re_rolls': team.team_re_roll,
+            'fan_factor': team.fan_factor,
+            'assistant_coaches': team.assistant_coaches,
+            'cheerleaders': team.cheerleaders,
+            'apothecary': team.apothecary,
+            'ctv': team.ctv,
+            'wins': team.wins,
+            'draws': team.draws,
+            'losses': team.losses,
+        }
+        if private or (coach_id is not None and team.coach_id == coach_id):
+            row['treasury'] = team.treasury
+        yield row
+
+
+def _player_row(player, player_id, team_id, status, team_names, positions):
+    """
+    Returns the export row of a live or archived player.
+    """
+    return {
+        'id': player_id,
+        'team_id': team_id,
+        'team': team_names.get(team_id),
+        'number': player.number,
+        'name': player.name,
+        'position': positions[player.position_id].name,
+        'status': status,
+        'level': player.get_level_display(),
+        'spp': player.spp,
+        'value': player.value,
+        'movement': player.movement,
+        'strength': player.strength,
+        'agility': player.agility,
+        'armor': player.armor,
+        'passing': player.passing,
+        'skills': [skill.name for skill in player.skills.all()],
+        'traits': [trait.name for trait in player.traits.all()],
+        'niggling_injuries': player.niggling_injuries,
+        'is_journeyman': player.is_journeyman,
+    }
+
+
+def player_rows(league, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields one dict per player of the league, dead players included, ordered by id, then one per archived
+    player, in the order they were archived, with the archive reason as their status.
+
+    The players are read with iterator() in chunks of 'chunk_size', with the skills and traits of each chunk
+    prefetched in one query each, so memory use depends on the chunk size and not on the size of the league.
+    The names of the teams and positions are looked up in memory rather than joined.
+    """
+    positions = get_rules().positions
+    team_names = dict(Team.objects.filter(leagues=league).values_list('pk', 'team_name'))
+    players = (Player.objects
+               .filter(Q(player_team_id__in=team_names) | Q(graveyard_id__in=team_names))
+               .prefetch_related('skills', 'traits')
+               .order_by('pk'))
+    for player in players.iterator(chunk_size=chunk_size):
+        team_id = player.player_team_id or player.graveyard_id
+        yield _player_row(player, player.pk, team_id, player.status, team_names, positions)
+    archived = (ArchivedPlayer.objects
+                .filter(team_id__in=team_names)
+                .prefetch_related('skills', 'traits')
+                .order_by('pk'))
+    for player in archived.iterator(chunk_size=chunk_size):
+        yield _player_row(player, player.original_id, player.team_id, player.reason, team_names, positions)
+
+
+def advancement_rows(league, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields one dict per player of the league with skills earned but not picked yet, ordered by id,
+    with the number of pending picks and the names of the primary and secondary skills it may pick.
+    """
+    rules = get_rules()
+    team_names = dict(Team.objects.filter(leagues=league).values_list('pk', 'team_name'))
+    players = Player.objects.filter(player_team_id__in=team_names).exclude(status='dead')
+    for player, pending, primary, secondary in advancements(players, chunk_size):
+        yield {
+            'id': player.pk,
+            'team_id': player.player_team_id,
+            'team': team_names.get(player.player_team_id),
+            'number': player.number,
+            'name': player.name,
+            'position': rules.positions[player.position_id].name,
+            'level': player.get_level_display(),
+            'pending': pending,
+            'primary': [rules.skills[skill_id].name for skill_id in primary],
+            'secondary': [rules.skills[skill_id].name for skill_id in secondary],
+        }
+
+
+def export_rows(league, kind, chunk_size=EXPORT_CHUNK_SIZE, coach_id=None, private=False):
+    """
+    Returns a generator of the rows of the 'teams', 'players' or 'advancements' export of a league.
+    'coach_id' and 'private' choose the treasuries of the team export, see team_rows().
+    Raises ValueError for an unknown kind.
+    """
+    if kind == 'teams':
+        return team_rows(league, coach_id, private)
+    if kind == 'players':
+        return player_rows(league, chunk_size)
+    if kind == 'advancements':
+        return advancement_rows(league, chunk_size)
+    raise ValueError(f"Unknown export '{kind}', expected one of: {', '.join(EXPORT_COLUMNS)}.")
+
+
+def stream_csv(rows, columns):
+    """
+    Yields the lines of a CSV file with a header line and one line per row. List values are joined with '|'
+    and the columns missing from a row are left empty.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(['|'.join(value) if isinstance(value, list) else value
+                               for value in (row.get(column, '') for column in columns)])
+
+
+def stream_jsonl(rows):
+    """
+    Yields the lines of a JSON Lines file, one JSON object per row.
+    """
+    for row in rows:
+        yield json.dumps(row, separators=(',', ':')) + '\n'
+
+
+def stream_export(league, kind, export_format, chunk_size=EXPORT_CHUNK_SIZE, coach_id=None, private=False):
+    """
+    Returns a generator of the lines of the 'teams', 'players' or 'advancements' export of a league
+    in 'csv' or 'jsonl' format. 'coach_id' and 'private' choose the treasuries of the team export.
+    Raises ValueError for an unknown kind or format.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format '{export_format}', expected one of: {', '.join(EXPORT_FORMATS)}.")
+    rows = export_rows(league, kind, chunk_size, coach_id, private)
+    if export_format == 'csv':
+        return stream_csv(rows, EXPORT_COLUMNS[kind])
+    return stream_jsonl(rows)
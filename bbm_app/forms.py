@@ -1,7 +1,12 @@
 from django import forms
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
-from .models import Coach, Team, Race, Player, Position, RacePositionLimit
+from .auth import user_coach_id, users_with_coach
+from .imports import IMPORT_FORMATS
+from .models import Coach, Team, Player
+from .rules import get_rules
+from .services import validate_hires
+from .slots import RosterSlots
 
 User = get_user_model()
 
@@ -18,15 +23,15 @@ class LoginForm(forms.Form):
         """
         Validate the form data.
         Checks if the username exists, and if the password matches the user's password.
-        Also checks if a Coach instance is associated with the user.
+        Also checks if a Coach instance is associated with the user, loaded in the same query.
         """
         cleaned_data = super().clean()
         coach_name = cleaned_data.get('coach_name')
         password = cleaned_data.get('password')
 
-        # Validate the username
+        # Validate the username, loading the user together with its coach
         try:
-            user = User.objects.get(username=coach_name)
+            user = users_with_coach().get(username=coach_name)
         except User.DoesNotExist:
             raise ValidationError('User does not exist')
 
@@ -35,13 +40,11 @@ class LoginForm(forms.Form):
             raise ValidationError('Invalid password')
 
         # Check if the user has a related coach instance
-        try:
-            coach = Coach.objects.get(user=user)
-        except Coach.DoesNotExist:
+        if user_coach_id(user) is None:
             raise ValidationError('Coach does not exist')
 
         self.user = user
-        self.coach = coach
+        self.coach = user.coach
 
 
 class CreateCoachForm(forms.ModelForm):
@@ -113,7 +116,6 @@ class CreateTeamForm(forms.ModelForm):
     - race: dropdown field, provides choice of all available races
     - team_name: input field, for the name of the team
     """
-    race = forms.ModelChoiceField(queryset=Race.objects.all())
 
     class Meta:
         """
@@ -122,6 +124,21 @@ class CreateTeamForm(forms.ModelForm):
         model = Team
         fields = ['team_name', 'race']
 
+    def __init__(self, *args, **kwargs):
+        """
+        Initialize the form instance.
+
+        The race choices are taken from the cached rules data instead of the database.
+        """
+        super().__init__(*args, **kwargs)
+        races = get_rules().races
+        self.fields['race'] = forms.TypedChoiceField(
+            choices=[('', '---------')] + [(race.pk, str(race)) for race in races.values()],
+            coerce=lambda pk: races[int(pk)],
+            empty_value=None,
+            label='Race',
+        )
+
 
 class AddPlayerForm(forms.ModelForm):
     """
@@ -141,50 +158,208 @@ class AddPlayerForm(forms.ModelForm):
         """
         Initialize the form instance.
 
-        Adjusts the queryset of 'position' to only include positions available for the race of 'team'.
+        Adjusts the choices of 'position' to only include positions available for the race of 'team',
+        taken from the cached rules data.
         Adjusts the choices of 'number' to exclude numbers already taken by players in 'team'.
+        Both come from the roster slots of the team (see slots.py), which are cached until the roster changes.
         """
         self.team = kwargs.pop('team', None)
         super().__init__(*args, **kwargs)
         if self.team:
-            self.fields['position'].queryset = Position.objects.filter(race=self.team.race)
-            taken_numbers = Player.objects.filter(player_team=self.team).values_list('number', flat=True)
-            number_choices = [(i, i) for i in range(1, 17) if i not in taken_numbers]
+            self.slots = RosterSlots.for_team(self.team)
+            positions = self.slots.rules.positions
+            self.fields['position'] = forms.TypedChoiceField(
+                choices=[('', '---------')] + [(position.pk, position.name) for position in self.slots.positions],
+                coerce=lambda pk: positions[int(pk)],
+                empty_value=None,
+                label='Position',
+            )
             self.fields['number'] = forms.ChoiceField(
-                choices=number_choices,
+                choices=[(i, i) for i in self.slots.free_numbers],
                 label='Number',
             )
 
+    def _get_validation_exclusions(self):
+        """
+        Excludes 'position' from model validation: its choices already come from the rules data,
+        so checking that the position row exists would only cost another query.
+        """
+        exclude = super()._get_validation_exclusions()
+        if self.team:
+            exclude.add('position')
+        return exclude
+
     def clean(self):
         """
         Validates the form data. Checks if the team has enough funds to add a player at the chosen
-        position and whether the maximum count for that position has been reached.
+        position and whether the maximum count for that position has been reached, against the roster slots.
         """
         cleaned_data = super().clean()
         position = cleaned_data.get("position")
-        if position and position.cost > self.team.treasury:
-            self.add_error('position', 'Insufficient funds.')
-        race_position_limit = RacePositionLimit.objects.filter(race=self.team.race, position=position).first()
-        if race_position_limit:
-            position_count = self.team.players.filter(position=position).count()
-            if position_count >= race_position_limit.max_count:
-                self.add_error('position', 'Maximum number of this position has been reached for the team.')
+        if position:
+            for message in self.slots.errors(position):
+                self.add_error('position', message)
+
+
+class HireEntryForm(forms.Form):
+    """
+    One row of the batch hire form: the name, number and position of a player to hire.
+    The position and number choices are given by BatchHireFormSet.
+    """
+    name = forms.CharField(max_length=64)
+
+    def __init__(self, *args, **kwargs):
+        """
+        Initialize the form instance with the position and number choices of the team.
+        """
+        positions = kwargs.pop('positions')
+        numbers = kwargs.pop('numbers')
+        super().__init__(*args, **kwargs)
+        positions_by_pk = {position.pk: position for position in positions}
+        self.fields['number'] = forms.TypedChoiceField(
+            choices=[('', '---------')] + [(i, i) for i in numbers],
+            coerce=int,
+            empty_value=None,
+            label='Number',
+        )
+        self.fields['position'] = forms.TypedChoiceField(
+            choices=[('', '---------')] + [(position.pk, position.name) for position in positions],
+            coerce=lambda pk: positions_by_pk[int(pk)],
+            empty_value=None,
+            label='Position',
+        )
+
+
+class BaseBatchHireFormSet(forms.BaseFormSet):
+    """
+    A formset for hiring a whole list of players for a team at once.
+
+    Rows left empty are ignored. The filled rows are validated together, in memory, against the numbers
+    already taken, the position limits of the race and the treasury of the team.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        Initialize the formset. The rules data and the numbers and positions of the current roster
+        come from the roster slots of the team.
+        """
+        self.team = kwargs.pop('team')
+        slots = RosterSlots.for_team(self.team)
+        self.rules = slots.rules
+        self.roster = slots.roster
+        self.free_numbers = slots.free_numbers
+        super().__init__(*args, **kwargs)
+
+    def get_form_kwargs(self, index):
+        """
+        Passes the position and number choices of the team to every row.
+        """
+        kwargs = super().get_form_kwargs(index)
+        kwargs['positions'] = self.rules.positions_for_race(self.team.race_id)
+        kwargs['numbers'] = self.free_numbers
+        return kwargs
+
+    @property
+    def filled_forms(self):
+        """
+        Returns the rows that were filled in.
+        """
+        return [form for form in self.forms if form.has_changed() and form.cleaned_data]
+
+    @property
+    def entries(self):
+        """
+        Returns the cleaned data of the filled rows.
+        """
+        return [form.cleaned_data for form in self.filled_forms]
+
+    def clean(self):
+        """
+        Validates the filled rows together. Errors about a single player are added to its row.
+        """
+        if any(self.errors):
+            return
+        entries = self.entries
+        if not entries:
+            raise ValidationError('Fill in at least one player.')
+        filled_forms = self.filled_forms
+        for index, message in validate_hires(self.team, entries, self.roster, self.rules):
+            filled_forms[index].add_error(None, message)
+        if sum(entry['position'].cost for entry in entries) > self.team.treasury:
+            raise ValidationError('Insufficient funds.')
+
+
+BatchHireFormSet = forms.formset_factory(HireEntryForm, formset=BaseBatchHireFormSet, extra=16, max_num=16)
+
+
+class MatchResultForm(forms.Form):
+    """
+    Form for recording the result of a match: score, casualties inflicted and winnings of both teams,
+    and the Star Player Points earned by each player.
+
+    One SPP field is added per active player of both teams, named 'spp_<player id>'.
+    """
+    home_score = forms.IntegerField(min_value=0)
+    away_score = forms.IntegerField(min_value=0)
+    home_casualties = forms.IntegerField(min_value=0, initial=0)
+    away_casualties = forms.IntegerField(min_value=0, initial=0)
+    home_winnings = forms.IntegerField(min_value=0, initial=0)
+    away_winnings = forms.IntegerField(min_value=0, initial=0)
+
+    def __init__(self, *args, **kwargs):
+        """
+        Initialize the form instance. Adds an SPP field for every active player of both teams of 'match'.
+        """
+        self.match = kwargs.pop('match')
+        super().__init__(*args, **kwargs)
+        self.players = list(Player.objects
+                            .filter(player_team_id__in=[self.match.home_team_id, self.match.away_team_id],
+                                    status='active')
+                            .order_by('player_team_id', 'number'))
+        for player in self.players:
+            self.fields[f'spp_{player.pk}'] = forms.IntegerField(
+                min_value=0, initial=0, required=False, label=f'#{player.number} {player.name} SPP')
+
+    @property
+    def spp_awards(self):
+        """
+        Returns a dict mapping player ids to the SPP earned, for players who earned any.
+        """
+        return {player.pk: self.cleaned_data.get(f'spp_{player.pk}') or 0 for player in self.players
+                if self.cleaned_data.get(f'spp_{player.pk}')}
 
 
 class SelectTeamForm(forms.Form):
     """
     A form for selecting a Team from the teams associated with the current user.
     """
-    # A dropdown field for Team, queryset will be assigned in the __init__ method.
-    team = forms.ModelChoiceField(queryset=None)
 
     def __init__(self, *args, **kwargs):
         """
-        Initialize the form. Updates the 'team' field queryset based on the user passed in kwargs.
+        Initialize the form. The choices are the teams of the coach passed as 'user' in kwargs,
+        or the already loaded 'teams', which lets async views load them with the async ORM.
+        The selected team is looked up among those teams, so validating the form needs no query.
         """
-        # Pop the 'user' from kwargs.
+        # Pop the 'user' and 'teams' from kwargs.
         user = kwargs.pop('user', None)
+        teams = kwargs.pop('teams', None)
         # Call the parent's __init__ method.
         super().__init__(*args, **kwargs)
-        # Set the 'team' field's queryset to be all teams associated with the user.
-        self.fields['team'].queryset = Team.objects.filter(coach=user)
+        if teams is None:
+            teams = Team.objects.filter(coach=user)
+        teams = {team.pk: team for team in teams}
+        # A dropdown field for Team, with all teams associated with the user.
+        self.fields['team'] = forms.TypedChoiceField(
+            choices=[('', '---------')] + [(team.pk, str(team)) for team in teams.values()],
+            coerce=lambda pk: teams[int(pk)],
+            empty_value=None,
+            label='Team',
+        )
+
+
+class ImportTeamsForm(forms.Form):
+    """
+    A form for uploading a file of pre-built team rosters, in CSV, JSON or JSON Lines format.
+    """
+    file = forms.FileField()
+    import_format = forms.ChoiceField(choices=[(name, name.upper()) for name in IMPORT_FORMATS], label='Format')
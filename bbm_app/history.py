@@ -0,0 +1,187 @@
+from datetime import timedelta
+from weakref import WeakKeyDictionary
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Team, TeamHistory
+
+VALUE_FIELDS = ('ctv', 'treasury', 'fan_factor')
+HISTORY_UPDATE_FIELDS = ('data', 'point_count', 'last_at', 'last_ctv', 'last_treasury', 'last_fan_factor')
+GOLD_UNIT = 1000
+
+
+def _write_varint(buffer, value):
+    """
+    Appends the signed integer 'value' to 'buffer' as a zigzag encoded variable length integer:
+    small changes, positive or negative, take a single byte.
+    """
+    value = -2 * value - 1 if value < 0 else 2 * value
+    while value >= 0x80:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varints(data):
+    """
+    Yields the signed integers encoded in 'data' by _write_varint.
+    """
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        yield (value >> 1) ^ -(value & 1)
+        value = shift = 0
+
+
+def _scale_gold(value):
+    """
+    Returns the number stored for a change of gold: changes in whole thousands, which is nearly all of them,
+    are stored in thousands with the lowest bit clear, anything else as is with the lowest bit set.
+    """
+    if value % GOLD_UNIT == 0:
+        return value // GOLD_UNIT * 2
+    return value * 2 + 1
+
+
+def _unscale_gold(number):
+    """
+    Returns the change of gold stored as 'number' by _scale_gold.
+    """
+    if number % 2:
+        return (number - 1) // 2
+    return number // 2 * GOLD_UNIT
+
+
+def encode_point(seconds, ctv_change, treasury_change, fan_factor_change):
+    """
+    Returns the bytes of one point: the seconds since the previous point and the change of every value.
+    A typical point takes five or six bytes.
+    """
+    buffer = bytearray()
+    for value in (seconds, _scale_gold(ctv_change), _scale_gold(treasury_change), fan_factor_change):
+        _write_varint(buffer, value)
+    return bytes(buffer)
+
+
+def decode_points(history, start=None, end=None):
+    """
+    Yields the (time, ctv, treasury, fan factor) points of a TeamHistory row in time order,
+    limited to the points between 'start' and 'end' when given.
+    """
+    at = history.started_at
+    values = [history.start_ctv, history.start_treasury, history.start_fan_factor]
+    numbers = _read_varints(bytes(history.data))
+    while True:
+        if end is not None and at > end:
+            return
+        if start is None or at >= start:
+            yield (at, *values)
+        try:
+            seconds = next(numbers)
+        except StopIteration:
+            return
+        at += timedelta(seconds=seconds)
+        values[0] += _unscale_gold(next(numbers))
+        values[1] += _unscale_gold(next(numbers))
+        values[2] += next(numbers)
+
+
+@transaction.atomic
+def record_team_values(team_ids, now=None):
+    """
+    Appends a point with the current value, treasury and fan factor to the history of every team in
+    'team_ids' whose values changed since its last point, starting a new history row for a new season.
+    Uses one query to read the teams, one to lock their history rows and at most one insert and one update.
+    """
+    now = now or timezone.now()
+    season = now.year
+    histories = {history.team_id: history for history in
+                 TeamHistory.objects.select_for_update().filter(team_id__in=team_ids, season=season)}
+    created, changed = [], []
+    for team_id, ctv, treasury, fan_factor in Team.objects.filter(pk__in=team_ids).values_list('pk', *VALUE_FIELDS):
+        history = histories.get(team_id)
+        if history is None:
+            created.append(TeamHistory(
+                team_id=team_id, season=season,
+                started_at=now, start_ctv=ctv, start_treasury=treasury, start_fan_factor=fan_factor,
+                last_at=now, last_ctv=ctv, last_treasury=treasury, last_fan_factor=fan_factor,
+            ))
+            continue
+        if (history.last_ctv, history.last_treasury, history.last_fan_factor) == (ctv, treasury, fan_factor):
+            continue
+        # Whole seconds are stored, so the time of the point is the previous time plus those seconds;
+        # that keeps 'last_at' equal to what decoding the series gives.
+        seconds = max(int((now - history.last_at).total_seconds()), 0)
+        history.data = bytes(history.data) + encode_point(
+            seconds, ctv - history.last_ctv, treasury - history.last_treasury, fan_factor - history.last_fan_factor)
+        history.point_count += 1
+        history.last_at += timedelta(seconds=seconds)
+        history.last_ctv, history.last_treasury, history.last_fan_factor = ctv, treasury, fan_factor
+        changed.append(history)
+    TeamHistory.objects.bulk_create(created, ignore_conflicts=True)
+    TeamHistory.objects.bulk_update(changed, HISTORY_UPDATE_FIELDS)
+
+
+# The teams marked by track() on each database connection and not recorded yet.
+_pending_teams = WeakKeyDictionary()
+
+
+def _record_pending():
+    """
+    Records the values of the teams marked on the connection since the last commit. It is registered by
+    every track() call, and the first call after a commit finds the teams and clears them; the calls
+    after it find nothing to do.
+    """
+    team_ids = _pending_teams.pop(transaction.get_connection(), None)
+    if team_ids:
+        record_team_values(team_ids)
+
+
+def track(team_ids):
+    """
+    Marks the teams as changed. Their new values are recorded once the current transaction commits,
+    so the several updates of one purchase or one match result become a single point. A failure to record
+    the history is logged and never fails the change itself.
+
+    The callback is registered by every call, as Django discards the callbacks of an atomic block that
+    rolls back. Teams marked in such a block are recorded by the next commit with their current values,
+    which the rollback left unchanged, so they get no new point; only a team with no history yet starts one.
+    """
+    connection = transaction.get_connection()
+    _pending_teams.setdefault(connection, set()).update(team_id for team_id in team_ids if team_id is not None)
+    transaction.on_commit(_record_pending, robust=True)
+
+
+def _histories(queryset, start, end):
+    """
+    Filters a TeamHistory queryset to the seasons overlapping 'start' and 'end'.
+    """
+    if start is not None:
+        queryset = queryset.filter(season__gte=start.year)
+    if end is not None:
+        queryset = queryset.filter(season__lte=end.year)
+    return queryset.order_by('team_id', 'season')
+
+
+def team_history(team, start=None, end=None):
+    """
+    Returns the (time, ctv, treasury, fan factor) points of a team between 'start' and 'end', with one query.
+    """
+    return [point for history in _histories(TeamHistory.objects.filter(team=team), start, end)
+            for point in decode_points(history, start, end)]
+
+
+def league_history(league, start=None, end=None):
+    """
+    Returns a dict mapping the teams of a league to their (time, ctv, treasury, fan factor) points
+    between 'start' and 'end', with one query for the teams and one for their history rows.
+    """
+    teams = {team.pk: team for team in league.teams.order_by('team_name')}
+    points = {team: [] for team in teams.values()}
+    for history in _histories(TeamHistory.objects.filter(team_id__in=teams), start, end):
+        points[teams[history.team_id]].extend(decode_points(history, start, end))
+    return points
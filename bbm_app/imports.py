@@ -0,0 +1,278 @@
+import csv
+import json
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from .history import track
+from .models import Coach, Player, Standing, Team
+from .rules import get_rules
+from .services import add_position_links, new_player, validate_hires
+
+IMPORT_FORMATS = ('csv', 'json', 'jsonl')
+CSV_COLUMNS = ('team', 'coach', 'race', 'number', 'name', 'position')
+STARTING_TREASURY = Team._meta.get_field('treasury').default
+
+
+class TeamEntry:
+    """
+    One team read from an import file: its name, coach and race as written in the file,
+    its players as (row, name, number, position) tuples, and the row it starts on.
+    """
+
+    def __init__(self, row, team_name, coach_name, race_name):
+        """
+        Initialize the entry of the team starting on 'row'.
+        """
+        self.row = row
+        self.team_name = team_name
+        self.coach_name = coach_name
+        self.race_name = race_name
+        self.players = []
+        self.race = None
+        self.positions = []
+
+
+class ImportReport:
+    """
+    The outcome of an import: the number of teams and players created and the (row, message) errors
+    of the teams that were left out.
+    """
+
+    def __init__(self, teams=0, players=0, coaches=0, errors=None):
+        """
+        Initialize the report. 'errors' is a list of (row, message) pairs.
+        """
+        self.teams = teams
+        self.players = players
+        self.coaches = coaches
+        self.errors = errors or []
+
+    def __bool__(self):
+        """
+        A report is truthy when every team of the file was valid.
+        """
+        return not self.errors
+
+    def __repr__(self):
+        """
+        Returns a debugging representation of the report.
+        """
+        return f'ImportReport(teams={self.teams!r}, players={self.players!r}, errors={len(self.errors)!r})'
+
+
+def _text(value):
+    """
+    Returns a value read from an import file as a stripped string.
+    """
+    return str(value if value is not None else '').strip()
+
+
+def read_csv(lines):
+    """
+    Yields the teams of a CSV file with one line per player and the columns of CSV_COLUMNS.
+    The lines of one team follow each other and share its 'team', 'coach' and 'race' values.
+    The file is read line by line.
+    """
+    reader = csv.DictReader(lines)
+    missing = [column for column in CSV_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}.")
+    entry = None
+    for row in reader:
+        team_name = _text(row['team'])
+        if entry is None or entry.team_name != team_name:
+            if entry is not None:
+                yield entry
+            entry = TeamEntry(reader.line_num, team_name, _text(row['coach']), _text(row['race']))
+        entry.players.append((reader.line_num, _text(row['name']), _text(row['number']), _text(row['position'])))
+    if entry is not None:
+        yield entry
+
+
+def _team_entry(row, data):
+    """
+    Returns the entry of a team given as a JSON object with 'team', 'coach', 'race' and 'players',
+    a list of objects with 'number', 'name' and 'position'. Player errors are reported on the team row.
+    """
+    if not isinstance(data, dict):
+        raise ValueError(f'Row {row}: a team must be a JSON object.')
+    entry = TeamEntry(row, _text(data.get('team')), _text(data.get('coach')), _text(data.get('race')))
+    for player in data.get('players') or []:
+        player = player if isinstance(player, dict) else {}
+        entry.players.append((row, _text(player.get('name')), _text(player.get('number')),
+                              _text(player.get('position'))))
+    return entry
+
+
+def read_jsonl(lines):
+    """
+    Yields the teams of a JSON Lines file with one team object per line. The file is read line by line.
+    """
+    for row, line in enumerate(lines, start=1):
+        if line.strip():
+            try:
+                data = json.loads(line)
+            except ValueError:
+                raise ValueError(f'Row {row}: invalid JSON.')
+            yield _team_entry(row, data)
+
+
+def read_json(lines):
+    """
+    Yields the teams of a JSON file holding a list of team objects. Unlike the other formats
+    the whole file is parsed at once.
+    """
+    try:
+        data = json.loads(''.join(lines))
+    except ValueError:
+        raise ValueError('Invalid JSON.')
+    if not isinstance(data, list):
+        raise ValueError('A JSON import must be a list of teams.')
+    for row, team in enumerate(data, start=1):
+        yield _team_entry(row, team)
+
+
+READERS = {'csv': read_csv, 'json': read_json, 'jsonl': read_jsonl}
+
+
+def validate_team(entry, rules, races, taken_names):
+    """
+    Validates a team entry against the rules data and the team names already taken, with no query:
+    the race, the positions of its race, free numbers from 1 to 16, the position limits and the
+    starting treasury. Returns a list of (row, message) pairs, empty when the team is valid.
+    Sets the race and positions of the entry.
+    """
+    errors = []
+    if not entry.team_name:
+        errors.append((entry.row, 'The team has no name.'))
+    elif entry.team_name.lower() in taken_names:
+        errors.append((entry.row, f'There is already a team called {entry.team_name}.'))
+    if not entry.coach_name:
+        errors.append((entry.row, 'The team has no coach.'))
+    entry.race = races.get(entry.race_name.lower())
+    if entry.race is None:
+        errors.append((entry.row, f'Unknown race {entry.race_name!r}.'))
+        return errors
+
+    positions = {position.name.lower(): position for position in rules.positions_for_race(entry.race.pk)}
+    hires, rows = [], []
+    for row, name, number, position_name in entry.players:
+        position = positions.get(position_name.lower())
+        if not name:
+            errors.append((row, 'The player has no name.'))
+        if position is None:
+            errors.append((row, f'{position_name!r} is not a position of the {entry.race} race.'))
+        if not number.isdigit():
+            errors.append((row, f'Invalid number {number!r}.'))
+        if name and position is not None and number.isdigit():
+            hires.append({'name': name, 'number': int(number), 'position': position})
+            rows.append(row)
+    for index, message in validate_hires(Team(race_id=entry.race.pk), hires, [], rules):
+        errors.append((rows[index], message))
+    entry.positions = hires
+    if sum(hire['position'].cost for hire in hires) > STARTING_TREASURY:
+        errors.append((entry.row, 'Insufficient funds.'))
+    return errors
+
+
+def find_coaches(names):
+    """
+    Returns a dict mapping the coach names among 'names' to their coaches, and the set of the other names
+    that are the username of an existing user, which the import must not take over.
+    """
+    coaches = {coach.coach_name: coach for coach in Coach.objects.filter(coach_name__in=names)}
+    accounts = set(get_user_model().objects.filter(username__in=[name for name in names if name not in coaches])
+                   .values_list('username', flat=True))
+    return coaches, accounts
+
+
+def _coaches(names, coaches=None):
+    """
+    Returns a dict mapping coach names to coaches, creating the coaches that do not exist yet in bulk, each with
+    a new user with an unusable password. Returns the number of coaches created too. Coaches are never
+    created for existing users: the names of existing users are rejected by import_teams.
+    """
+    if coaches is None:
+        coaches, _ = find_coaches(names)
+    missing = [name for name in names if name not in coaches]
+    if not missing:
+        return coaches, 0
+    User = get_user_model()
+    users = {user.username: user for user in User.objects.bulk_create([
+        User(username=name, password=make_password(None)) for name in missing])}
+    for coach in Coach.objects.bulk_create([Coach(user=users[name], coach_name=name) for name in missing]):
+        coaches[coach.coach_name] = coach
+    return coaches, len(missing)
+
+
+@transaction.atomic
+def create_teams(entries, league=None, rules=None, coaches=None):
+    """
+    Creates validated team entries in bulk: their coaches, teams, players and the players' traits,
+    skills and skill categories, with a fixed number of queries whatever the number of teams.
+    The teams are entered into 'league' when given. 'coaches' maps the names of the existing coaches
+    to them, as returned by find_coaches. Returns the number of (coaches, teams, players) created.
+    """
+    if not entries:
+        return 0, 0, 0
+    rules = rules or get_rules()
+    coaches, coach_count = _coaches(sorted({entry.coach_name for entry in entries}), coaches)
+    teams = Team.objects.bulk_create([
+        Team(
+            coach=coaches[entry.coach_name],
+            team_name=entry.team_name,
+            race_id=entry.race.pk,
+            treasury=STARTING_TREASURY - sum(hire['position'].cost for hire in entry.positions),
+            ctv=sum(hire['position'].cost for hire in entry.positions),
+        )
+        for entry in entries
+    ])
+    players = Player.objects.bulk_create([new_player(team, hire['name'], hire['number'], hire['position'])
+                                          for team, entry in zip(teams, entries) for hire in entry.positions])
+    add_position_links(players, rules)
+    if league is not None:
+        Standing.objects.bulk_create([Standing(league=league, team=team) for team in teams])
+    track([team.pk for team in teams])
+    return coach_count, len(teams), len(players)
+
+
+def import_teams(lines, import_format, league=None, dry_run=False):
+    """
+    Imports the teams of a file, given as an iterable of text lines, in 'csv', 'json' or 'jsonl' format.
+
+    Every team is validated against the in-memory rules data and the team names already taken,
+    read with one query. A coach name must be the name of a coach or a new name: the username of an
+    existing user who is not a coach by that name is an error, so an import never takes over an account.
+    The valid teams are created in bulk and the invalid ones are left out; the report holds an error
+    per invalid row. With dry_run=True nothing is created.
+    Raises ValueError for a file that cannot be read at all.
+    """
+    if import_format not in READERS:
+        raise ValueError(f"Unknown format '{import_format}', expected one of: {', '.join(IMPORT_FORMATS)}.")
+    rules = get_rules()
+    races = {}
+    for race in rules.races.values():
+        races[str(race).lower()] = race
+        races[race.race_type.lower()] = race
+    entries = list(READERS[import_format](lines))
+    taken_names = {name.lower() for name in Team.objects.filter(team_name__in=[entry.team_name for entry in entries])
+                   .values_list('team_name', flat=True)}
+    coaches, accounts = find_coaches(sorted({entry.coach_name for entry in entries if entry.coach_name}))
+
+    valid, errors = [], []
+    for entry in entries:
+        entry_errors = validate_team(entry, rules, races, taken_names)
+        if entry.coach_name in accounts:
+            entry_errors.append((entry.row, f'{entry.coach_name} is an existing user who is not a coach by that name.'))
+        if entry.team_name:
+            taken_names.add(entry.team_name.lower())
+        if entry_errors:
+            errors.extend(entry_errors)
+        else:
+            valid.append(entry)
+    if dry_run:
+        return ImportReport(teams=len(valid), players=sum(len(entry.positions) for entry in valid), errors=errors)
+    coaches, teams, players = create_teams(valid, league, rules, coaches)
+    return ImportReport(teams=teams, players=players, coaches=coaches, errors=errors)
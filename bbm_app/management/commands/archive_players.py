@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from bbm_app.archive import ARCHIVE_CHUNK_SIZE, archive_dead_players
+from bbm_app.models import League, Team
+
+
+class Command(BaseCommand):
+    """
+    This class represents a custom management command for a Django application.
+    The command moves dead players out of the rosters into the player archive, keeping their stats,
+    skills and traits, so roster lookups only read live players. It is meant to be run between match days.
+    """
+
+    def add_arguments(self, parser):
+        """
+        This method defines the arguments that can be passed to the command from the command line.
+        '--league' limits the archive to the teams of one league; '--chunk-size' is the number of players
+        archived per transaction.
+        """
+        parser.add_argument('--league', type=str, default=None, help='Name of the league, all teams by default.')
+        parser.add_argument('--chunk-size', type=int, default=ARCHIVE_CHUNK_SIZE,
+                            help='Players archived per transaction.')
+
+    def handle(self, *args, **options):
+        """
+        This method is the main logic of the command.
+
+        It archives the dead players and writes how many were archived.
+        """
+        teams = None
+        if options['league'] is not None:
+            try:
+                league = League.objects.get(name=options['league'])
+            except League.DoesNotExist:
+                raise CommandError(f"League {options['league']} does not exist.")
+            teams = Team.objects.filter(leagues=league)
+
+        count = archive_dead_players(teams, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'{count} dead players archived.'))
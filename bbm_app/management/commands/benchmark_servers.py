@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from bbm_app.server_benchmark import run_asgi, run_wsgi
+
+
+class Command(BaseCommand):
+    """
+    This class represents a custom management command for a Django application.
+    The command compares the throughput of the WSGI and the ASGI entry points for one page
+    under many concurrent, slow clients.
+    """
+
+    def add_arguments(self, parser):
+        """
+        This method defines the arguments that can be passed to the command from the command line.
+        'path' is the page to request, for example the standings of a league; the options set the number
+        of concurrent clients, the requests per client, the WSGI worker threads, how long a client takes
+        to read a response and an optional session id for pages that require a login.
+        """
+        parser.add_argument('path', type=str)
+        parser.add_argument('--clients', type=int, default=200, help='Number of concurrent clients.')
+        parser.add_argument('--requests', type=int, default=5, help='Requests per client.')
+        parser.add_argument('--workers', type=int, default=8, help='WSGI worker threads.')
+        parser.add_argument('--client-delay', type=float, default=0.05,
+                            help='Seconds a client takes to read a response.')
+        parser.add_argument('--session', type=str, default='', help='Session id to send as a cookie.')
+
+    def handle(self, *args, **options):
+        """
+        This method is the main logic of the command.
+
+        It runs the same load against the WSGI handler on a thread pool and against the ASGI handler on one
+        event loop, and reports the requests per second of both.
+        """
+        cookie = f"sessionid={options['session']}" if options['session'] else ''
+        wsgi = run_wsgi(options['path'], options['clients'], options['requests'], workers=options['workers'],
+                        client_delay=options['client_delay'], cookie=cookie)
+        self.stdout.write(str(wsgi))
+        asgi = run_asgi(options['path'], options['clients'], options['requests'],
+                        client_delay=options['client_delay'], cookie=cookie)
+        self.stdout.write(str(asgi))
+        self.stdout.write(self.style.SUCCESS(
+            f'ASGI served {asgi.requests_per_second / max(wsgi.requests_per_second, 1e-9):.1f}x '
+            f'the requests per second of WSGI'))
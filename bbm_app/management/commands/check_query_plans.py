@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from bbm_app.models import Team
+from bbm_app.query_plans import HOT_PATHS, check_query_plans
+
+
+class Command(BaseCommand):
+    """
+    This class represents a custom management command for a Django application.
+    The command explains the queries of every hot lookup and fails when one of them scans a whole table.
+    """
+
+    def add_arguments(self, parser):
+        """
+        This method defines the arguments that can be passed to the command from the command line.
+        '--team' is the id of the team to run the lookups against, by default the team with the most players.
+        """
+        parser.add_argument('--team', type=int, default=None, help='Id of the team to run the lookups against.')
+
+    def handle(self, *args, **options):
+        """
+        This method is the main logic of the command.
+
+        It writes one line per hot lookup and raises an error listing the full scans, if any.
+        """
+        teams = Team.objects.all()
+        if options['team'] is not None:
+            teams = teams.filter(pk=options['team'])
+        team = teams.annotate(player_count=Count('players')).order_by('-player_count').first()
+        if team is None:
+            raise CommandError('No team to run the lookups against.')
+
+        try:
+            results = check_query_plans(team)
+        except ValueError as error:
+            raise CommandError(str(error))
+        for name in HOT_PATHS:
+            status = self.style.ERROR('; '.join(results[name])) if results[name] else self.style.SUCCESS('index')
+            self.stdout.write(f'{name}: {status}')
+        if any(results.values()):
+            raise CommandError('Some hot lookups scan a whole table.')
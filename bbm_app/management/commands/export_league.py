@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from bbm_app.exports import EXPORT_CHUNK_SIZE, EXPORT_COLUMNS, EXPORT_FORMATS, stream_export
+from bbm_app.models import League
+
+
+class Command(BaseCommand):
+    """
+    This class represents a custom management command for a Django application.
+    The command exports every team or every player of a league, dead players included, or the skill picks
+    its players have pending, as CSV or JSON Lines.
+    """
+
+    def add_arguments(self, parser):
+        """
+        This method defines the arguments that can be passed to the command from the command line.
+        'league' is the name of the league and 'kind' what to export; the options set the format,
+        the output file (standard output by default) and the number of players read per query.
+        """
+        parser.add_argument('league', type=str)
+        parser.add_argument('kind', choices=list(EXPORT_COLUMNS))
+        parser.add_argument('--format', dest='export_format', choices=list(EXPORT_FORMATS), default='csv',
+                            help='Output format.')
+        parser.add_argument('--output', type=str, default=None, help='Output file, standard output by default.')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='Players read per query.')
+
+    def handle(self, *args, **options):
+        """
+        This method is the main logic of the command.
+
+        It writes the export line by line as the rows are read, so memory use stays flat whatever the league size.
+        The command is run by the site operator, so the team export includes every treasury.
+        """
+        try:
+            league = League.objects.get(name=options['league'])
+        except League.DoesNotExist:
+            raise CommandError(f"League {options['league']} does not exist.")
+
+        lines = stream_export(league, options['kind'], options['export_format'], options['chunk_size'],
+                              private=True)
+        if options['output'] is None:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+        count = -1 if options['export_format'] == 'csv' else 0
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            for line in lines:
+                output.write(line)
+                count += 1
+        self.stderr.write(self.style.SUCCESS(f"{count} {options['kind']} written to {options['output']}"))
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from bbm_app.models import League
+from bbm_app.scheduling import generate_fixtures
+
+
+class Command(BaseCommand):
+    """
+    This class represents a custom management command for a Django application.
+    The command generates the round robin fixtures of a league and saves them as scheduled matches.
+    """
+
+    def add_arguments(self, parser):
+        """
+        This method defines the arguments that can be passed to the command from the command line.
+        'league' is the name of the league; the flags choose a double round robin, per division scheduling
+        and a seed for shuffling the teams.
+        """
+        parser.add_argument('league', type=str)
+        parser.add_argument('--double', action='store_true', help='Play every pairing home and away.')
+        parser.add_argument('--divisional', action='store_true', help='Schedule every division separately.')
+        parser.add_argument('--seed', type=int, default=None, help='Shuffle the teams with this seed.')
+
+    def handle(self, *args, **options):
+        """
+        This method is the main logic of the command.
+
+        It generates the fixtures of the league and reports how many matches were created and how long it took.
+        """
+        try:
+            league = League.objects.get(name=options['league'])
+        except League.DoesNotExist:
+            raise CommandError(f"League {options['league']} does not exist.")
+
+        start = time.perf_counter()
+        created = generate_fixtures(league, double=options['double'], by_division=options['divisional'],
+                                    seed=options['seed'])
+        elapsed = (time.perf_counter() - start) * 1000
+        self.stdout.write(self.style.SUCCESS(f'{created} matches scheduled in {elapsed:.1f} ms'))
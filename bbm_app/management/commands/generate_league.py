@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from bbm_app.synthetic import CHUNK_SIZE, generate_league
+
+
+class Command(BaseCommand):
+    """
+    This class represents a custom management command for a Django application.
+    The command fills the database with a synthetic league, its coaches, teams, players and matches,
+    for load and scale testing.
+    """
+
+    def add_arguments(self, parser):
+        """
+        This method defines the arguments that can be passed to the command from the command line.
+        'name' is the name of the new league; the options set the number of coaches, teams per coach and
+        rounds played, a seed for reproducible data and the number of players written per bulk insert.
+        """
+        parser.add_argument('name', type=str)
+        parser.add_argument('--coaches', type=int, default=100, help='Number of coaches.')
+        parser.add_argument('--teams-per-coach', type=int, default=5, help='Number of teams of every coach.')
+        parser.add_argument('--rounds', type=int, default=5, help='Number of rounds already played.')
+        parser.add_argument('--seed', type=int, default=None, help='Seed for reproducible data.')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Players written per bulk insert.')
+
+    def handle(self, *args, **options):
+        """
+        This method is the main logic of the command.
+
+        It generates the league in one transaction and reports how many rows were created.
+        """
+        start = time.perf_counter()
+        try:
+            report = generate_league(options['name'], options['coaches'], options['teams_per_coach'],
+                                     rounds=options['rounds'], seed=options['seed'],
+                                     chunk_size=options['chunk_size'])
+        except ValueError as error:
+            raise CommandError(str(error))
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(f'{report} created in {elapsed:.1f} s'))
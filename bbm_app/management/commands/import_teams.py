@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from bbm_app.imports import IMPORT_FORMATS, import_teams
+from bbm_app.models import League
+
+
+class Command(BaseCommand):
+    """
+    This class represents a custom management command for a Django application.
+    The command imports pre-built team rosters from a CSV, JSON or JSON Lines file and reports the invalid rows.
+    """
+
+    def add_arguments(self, parser):
+        """
+        This method defines the arguments that can be passed to the command from the command line.
+        'file' is the file to import; the options set its format (by default taken from its extension),
+        a league to enter the teams into, and a dry run that only validates the file.
+        """
+        parser.add_argument('file', type=str)
+        parser.add_argument('--format', dest='import_format', choices=IMPORT_FORMATS, default=None,
+                            help='File format, taken from the file extension by default.')
+        parser.add_argument('--league', type=str, default=None, help='League to enter the teams into.')
+        parser.add_argument('--dry-run', action='store_true', help='Only validate the file.')
+
+    def handle(self, *args, **options):
+        """
+        This method is the main logic of the command.
+
+        It validates every team of the file, creates the valid ones in bulk and writes one line per invalid row.
+        """
+        import_format = options['import_format'] or options['file'].rsplit('.', 1)[-1].lower()
+        if import_format not in IMPORT_FORMATS:
+            raise CommandError(f"Cannot tell the format of {options['file']}, use --format.")
+        league = None
+        if options['league']:
+            try:
+                league = League.objects.get(name=options['league'])
+            except League.DoesNotExist:
+                raise CommandError(f"League {options['league']} does not exist.")
+
+        try:
+            with open(options['file'], newline='', encoding='utf-8-sig') as lines:
+                report = import_teams(lines, import_format, league=league, dry_run=options['dry_run'])
+        except (OSError, ValueError) as error:
+            raise CommandError(str(error))
+
+        for row, message in report.errors:
+            self.stdout.write(self.style.ERROR(f'Row {row}: {message}'))
+        verb = 'valid' if options['dry_run'] else 'imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{report.teams} teams and {report.players} players {verb}, {report.coaches} coaches created, '
+            f'{len(report.errors)} errors'))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from bbm_app.rules_loader import DEFAULT_DATA_DIR, RulesLoader
+
+
+class Command(BaseCommand):
+    """
+    This class represents a custom management command for a Django application.
+    The command loads all rules data (skills, traits, races and team positions) from a data directory
+    into the database in a single transaction.
+    """
+
+    def add_arguments(self, parser):
+        """
+        This method defines the arguments that can be passed to the command from the command line.
+        'data_dir' should point to a directory with skills.json, traits.json, races.json and a 'teams' directory.
+        """
+        parser.add_argument('data_dir', type=str, nargs='?', default=DEFAULT_DATA_DIR)
+        parser.add_argument('--dry-run', action='store_true', help='Roll back instead of committing.')
+        parser.add_argument('--timings', action='store_true', help='Print how long each step took.')
+
+    def handle(self, *args, **options):
+        """
+        This method is the main logic of the command.
+
+        It reads every JSON file of the data directory, resolves names in memory and writes everything
+        with bulk inserts and updates.
+        """
+        loader = RulesLoader(stdout=self.stdout)
+        loader.load_all(options['data_dir'], dry_run=options['dry_run'])
+
+        for key, value in loader.counts.items():
+            self.stdout.write(f'{key}: {value}')
+        if options['timings']:
+            for step, seconds in loader.timings:
+                self.stdout.write(f'{step}: {seconds * 1000:.1f} ms')
+            self.stdout.write(f'total: {sum(seconds for _, seconds in loader.timings) * 1000:.1f} ms')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('Dry run, nothing was saved'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Rules loaded'))
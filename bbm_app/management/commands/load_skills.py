@@ -1,36 +1,27 @@
-import json
 from django.core.management.base import BaseCommand
-from bbm_app.models import Skill, SkillCategory
+from bbm_app.rules_loader import RulesLoader
 
 
 class Command(BaseCommand):
     """
     This class represents a custom management command for a Django application.
-    The command reads data from JSON files in a specified directory and populates the application's database with that data.
+    The command reads skill categories and skills from a JSON file and populates the application's database with them.
     """
 
     def add_arguments(self, parser):
         """
         This method defines the arguments that can be passed to the command from the command line.
-        In this case, one argument 'json_dir' is added, which should point to the directory containing the JSON files.
+        In this case, one argument 'json_file' is added, which should point to the JSON file with the skills.
         """
-        parser.add_argument('json_dir', type=str)
+        parser.add_argument('json_file', type=str)
 
     def handle(self, *args, **options):
         """
         This method is the main logic of the command.
 
-        It reads data from JSON files in the directory specified by the 'json_dir' argument,
-        then uses this data to get or create instances of Skills in the application's database.
+        It reads the skills from the file specified by the 'json_file' argument,
+        then creates the missing categories and skills and links them in bulk.
         """
-        with open(options['json_file'], 'r') as json_file:
-            data = json.load(json_file)
-            for category_skills in data:
-                category_name = category_skills['category']
-                print(f'Processing category: {category_name}')
-                category, created = SkillCategory.objects.get_or_create(name=category_name)
-                for skill_name in category_skills['skills']:
-                    print(f'Processing skill: {skill_name}')
-                    skill, created = Skill.objects.get_or_create(name=skill_name)
-                    category.skills.add(skill)
+        loader = RulesLoader(stdout=self.stdout)
+        loader.run(False, [('skills', loader.load_skills, loader.read_json(options['json_file']))])
         self.stdout.write(self.style.SUCCESS('Skills added'))
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from bbm_app.models import League
+from bbm_app.swiss import PairingError, pair_next_round
+
+
+class Command(BaseCommand):
+    """
+    This class represents a custom management command for a Django application.
+    The command pairs the next Swiss round of a tournament and saves it as scheduled matches.
+    """
+
+    def add_arguments(self, parser):
+        """
+        This method defines the arguments that can be passed to the command from the command line.
+        In this case, one argument 'league' is added, which is the name of the tournament.
+        """
+        parser.add_argument('league', type=str)
+
+    def handle(self, *args, **options):
+        """
+        This method is the main logic of the command.
+
+        It pairs the next round, avoiding rematches and same coach or club games, and reports the pairings.
+        """
+        try:
+            league = League.objects.get(name=options['league'])
+        except League.DoesNotExist:
+            raise CommandError(f"League {options['league']} does not exist.")
+
+        start = time.perf_counter()
+        try:
+            matches = pair_next_round(league)
+        except PairingError as error:
+            raise CommandError(str(error))
+        elapsed = (time.perf_counter() - start) * 1000
+        self.stdout.write(self.style.SUCCESS(f'{len(matches)} matches paired in {elapsed:.1f} ms'))
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from bbm_app.models import League
+from bbm_app.simulation import simulate_round
+
+
+class Command(BaseCommand):
+    """
+    This class represents a custom management command for a Django application.
+    The command simulates every match of a league round many times and prints the predicted odds.
+    """
+
+    def add_arguments(self, parser):
+        """
+        This method defines the arguments that can be passed to the command from the command line.
+        'league' is the name of the league and 'round' the round to predict; the options set the number
+        of simulated games per match, the number of worker processes and a seed for reproducible results.
+        """
+        parser.add_argument('league', type=str)
+        parser.add_argument('round', type=int)
+        parser.add_argument('--games', type=int, default=10000, help='Simulated games per match.')
+        parser.add_argument('--workers', type=int, default=1, help='Number of worker processes.')
+        parser.add_argument('--seed', type=int, default=None, help='Seed for the dice.')
+
+    def handle(self, *args, **options):
+        """
+        This method is the main logic of the command.
+
+        It simulates the round and writes one line per match with the win, draw and loss probabilities
+        and the expected casualties of both teams.
+        """
+        try:
+            league = League.objects.get(name=options['league'])
+        except League.DoesNotExist:
+            raise CommandError(f"League {options['league']} does not exist.")
+
+        start = time.perf_counter()
+        results = simulate_round(league, options['round'], games=options['games'], seed=options['seed'],
+                                 workers=options['workers'])
+        elapsed = (time.perf_counter() - start) * 1000
+        for match, result in results.items():
+            self.stdout.write(
+                f'{match.home_team} vs {match.away_team}: '
+                f'{result.home_win_probability:.1%} / {result.draw_probability:.1%} / '
+                f'{result.away_win_probability:.1%}, casualties '
+                f'{result.expected_home_casualties:.2f} - {result.expected_away_casualties:.2f}')
+        self.stdout.write(self.style.SUCCESS(f'{len(results)} matches simulated in {elapsed:.1f} ms'))
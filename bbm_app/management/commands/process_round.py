@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from bbm_app.models import League
+from bbm_app.progression import BULK_UPDATE_CHUNK, process_round
+
+
+class Command(BaseCommand):
+    """
+    This class represents a custom management command for a Django application.
+    The command runs the post-match pipeline for a league round: SPP, level-ups, injuries and player values.
+    """
+
+    def add_arguments(self, parser):
+        """
+        This method defines the arguments that can be passed to the command from the command line.
+        'league' is the name of the league and 'round' the round to process; the options set a seed for
+        the casualty rolls and the number of players written per UPDATE batch.
+        """
+        parser.add_argument('league', type=str)
+        parser.add_argument('round', type=int)
+        parser.add_argument('--seed', type=int, default=None, help='Seed for the casualty rolls.')
+        parser.add_argument('--chunk-size', type=int, default=BULK_UPDATE_CHUNK,
+                            help='Players written per UPDATE batch.')
+
+    def handle(self, *args, **options):
+        """
+        This method is the main logic of the command.
+
+        It processes every played match of the round that has not been processed yet and reports the outcome.
+        """
+        try:
+            league = League.objects.get(name=options['league'])
+        except League.DoesNotExist:
+            raise CommandError(f"League {options['league']} does not exist.")
+
+        start = time.perf_counter()
+        report = process_round(league, options['round'], seed=options['seed'], chunk_size=options['chunk_size'])
+        elapsed = (time.perf_counter() - start) * 1000
+        for player, result in report.casualties:
+            self.stdout.write(f'{player.name}: {result.replace("_", " ")}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{report.matches} matches processed, {report.players_updated} players updated, '
+            f'{report.level_ups} level-ups in {elapsed:.1f} ms'))
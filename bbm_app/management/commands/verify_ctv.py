@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from bbm_app.models import Team
+
+
+class Command(BaseCommand):
+    """
+    This class represents a custom management command for a Django application.
+    The command checks the incrementally maintained team value (CTV) of every team against a full recomputation.
+    """
+
+    def add_arguments(self, parser):
+        """
+        This method defines the arguments that can be passed to the command from the command line.
+        The '--fix' flag overwrites mismatching stored values with the recomputed ones.
+        """
+        parser.add_argument('--fix', action='store_true', help='Overwrite mismatching team values.')
+
+    def handle(self, *args, **options):
+        """
+        This method is the main logic of the command.
+
+        It recomputes the team value of every team, reports each mismatch and, with '--fix', corrects it.
+        """
+        mismatches = 0
+        for team in Team.objects.select_related('race').order_by('pk'):
+            stored = team.ctv
+            if not team.verify_ctv(fix=options['fix']):
+                mismatches += 1
+                self.stdout.write(f'{team}: stored {stored}, expected {team.CTV}')
+
+        if mismatches:
+            message = f'{mismatches} team value(s) did not match'
+            if options['fix']:
+                self.stdout.write(self.style.WARNING(f'{message} and were fixed'))
+            else:
+                self.stdout.write(self.style.ERROR(message))
+        else:
+            self.stdout.write(self.style.SUCCESS('All team values match'))
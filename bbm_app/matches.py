@@ -0,0 +1,163 @@
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Value, When
+from django.utils import timezone
+
+from .events import publish_result
+from .history import track
+from .models import Match, SPPAward, Standing, Team
+
+STANDING_FIELDS = ('played', 'wins', 'draws', 'losses', 'points', 'touchdowns_for', 'touchdowns_against',
+                   'casualties_for', 'casualties_against', 'strength_of_schedule')
+
+
+class MatchAlreadyPlayed(Exception):
+    """
+    Raised when a result is recorded for a match that already has one.
+    """
+
+
+def _increment(queryset, field, amounts, key='pk'):
+    """
+    Adds amounts[k] to 'field' of every row of 'queryset' whose 'key' is k, for every k in 'amounts',
+    with a single UPDATE.
+    """
+    amounts = {k: amount for k, amount in amounts.items() if amount}
+    if not amounts:
+        return 0
+    return queryset.filter(**{f'{key}__in': amounts}).update(**{field: F(field) + Case(
+        *[When(**{key: k}, then=Value(amount)) for k, amount in amounts.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )})
+
+
+def _opponent_counts(league_id, team_id):
+    """
+    Returns a dict mapping each opponent of the team in the league to the number of played matches against it.
+    """
+    played = Match.objects.filter(league_id=league_id, status='played')
+    counts = {}
+    for field, other in (('home_team_id', 'away_team_id'), ('away_team_id', 'home_team_id')):
+        for opponent_id, count in (played.filter(**{field: team_id})
+                                   .values_list(other).annotate(count=Count('pk')).order_by()):
+            counts[opponent_id] = counts.get(opponent_id, 0) + count
+    return counts
+
+
+@transaction.atomic
+def record_match_result(match, home_score, away_score, home_casualties=0, away_casualties=0,
+                        home_winnings=0, away_winnings=0, spp_awards=None):
+    """
+    Records the result of a scheduled match and updates everything that depends on it,
+    in one transaction and without recomputing anything from scratch:
+
+    - the match row, guarded so the same match cannot be recorded twice,
+    - the standings rows of both teams (played, results, points, touchdowns, casualties),
+    - the strength of schedule of both teams and of every opponent they have played,
+    - the wins, draws, losses and treasury of both teams, and their value history,
+    - the SPP awards of the players, given as a dict mapping players (or their ids) to points,
+    - the change feed of the league, with the result and the new standings (see events.py).
+
+    The awards and casualties are applied to the players later, for a whole round at once, by the
+    post-match pipeline (see progression.process_round).
+    """
+    recorded = (Match.objects
+                .filter(pk=match.pk, status='scheduled')
+                .update(status='played', home_score=home_score, away_score=away_score,
+                        home_casualties=home_casualties, away_casualties=away_casualties,
+                        home_winnings=home_winnings, away_winnings=away_winnings, played_at=timezone.now()))
+    if not recorded:
+        raise MatchAlreadyPlayed(f'The result of {match} has already been recorded.')
+    match.refresh_from_db()
+
+    league = match.league
+    home_id, away_id = match.home_team_id, match.away_team_id
+    standings = {standing.team_id: standing for standing in
+                 Standing.objects.select_for_update().filter(league=league, team_id__in=[home_id, away_id])}
+    for team_id in (home_id, away_id):
+        if team_id not in standings:
+            standings[team_id] = Standing.objects.create(league=league, team_id=team_id)
+
+    home_points = league.points_for(home_score, away_score)
+    away_points = league.points_for(away_score, home_score)
+    for team_id, scored, conceded, inflicted, suffered, points in (
+            (home_id, home_score, away_score, home_casualties, away_casualties, home_points),
+            (away_id, away_score, home_score, away_casualties, home_casualties, away_points)):
+        result = 'wins' if scored > conceded else 'losses' if scored < conceded else 'draws'
+        Standing.objects.filter(pk=standings[team_id].pk).update(**{
+            'played': F('played') + 1,
+            result: F(result) + 1,
+            'points': F('points') + points,
+            'touchdowns_for': F('touchdowns_for') + scored,
+            'touchdowns_against': F('touchdowns_against') + conceded,
+            'casualties_for': F('casualties_for') + inflicted,
+            'casualties_against': F('casualties_against') + suffered,
+        })
+        Team.objects.filter(pk=team_id).update(**{
+            result: F(result) + 1,
+            'treasury': F('treasury') + (home_winnings if team_id == home_id else away_winnings),
+            'revision': F('revision') + 1,
+        })
+
+    # Strength of schedule: both teams gain the points their new opponent had before this match,
+    # and every match played against a team that scored points now counts those points as well.
+    sos_changes = {
+        home_id: standings[away_id].points,
+        away_id: standings[home_id].points,
+    }
+    for team_id, points in ((home_id, home_points), (away_id, away_points)):
+        if points:
+            for opponent_id, count in _opponent_counts(league.pk, team_id).items():
+                sos_changes[opponent_id] = sos_changes.get(opponent_id, 0) + count * points
+    _increment(Standing.objects.filter(league=league), 'strength_of_schedule', sos_changes, key='team_id')
+    track([home_id, away_id])
+
+    if spp_awards:
+        awards = {getattr(player, 'pk', player): spp for player, spp in spp_awards.items() if spp}
+        SPPAward.objects.bulk_create([SPPAward(match=match, player_id=pk, spp=spp) for pk, spp in awards.items()])
+
+    publish_result(match)
+
+    return match
+
+
+def standings_order():
+    """
+    Returns the ordering of a standings table: points, then touchdown difference, casualty difference
+    and strength of schedule as tiebreakers.
+    """
+    return [
+        F('points').desc(),
+        (F('touchdowns_for') - F('touchdowns_against')).desc(),
+        (F('casualties_for') - F('casualties_against')).desc(),
+        F('strength_of_schedule').desc(),
+        'team__team_name',
+    ]
+
+
+def expected_standings(league):
+    """
+    Recomputes the standings of the league from its played matches and returns them as a dict mapping
+    team ids to dicts of Standing field values. Used to verify the incrementally maintained table.
+    """
+    rows = {team_id: dict.fromkeys(STANDING_FIELDS, 0)
+            for team_id in league.standings.values_list('team_id', flat=True)}
+    matches = list(league.matches.filter(status='played').values_list(
+        'home_team_id', 'away_team_id', 'home_score', 'away_score', 'home_casualties', 'away_casualties'))
+    for home_id, away_id, home_score, away_score, home_casualties, away_casualties in matches:
+        for team_id, scored, conceded, inflicted, suffered in (
+                (home_id, home_score, away_score, home_casualties, away_casualties),
+                (away_id, away_score, home_score, away_casualties, home_casualties)):
+            row = rows.setdefault(team_id, dict.fromkeys(STANDING_FIELDS, 0))
+            result = 'wins' if scored > conceded else 'losses' if scored < conceded else 'draws'
+            row['played'] += 1
+            row[result] += 1
+            row['points'] += league.points_for(scored, conceded)
+            row['touchdowns_for'] += scored
+            row['touchdowns_against'] += conceded
+            row['casualties_for'] += inflicted
+            row['casualties_against'] += suffered
+    for home_id, away_id, *_ in matches:
+        rows[home_id]['strength_of_schedule'] += rows[away_id]['points']
+        rows[away_id]['strength_of_schedule'] += rows[home_id]['points']
+    return rows
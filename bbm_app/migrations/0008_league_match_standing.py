@@ -0,0 +1,95 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bbm_app', '0007_alter_team_wins'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='League',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('points_for_win', models.IntegerField(default=3)),
+                ('points_for_draw', models.IntegerField(default=1)),
+                ('points_for_loss', models.IntegerField(default=0)),
+                ('commissioner', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='commissioned_leagues', to='bbm_app.coach')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Match',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('round_number', models.PositiveIntegerField(default=1)),
+                ('status', models.CharField(choices=[('scheduled', 'Scheduled'), ('played', 'Played')], default='scheduled', max_length=20)),
+                ('home_score', models.PositiveIntegerField(default=0)),
+                ('away_score', models.PositiveIntegerField(default=0)),
+                ('home_casualties', models.PositiveIntegerField(default=0)),
+                ('away_casualties', models.PositiveIntegerField(default=0)),
+                ('home_winnings', models.PositiveIntegerField(default=0)),
+                ('away_winnings', models.PositiveIntegerField(default=0)),
+                ('played_at', models.DateTimeField(blank=True, null=True)),
+                ('away_team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='away_matches', to='bbm_app.team')),
+                ('home_team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='home_matches', to='bbm_app.team')),
+                ('league', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matches', to='bbm_app.league')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SPPAward',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('spp', models.PositiveIntegerField()),
+                ('match', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spp_awards', to='bbm_app.match')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spp_awards', to='bbm_app.player')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Standing',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('played', models.PositiveIntegerField(default=0)),
+                ('wins', models.PositiveIntegerField(default=0)),
+                ('draws', models.PositiveIntegerField(default=0)),
+                ('losses', models.PositiveIntegerField(default=0)),
+                ('points', models.IntegerField(default=0)),
+                ('touchdowns_for', models.PositiveIntegerField(default=0)),
+                ('touchdowns_against', models.PositiveIntegerField(default=0)),
+                ('casualties_for', models.PositiveIntegerField(default=0)),
+                ('casualties_against', models.PositiveIntegerField(default=0)),
+                ('strength_of_schedule', models.IntegerField(default=0)),
+                ('league', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='standings', to='bbm_app.league')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='standings', to='bbm_app.team')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='league',
+            name='teams',
+            field=models.ManyToManyField(related_name='leagues', through='bbm_app.Standing', to='bbm_app.team'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['league', 'status', 'home_team'], name='bbm_app_mat_league__b0de8a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['league', 'status', 'away_team'], name='bbm_app_mat_league__2555ed_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='sppaward',
+            unique_together={('match', 'player')},
+        ),
+        migrations.AddIndex(
+            model_name='standing',
+            index=models.Index(fields=['league', '-points'], name='bbm_app_sta_league__8ba2c7_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='standing',
+            unique_together={('league', 'team')},
+        ),
+    ]
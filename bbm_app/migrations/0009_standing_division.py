@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bbm_app', '0008_league_match_standing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='standing',
+            name='division',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bbm_app', '0009_standing_division'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coach',
+            name='club',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='standing',
+            name='byes',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bbm_app', '0010_coach_club_standing_byes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='processed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bbm_app', '0011_match_processed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TeamHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('season', models.PositiveIntegerField()),
+                ('started_at', models.DateTimeField()),
+                ('start_ctv', models.IntegerField()),
+                ('start_treasury', models.IntegerField()),
+                ('start_fan_factor', models.IntegerField()),
+                ('last_at', models.DateTimeField()),
+                ('last_ctv', models.IntegerField()),
+                ('last_treasury', models.IntegerField()),
+                ('last_fan_factor', models.IntegerField()),
+                ('point_count', models.PositiveIntegerField(default=1)),
+                ('data', models.BinaryField(default=b'')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='history', to='bbm_app.team')),
+            ],
+            options={
+                'unique_together': {('team', 'season')},
+            },
+        ),
+    ]
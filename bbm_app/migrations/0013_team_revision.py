@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bbm_app', '0012_team_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='team',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
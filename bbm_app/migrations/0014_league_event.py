@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bbm_app', '0013_team_revision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeagueEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('result', 'Result'), ('standings', 'Standings')], max_length=20)),
+                ('data', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('league', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='bbm_app.league')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['league', 'id'], name='bbm_app_lea_league__9e797c_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bbm_app', '0014_league_event'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='player',
+            name='player_team',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='players', to='bbm_app.team'),
+        ),
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(fields=['player_team', 'status', 'value'], name='player_team_status_value_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(fields=['player_team', 'position'], name='player_team_position_idx'),
+        ),
+    ]
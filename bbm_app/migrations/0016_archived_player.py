@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:00
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bbm_app', '0015_player_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPlayer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField(unique=True)),
+                ('reason', models.CharField(choices=[('dead', 'Dead'), ('retired', 'Retired'), ('fired', 'Fired')], max_length=20)),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('name', models.CharField(max_length=64)),
+                ('number', models.IntegerField()),
+                ('level', models.PositiveIntegerField(choices=[(1, 'Rookie'), (2, 'Experienced'), (3, 'Veteran'), (4, 'Star'), (5, 'Super Star'), (6, 'Legend')], default=1)),
+                ('spp', models.PositiveIntegerField(default=0)),
+                ('value', models.PositiveIntegerField()),
+                ('movement', models.IntegerField(default=0)),
+                ('strength', models.IntegerField(default=0)),
+                ('agility', models.IntegerField(default=0)),
+                ('armor', models.IntegerField(default=0)),
+                ('passing', models.IntegerField(default=0, null=True)),
+                ('niggling_injuries', models.IntegerField(default=0)),
+                ('is_journeyman', models.BooleanField(default=False)),
+                ('position', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='bbm_app.position')),
+                ('skills', models.ManyToManyField(related_name='archived_players', to='bbm_app.skill')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_players', to='bbm_app.team')),
+                ('traits', models.ManyToManyField(related_name='archived_players', to='bbm_app.trait')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['team', 'reason', 'archived_at'], name='archived_team_reason_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bbm_app', '0016_archived_player'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedplayer',
+            name='spp_awards',
+            field=models.JSONField(default=list),
+        ),
+    ]
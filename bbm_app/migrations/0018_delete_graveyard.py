@@ -0,0 +1,16 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:02
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bbm_app', '0017_archived_player_spp_awards'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='Graveyard',
+        ),
+    ]
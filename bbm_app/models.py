@@ -1,14 +1,19 @@
+from bisect import bisect_right
+
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import F, Sum
+from django.utils import timezone
 
 
 class Coach(models.Model):
     """
     Coach model represents a coach in the Blood Bowl game.
-    Each coach is tied to a unique user and has a unique name.
+    Each coach is tied to a unique user and has a unique name, and may belong to a club.
     """
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     coach_name = models.CharField(max_length=100, unique=True)
+    club = models.CharField(max_length=100, blank=True)
 
     def __str__(self):
         """
@@ -156,6 +161,9 @@ class Team(models.Model):
     It includes information about the team such as coach, name, race,
     treasury, number of re-rolls, fan factor, assistant coaches, cheerleaders,
     apothecary, CTV (team value), wins, losses, and draws.
+
+    'revision' is bumped by every change to the team or its roster, so it identifies
+    a version of the team for caching and ETags.
     """
     coach = models.ForeignKey(Coach, on_delete=models.CASCADE, related_name='teams')
     team_name = models.CharField(max_length=100, unique=True, null=True)
@@ -170,6 +178,7 @@ class Team(models.Model):
     wins = models.IntegerField(default=0)
     losses = models.PositiveIntegerField(default=0)
     draws = models.PositiveIntegerField(default=0)
+    revision = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         """
@@ -180,19 +189,87 @@ class Team(models.Model):
     @property
     def CTV(self):
         """
-        Computes and returns the total value of the team, based on player values,
+        Recomputes and returns the total value of the team from scratch, based on active player values,
         re-rolls, apothecary, assistant coaches, and cheerleaders.
+
+        The stored 'ctv' field is kept up to date incrementally; this property is the reference
+        computation used to verify it (see verify_ctv).
         """
         if self.pk is None:
             return 0
+        player_value = self.players.filter(status='active').aggregate(total=Sum('value'))['total'] or 0
+        return player_value + self.staff_value
 
-        player_value = sum(player.value for player in self.players.all() if player.status == 'active')
-        reroll_value = self.team_re_roll * self.race.reroll_cost
+    @property
+    def staff_value(self):
+        """
+        Returns the part of the team value that does not come from players:
+        re-rolls, apothecary, assistant coaches and cheerleaders.
+        """
+        reroll_value = self.team_re_roll * self.race_rules.reroll_cost
         apothecary_value = 50000 if self.apothecary else 0
         assistant_coaches_value = self.assistant_coaches * 10000
         cheerleaders_value = self.cheerleaders * 10000
-        total = player_value + reroll_value + apothecary_value + assistant_coaches_value + cheerleaders_value
-        return total
+        return reroll_value + apothecary_value + assistant_coaches_value + cheerleaders_value
+
+    def apply_ctv_delta(self, delta):
+        """
+        Adds 'delta' to the stored team value with a single UPDATE and mirrors the change
+        on this instance, so no roster scan is needed.
+
+        Every change to the team or one of its players goes through here, so the same UPDATE
+        also bumps the revision of the team, even when 'delta' is zero.
+        """
+        if self.pk is None:
+            return
+        Team.objects.filter(pk=self.pk).update(ctv=F('ctv') + delta, revision=F('revision') + 1)
+        self.ctv += delta
+        self.revision += 1
+        if delta:
+            self.track_history()
+
+    @staticmethod
+    def bump_revisions(team_ids):
+        """
+        Bumps the revision of every team in 'team_ids' with a single UPDATE, for changes written in bulk.
+        """
+        if team_ids:
+            Team.objects.filter(pk__in=team_ids).update(revision=F('revision') + 1)
+
+    def verify_ctv(self, fix=False):
+        """
+        Compares the stored team value with a full recomputation.
+
+        Returns True when they match. With fix=True a mismatching stored value is overwritten
+        with the recomputed one.
+        """
+        expected = self.CTV
+        if self.ctv == expected:
+            return True
+        if fix:
+            Team.objects.filter(pk=self.pk).update(ctv=expected, revision=F('revision') + 1)
+            self.ctv = expected
+            self.revision += 1
+            self.track_history()
+        return False
+
+    def track_history(self):
+        """
+        Records the value, treasury and fan factor of the team in its history once the current transaction
+        commits (see history.py).
+        """
+        from .history import track
+        track([self.pk])
+
+    @property
+    def race_rules(self):
+        """
+        Returns the race of the team from the cached rules data, falling back to the database
+        for a race the cache does not know yet.
+        """
+        from .rules import get_rules
+        race = get_rules().races.get(self.race_id)
+        return race if race is not None else self.race
 
     @property
     def total_matches(self):
@@ -209,16 +286,63 @@ class Team(models.Model):
         The cost doubles if the team has played at least one match.
         """
         if self.total_matches > 0:
-            return self.race.reroll_cost * 2
-        return self.race.reroll_cost
+            return self.race_rules.reroll_cost * 2
+        return self.race_rules.reroll_cost
+
+    STAFF_FIELDS = ('team_re_roll', 'apothecary', 'assistant_coaches', 'cheerleaders', 'race_id')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remembers the staff the team was loaded with, so save() can apply only the difference.
+        """
+        instance = super().from_db(db, field_names, values)
+        if set(cls.STAFF_FIELDS) <= set(field_names):
+            instance._loaded_staff = tuple(getattr(instance, field) for field in cls.STAFF_FIELDS)
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        """
+        Overrides refresh_from_db so the staff the team was loaded with follows the refreshed values.
+        """
+        super().refresh_from_db(*args, **kwargs)
+        fields = kwargs.get('fields')
+        if fields is None or {'team_re_roll', 'apothecary', 'assistant_coaches', 'cheerleaders'} & set(fields):
+            self.__dict__.pop('_loaded_staff', None)
+            if fields is None:
+                self._loaded_staff = tuple(getattr(self, field) for field in self.STAFF_FIELDS)
+
+    def _loaded_staff_value(self):
+        """
+        Returns the staff value of the team as it was when loaded from the database.
+        """
+        if not hasattr(self, '_loaded_staff'):
+            self._loaded_staff = Team.objects.filter(pk=self.pk).values_list(*self.STAFF_FIELDS).get()
+        re_rolls, apothecary, assistant_coaches, cheerleaders, race_id = self._loaded_staff
+        reroll_cost = self.race_rules.reroll_cost if race_id == self.race_id else Race.objects.get(pk=race_id).reroll_cost
+        return re_rolls * reroll_cost + (50000 if apothecary else 0) + (assistant_coaches + cheerleaders) * 10000
 
     def save(self, *args, **kwargs):
         """
-        Overrides the save method to update the CTV (team value)
-        before saving the team.
+        Overrides the save method to keep the CTV (team value) up to date.
+
+        A new team starts with the value of its staff. For an existing team only the change in
+        staff value since it was loaded is applied, as a delta on the stored value, so player
+        value changes written in the meantime are never overwritten. The revision is bumped
+        the same way.
         """
-        self.ctv = self.CTV
-        super().save(*args, **kwargs)
+        if self._state.adding:
+            self.ctv = self.staff_value
+            super().save(*args, **kwargs)
+        else:
+            delta = self.staff_value - self._loaded_staff_value()
+            update_fields = kwargs.pop('update_fields', None)
+            if update_fields is None:
+                update_fields = [f.name for f in self._meta.concrete_fields if not f.primary_key]
+            super().save(*args, update_fields=[f for f in update_fields if f not in ('ctv', 'revision')], **kwargs)
+            self.apply_ctv_delta(delta)
+        self._loaded_staff = tuple(getattr(self, field) for field in self.STAFF_FIELDS)
+        self.track_history()
 
 
 class Player(models.Model):
@@ -264,28 +388,391 @@ class Player(models.Model):
     number = models.IntegerField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     niggling_injuries = models.IntegerField(default=0)
-    player_team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='players', null=True)
+    # Not indexed on its own: every index of Meta starts with the team, so they serve lookups by team.
+    player_team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='players', null=True,
+                                    db_index=False)
 
     class Meta:
         """
         Metaclass for Player. Defines unique_together constraint for 'player_team' and 'number'.
+
+        The indexes serve the hot lookups of a team's players: by status, with the value so the team value
+        sum is read from the index alone, and by position, for the position limit checks.
         """
         unique_together = ('player_team', 'number')
+        indexes = [
+            models.Index(fields=['player_team', 'status', 'value'], name='player_team_status_value_idx'),
+            models.Index(fields=['player_team', 'position'], name='player_team_position_idx'),
+        ]
 
-    # def calculate_value(self):
-    #     pass
-    #
-    # def check_level_up(self):
-    #     pass
+    LEVEL_THRESHOLDS = (0, 6, 16, 31, 51, 76)
+    LEVEL_VALUE = 20000
+
+    def calculate_value(self, rules=None):
+        """
+        Computes and returns the value of the player: the cost of its position, from the cached rules data,
+        plus LEVEL_VALUE for every level above Rookie. Journeymen keep their value.
+        Callers valuing many players pass the rules data they already hold.
+        """
+        if self.is_journeyman:
+            return self.value
+        if rules is None:
+            from .rules import get_rules
+            rules = get_rules()
+        position = rules.positions.get(self.position_id) or self.position
+        return position.cost + (self.level - 1) * self.LEVEL_VALUE
+
+    def check_level_up(self):
+        """
+        Advances the level of the player to the one its Star Player Points have reached.
+        Returns the number of levels gained.
+        """
+        level = bisect_right(self.LEVEL_THRESHOLDS, self.spp)
+        gained = max(level - self.level, 0)
+        self.level += gained
+        return gained
+
+    @property
+    def ctv_contribution(self):
+        """
+        Returns how much this player adds to the value of its team. Only active players count.
+        """
+        return self.value if self.status == 'active' else 0
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remembers the team and team value contribution the player was loaded with,
+        so save() and delete() can apply only the difference to the team value.
+        """
+        instance = super().from_db(db, field_names, values)
+        if {'player_team_id', 'status', 'value'} <= set(field_names):
+            instance._loaded_ctv = (instance.player_team_id, instance.ctv_contribution)
+        return instance
+
+    def _stored_ctv(self):
+        """
+        Returns the (team_id, contribution) pair of this player as currently stored in the database.
+        """
+        if self._state.adding:
+            return None, 0
+        if not hasattr(self, '_loaded_ctv'):
+            row = Player.objects.filter(pk=self.pk).values_list('player_team_id', 'status', 'value').first()
+            if row is None:
+                return None, 0
+            team_id, status, value = row
+            self._loaded_ctv = (team_id, value if status == 'active' else 0)
+        return self._loaded_ctv
+
+    def _team_for_delta(self, team_id):
+        """
+        Returns the team instance a team value delta for 'team_id' should be applied to,
+        reusing the cached 'player_team' instance when it is the same team.
+        """
+        if Player.player_team.is_cached(self) and self.player_team is not None and self.player_team.pk == team_id:
+            return self.player_team
+        return Team(pk=team_id, ctv=0)
+
+    def _apply_ctv_change(self, old, new):
+        """
+        Applies the change from the (team_id, contribution) pair 'old' to 'new' on the team value
+        of the affected team(s).
+        """
+        old_team_id, old_value = old
+        new_team_id, new_value = new
+        if old_team_id == new_team_id:
+            if old_team_id is not None:
+                self._team_for_delta(old_team_id).apply_ctv_delta(new_value - old_value)
+            return
+        if old_team_id is not None:
+            self._team_for_delta(old_team_id).apply_ctv_delta(-old_value)
+        if new_team_id is not None:
+            self._team_for_delta(new_team_id).apply_ctv_delta(new_value)
 
     def save(self, *args, **kwargs):
         """
         Overrides the save method for Player model.
+
+        Hiring, injuring, killing, re-valuing or transferring a player applies the resulting
+        change to the team value of the affected team(s) instead of recomputing it.
         """
+        old = self._stored_ctv()
         super().save(*args, **kwargs)
+        new = (self.player_team_id, self.ctv_contribution)
+        self._apply_ctv_change(old, new)
+        self._loaded_ctv = new
+
+    def delete(self, *args, **kwargs):
+        """
+        Overrides the delete method for Player model.
+
+        Firing a player removes its contribution from the team value.
+        """
+        old = self._stored_ctv()
+        result = super().delete(*args, **kwargs)
+        self._apply_ctv_change(old, (None, 0))
+        self._loaded_ctv = (None, 0)
+        return result
 
 
 
+class ArchivedPlayer(models.Model):
+    """
+    The ArchivedPlayer model is the historical record of a player that left its team for good:
+    dead, retired or fired. Archived players are moved out of the Player table (see archive.py),
+    so roster lookups only read live rows, and keep the stats, skills and traits they had when they left.
+    'original_id' is the id the player had in the Player table. The SPPAward rows of a player are deleted
+    with it, so 'spp_awards' keeps them as a list of [match id, SPP] pairs.
+    """
+    REASON_CHOICES = [
+        ('dead', 'Dead'),
+        ('retired', 'Retired'),
+        ('fired', 'Fired'),
+    ]
+
+    original_id = models.BigIntegerField(unique=True)
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='archived_players')
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    archived_at = models.DateTimeField(default=timezone.now)
+    name = models.CharField(max_length=64)
+    position = models.ForeignKey(Position, on_delete=models.CASCADE)
+    number = models.IntegerField()
+    level = models.PositiveIntegerField(choices=Player.LEVEL_CHOICES, default=1)
+    spp = models.PositiveIntegerField(default=0)
+    value = models.PositiveIntegerField()
+    movement = models.IntegerField(default=0)
+    strength = models.IntegerField(default=0)
+    agility = models.IntegerField(default=0)
+    armor = models.IntegerField(default=0)
+    passing = models.IntegerField(default=0, null=True)
+    skills = models.ManyToManyField(Skill, related_name='archived_players')
+    traits = models.ManyToManyField(Trait, related_name='archived_players')
+    niggling_injuries = models.IntegerField(default=0)
+    is_journeyman = models.BooleanField(default=False)
+    spp_awards = models.JSONField(default=list)
+
+    class Meta:
+        """
+        Metaclass for ArchivedPlayer. The index serves the graveyard and the other archives of a team.
+        """
+        indexes = [
+            models.Index(fields=['team', 'reason', 'archived_at'], name='archived_team_reason_idx'),
+        ]
+
+    def __str__(self):
+        """
+        Returns the name of the player as a string.
+        """
+        return self.name
+
+
+class TeamHistory(models.Model):
+    """
+    The TeamHistory model holds the time series of the value, treasury and fan factor of a team
+    for one season (calendar year).
+
+    Points are packed into 'data' as delta-encoded variable length integers (see history.py), so a whole
+    season is one small row. The first and latest values are kept in plain columns, so appending a point
+    never has to decode the series.
+    """
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='history')
+    season = models.PositiveIntegerField()
+    started_at = models.DateTimeField()
+    start_ctv = models.IntegerField()
+    start_treasury = models.IntegerField()
+    start_fan_factor = models.IntegerField()
+    last_at = models.DateTimeField()
+    last_ctv = models.IntegerField()
+    last_treasury = models.IntegerField()
+    last_fan_factor = models.IntegerField()
+    point_count = models.PositiveIntegerField(default=1)
+    data = models.BinaryField(default=b'')
+
+    class Meta:
+        unique_together = ('team', 'season')
+
+    def __str__(self):
+        """
+        Returns a string representing the team, the season and the number of points.
+        """
+        return f'{self.team} {self.season} ({self.point_count} points)'
+
+
+class League(models.Model):
+    """
+    The League model represents a league or tournament in which teams play matches.
+    Each league keeps a materialized standings table (see Standing) and defines how many
+    points a win, a draw and a loss are worth.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    commissioner = models.ForeignKey(Coach, on_delete=models.SET_NULL, null=True, blank=True,
+                                     related_name='commissioned_leagues')
+    points_for_win = models.IntegerField(default=3)
+    points_for_draw = models.IntegerField(default=1)
+    points_for_loss = models.IntegerField(default=0)
+    teams = models.ManyToManyField(Team, through='Standing', related_name='leagues')
+
+    def __str__(self):
+        """
+        Returns the name of the league as a string.
+        """
+        return self.name
+
+    def add_team(self, team, division=''):
+        """
+        Enters the team into the league, optionally into one of its divisions,
+        by creating its (empty) standings row.
+        """
+        return Standing.objects.get_or_create(league=self, team=team, defaults={'division': division})[0]
+
+    def points_for(self, scored, conceded):
+        """
+        Returns the league points for a match result with 'scored' and 'conceded' touchdowns.
+        """
+        if scored > conceded:
+            return self.points_for_win
+        if scored < conceded:
+            return self.points_for_loss
+        return self.points_for_draw
+
+
+class Match(models.Model):
+    """
+    The Match model represents a match between two teams of a league.
+    A match is scheduled first and gets its score, casualties and winnings when its result is recorded.
+    Once played, the post-match pipeline (see progression.py) applies its SPP and casualties to the
+    players and sets 'processed'.
+    """
+    STATUS_CHOICES = [
+        ('scheduled', 'Scheduled'),
+        ('played', 'Played'),
+    ]
+
+    league = models.ForeignKey(League, on_delete=models.CASCADE, related_name='matches')
+    round_number = models.PositiveIntegerField(default=1)
+    home_team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='home_matches')
+    away_team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='away_matches')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='scheduled')
+    home_score = models.PositiveIntegerField(default=0)
+    away_score = models.PositiveIntegerField(default=0)
+    home_casualties = models.PositiveIntegerField(default=0)
+    away_casualties = models.PositiveIntegerField(default=0)
+    home_winnings = models.PositiveIntegerField(default=0)
+    away_winnings = models.PositiveIntegerField(default=0)
+    played_at = models.DateTimeField(null=True, blank=True)
+    processed = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['league', 'status', 'home_team']),
+            models.Index(fields=['league', 'status', 'away_team']),
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representing the two teams and, once played, the score.
+        """
+        if self.status == 'played':
+            return f'{self.home_team} {self.home_score} - {self.away_score} {self.away_team}'
+        return f'{self.home_team} vs {self.away_team}'
+
+
+class SPPAward(models.Model):
+    """
+    The SPPAward model represents the Star Player Points a player earned in a match.
+    """
+    match = models.ForeignKey(Match, on_delete=models.CASCADE, related_name='spp_awards')
+    player = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='spp_awards')
+    spp = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('match', 'player')
+
+    def __str__(self):
+        """
+        Returns a string representing the player and the points earned.
+        """
+        return f'{self.player} +{self.spp} SPP'
+
+
+class Standing(models.Model):
+    """
+    The Standing model is one row of the materialized standings table of a league.
+
+    It is updated incrementally, in the same transaction as every recorded result, and holds
+    everything the tiebreakers need: points, touchdown and casualty totals and the strength of
+    schedule (the sum of the current points of every opponent played, counted once per match).
+    """
+    league = models.ForeignKey(League, on_delete=models.CASCADE, related_name='standings')
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='standings')
+    division = models.CharField(max_length=100, blank=True)
+    played = models.PositiveIntegerField(default=0)
+    wins = models.PositiveIntegerField(default=0)
+    draws = models.PositiveIntegerField(default=0)
+    losses = models.PositiveIntegerField(default=0)
+    points = models.IntegerField(default=0)
+    touchdowns_for = models.PositiveIntegerField(default=0)
+    touchdowns_against = models.PositiveIntegerField(default=0)
+    casualties_for = models.PositiveIntegerField(default=0)
+    casualties_against = models.PositiveIntegerField(default=0)
+    strength_of_schedule = models.IntegerField(default=0)
+    byes = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('league', 'team')
+        indexes = [
+            models.Index(fields=['league', '-points']),
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representing the team and its points.
+        """
+        return f'{self.team} ({self.points} pts)'
+
+    @property
+    def touchdown_difference(self):
+        """
+        Returns touchdowns scored minus touchdowns conceded.
+        """
+        return self.touchdowns_for - self.touchdowns_against
+
+    @property
+    def casualty_difference(self):
+        """
+        Returns casualties inflicted minus casualties suffered.
+        """
+        return self.casualties_for - self.casualties_against
+
+
+
+class LeagueEvent(models.Model):
+    """
+    The LeagueEvent model is one entry of the change feed of a league, such as a recorded result or
+    the new standings. Live feeds stream the events to clients in id order (see events.py).
+    """
+    KIND_CHOICES = [
+        ('result', 'Result'),
+        ('standings', 'Standings'),
+    ]
+
+    league = models.ForeignKey(League, on_delete=models.CASCADE, related_name='events')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['league', 'id']),
+        ]
+
+    def __str__(self):
+        """
+        Returns a string representing the league and the kind of the event.
+        """
+        return f'{self.league} {self.kind} #{self.pk}'
+
+
 # def fill_journeyman(self):
     #     active_players = self.players.filter(is_active=True)
     #
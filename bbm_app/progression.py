@@ -0,0 +1,196 @@
+import random
+
+from django.db import transaction
+
+from .advancement import get_engine, skill_masks
+from .history import track
+from .matches import _increment
+from .models import Match, Player, SPPAward, Team
+from .rules import get_rules
+
+BULK_UPDATE_CHUNK = 500
+PLAYER_FIELDS = ('spp', 'level', 'value', 'status', 'niggling_injuries', 'graveyard', 'movement', 'strength',
+                 'agility', 'armor', 'passing')
+
+
+def casualty_result(roll):
+    """
+    Returns the result of a d16 roll on the casualty table:
+    'badly_hurt', 'seriously_hurt', 'serious_injury', 'lasting_injury' or 'dead'.
+    """
+    if roll <= 6:
+        return 'badly_hurt'
+    if roll <= 9:
+        return 'seriously_hurt'
+    if roll <= 12:
+        return 'serious_injury'
+    if roll <= 14:
+        return 'lasting_injury'
+    return 'dead'
+
+
+def _apply_lasting_injury(player, roll):
+    """
+    Lowers one characteristic of the player according to a d6 roll: armour, movement, passing,
+    agility or strength. Passing and agility are target numbers, so they go up.
+    """
+    if roll <= 2:
+        player.armor = max(player.armor - 1, 1)
+    elif roll == 3:
+        player.movement = max(player.movement - 1, 1)
+    elif roll == 4 and player.passing:
+        player.passing += 1
+    elif roll == 5:
+        player.agility += 1
+    else:
+        player.strength = max(player.strength - 1, 1)
+
+
+class PostMatchReport:
+    """
+    The outcome of a run of the post-match pipeline.
+    """
+
+    def __init__(self):
+        """
+        Initialize an empty report. 'casualties' is a list of (player, casualty result) pairs and
+        'advancements' maps the id of every surviving player who levelled up to the (primary, secondary)
+        lists of the ids of the skills it may pick.
+        """
+        self.matches = 0
+        self.players_updated = 0
+        self.level_ups = 0
+        self.casualties = []
+        self.team_value_changes = {}
+        self.advancements = {}
+
+    def __repr__(self):
+        """
+        Returns a debugging representation of the report.
+        """
+        return (f'PostMatchReport(matches={self.matches!r}, players_updated={self.players_updated!r}, '
+                f'level_ups={self.level_ups!r}, casualties={len(self.casualties)!r})')
+
+
+@transaction.atomic
+def process_matches(matches, seed=None, chunk_size=BULK_UPDATE_CHUNK):
+    """
+    Applies the results of played, not yet processed matches to the players of both teams, in one pass:
+
+    - players who were injured before these matches have missed them and become active again; they
+      cannot be casualties of these matches,
+    - the SPP recorded for every player are added and levels advanced,
+    - the casualties each team inflicted are rolled on the casualty table for randomly chosen active
+      players of the opponent, with the seeded RNG, and their effects applied,
+    - the values of the players whose level or characteristics changed are recomputed with
+      Player.calculate_value; the values of the other players, such as custom ones, are kept,
+    - the skills every surviving player who levelled up may pick are worked out with the advancement engine.
+
+    Everything is computed in memory from one query for the players, one for the SPP awards and one for
+    the skills of the players who levelled up. Changed players are written with bulk_update in chunks of
+    'chunk_size' and the team values of all affected teams are adjusted with a single UPDATE. Matches are
+    claimed under a row lock and marked processed, so running the pipeline twice never applies a match
+    twice. Returns a PostMatchReport.
+    """
+    report = PostMatchReport()
+    match_ids = [getattr(match, 'pk', match) for match in matches]
+    matches = list(Match.objects
+                   .select_for_update()
+                   .filter(pk__in=match_ids, status='played', processed=False)
+                   .order_by('round_number', 'pk'))
+    if not matches:
+        return report
+    report.matches = len(matches)
+    rng = random.Random(seed)
+    rules = get_rules()
+
+    team_ids = {team_id for match in matches for team_id in (match.home_team_id, match.away_team_id)}
+    players = {player.pk: player for player in (Player.objects
+                                                .filter(player_team_id__in=team_ids)
+                                                .exclude(status='dead')
+                                                .order_by('pk'))}
+    contributions = {pk: player.ctv_contribution for pk, player in players.items()}
+    changed = set()
+    levelled = set()
+    # The players whose level or characteristics change in this run, the only ones valued again.
+    revalued = set()
+
+    # The players injured before these matches missed them, so none of them can be a casualty of them.
+    missed = {pk for pk, player in players.items() if player.status == 'injured'}
+    for pk in missed:
+        players[pk].status = 'active'
+        changed.add(pk)
+
+    for player_id, spp in SPPAward.objects.filter(match__in=matches).values_list('player_id', 'spp'):
+        player = players.get(player_id)
+        if player is None:
+            continue
+        player.spp += spp
+        gained = player.check_level_up()
+        if gained:
+            report.level_ups += gained
+            levelled.add(player.pk)
+        changed.add(player.pk)
+
+    by_team = {}
+    for player in players.values():
+        by_team.setdefault(player.player_team_id, []).append(player)
+    for match in matches:
+        for victims_team_id, count in ((match.away_team_id, match.home_casualties),
+                                       (match.home_team_id, match.away_casualties)):
+            candidates = [player for player in by_team.get(victims_team_id, [])
+                          if player.status == 'active' and player.pk not in missed]
+            for player in rng.sample(candidates, min(count, len(candidates))):
+                result = casualty_result(rng.randint(1, 16))
+                report.casualties.append((player, result))
+                if result == 'badly_hurt':
+                    continue
+                if result == 'dead':
+                    player.status = 'dead'
+                    player.graveyard_id = player.player_team_id
+                else:
+                    player.status = 'injured'
+                    if result == 'serious_injury':
+                        player.niggling_injuries += 1
+                    elif result == 'lasting_injury':
+                        _apply_lasting_injury(player, rng.randint(1, 6))
+                        revalued.add(player.pk)
+                changed.add(player.pk)
+
+    for player in (players[pk] for pk in sorted(revalued | levelled)):
+        value = player.calculate_value(rules)
+        if value != player.value:
+            player.value = value
+            changed.add(player.pk)
+
+    levelled = sorted(pk for pk in levelled if players[pk].status != 'dead')
+    if levelled:
+        engine = get_engine()
+        for pk, known in skill_masks(levelled, engine).items():
+            primary, secondary = engine.legal_masks(players[pk].position_id, known)
+            report.advancements[pk] = (engine.skills(primary), engine.skills(secondary))
+
+    changed_players = [players[pk] for pk in sorted(changed)]
+    Player.objects.bulk_update(changed_players, PLAYER_FIELDS, batch_size=chunk_size)
+    report.players_updated = len(changed_players)
+
+    for player in changed_players:
+        delta = player.ctv_contribution - contributions[player.pk]
+        if delta:
+            report.team_value_changes[player.player_team_id] = (
+                report.team_value_changes.get(player.player_team_id, 0) + delta)
+        player._loaded_ctv = (player.player_team_id, player.ctv_contribution)
+    _increment(Team.objects.all(), 'ctv', report.team_value_changes)
+    Team.bump_revisions({player.player_team_id for player in changed_players})
+    track(report.team_value_changes)
+
+    Match.objects.filter(pk__in=[match.pk for match in matches]).update(processed=True)
+    return report
+
+
+def process_round(league, round_number, seed=None, chunk_size=BULK_UPDATE_CHUNK):
+    """
+    Runs the post-match pipeline for every played match of a league round. Returns a PostMatchReport.
+    """
+    match_ids = league.matches.filter(round_number=round_number).values_list('pk', flat=True)
+    return process_matches(match_ids, seed=seed, chunk_size=chunk_size)
@@ -0,0 +1,111 @@
+import re
+
+from django.db import connection
+
+from .archive import graveyard
+from .budgets import QueryRecorder
+from .forms import AddPlayerForm, SelectTeamForm
+from .models import Team
+from .roster import RosterReadModel
+from .rules import get_rules
+
+# Rules tables are small and read whole into the rules cache, so scanning them is expected.
+SMALL_TABLES = {
+    'bbm_app_race', 'bbm_app_position', 'bbm_app_racepositionlimit', 'bbm_app_skill', 'bbm_app_trait',
+    'bbm_app_skillcategory',
+}
+SCAN_PATTERNS = {
+    'sqlite': re.compile(r'^SCAN (?:TABLE )?(?P<table>\w+)'),
+    'postgresql': re.compile(r'Seq Scan on (?P<table>\w+)'),
+}
+
+
+class FullScanError(AssertionError):
+    """
+    Raised when a hot query is planned with a full scan of a table.
+    """
+
+
+def explain(sql, params=None):
+    """
+    Returns the lines of the query plan of 'sql', run with 'params', on the current database.
+
+    The PostgreSQL planner rightly prefers a sequential scan of a table of a few pages, as the tables of a
+    development or test database are, so sequential scans are disabled while explaining: the plan then
+    shows the index the query would use on production-sized data, and still a sequential scan when there
+    is no usable index.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+        if connection.vendor == 'postgresql':
+            cursor.execute('SET enable_seqscan = off')
+        try:
+            cursor.execute(f'EXPLAIN {sql}', params)
+            return [row[0] for row in cursor.fetchall()]
+        finally:
+            if connection.vendor == 'postgresql':
+                cursor.execute('RESET enable_seqscan')
+
+
+def full_scans(sql, params=None):
+    """
+    Returns the lines of the query plan of 'sql', run with 'params', that scan a whole table other than
+    a small rules table.
+    Raises ValueError on a database whose plans cannot be checked.
+    """
+    pattern = SCAN_PATTERNS.get(connection.vendor)
+    if pattern is None:
+        raise ValueError(f'Query plans cannot be checked on {connection.vendor}.')
+    scans = []
+    for line in explain(sql, params):
+        match = pattern.search(line.strip())
+        if match and match.group('table') not in SMALL_TABLES:
+            scans.append(line.strip())
+    return scans
+
+
+def _position_count(team):
+    """
+    Counts the players of the team at one position, as the position limit check of the hire services does.
+    """
+    position_id = team.players.values_list('position_id', flat=True).first()
+    return team.players.filter(position_id=position_id).count()
+
+
+# The hot lookups, each run against an existing team.
+HOT_PATHS = {
+    'roster': lambda team: list(RosterReadModel(team).players),
+    'team_value': lambda team: team.CTV,
+    'position_count': _position_count,
+    'free_numbers': lambda team: AddPlayerForm(team=team),
+    'coach_teams': lambda team: SelectTeamForm(user=team.coach_id),
+    'graveyard': lambda team: list(graveyard(team)),
+    'team_lookup': lambda team: Team.objects.get(pk=team.pk),
+}
+
+
+def check_query_plans(team, paths=None):
+    """
+    Runs every hot path against 'team', explains each query it ran and returns a dict mapping the name of
+    every path to the full scans found in its plans, empty for a path whose queries all use an index.
+    The rules cache is loaded first, as it is in a running process.
+    """
+    get_rules()
+    results = {}
+    for name in paths or HOT_PATHS:
+        queries = []
+        with connection.execute_wrapper(QueryRecorder(queries)):
+            HOT_PATHS[name](team)
+        results[name] = [scan for query in queries for scan in full_scans(query['sql'], query['params'])]
+    return results
+
+
+def assert_no_full_scans(team, paths=None):
+    """
+    Raises FullScanError listing every hot path whose queries are planned with a full scan.
+    """
+    failures = {name: scans for name, scans in check_query_plans(team, paths).items() if scans}
+    if failures:
+        raise FullScanError('\n'.join(f'{name}: {"; ".join(scans)}' for name, scans in failures.items()))
@@ -0,0 +1,112 @@
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .models import Team
+from .rules import RULES_VERSION_KEY
+
+FRAGMENT_CACHE_TIMEOUT = 60 * 60 * 24
+# The cached parts of the roster pages and their templates. The staff section of the manage page
+# carries the purchase buttons, so it is cached apart from the read only one.
+FRAGMENTS = {
+    'roster_table': 'roster_table.html',
+    'staff': 'team_staff.html',
+    'manage_staff': 'team_staff.html',
+}
+
+
+class RosterReadModel:
+    """
+    Read model behind the roster page.
+
+    Loads a team together with its race and coach, and its players together with their position,
+    skills and traits, so rendering the roster costs a fixed number of queries whatever its size.
+
+    The rendered roster table and staff section are cached under the revision of the team, which every
+    change to the team or its roster bumps, and the version of the rules data, so no explicit invalidation
+    is needed. With the fragments cached a roster page only loads the team itself.
+    """
+
+    def __init__(self, team):
+        """
+        Initialize the read model for an already loaded team.
+        """
+        self.team = team
+
+    @staticmethod
+    def team_queryset():
+        """
+        Returns the Team queryset that loads everything the roster page reads from the team itself.
+        """
+        return Team.objects.select_related('race', 'coach')
+
+    @property
+    def players(self):
+        """
+        Returns the players of the team ordered by number, with position, skills and traits prefetched.
+        """
+        return (self.team.players
+                .select_related('position')
+                .prefetch_related('skills', 'traits')
+                .order_by('number'))
+
+    def fragment_key(self, name):
+        """
+        Returns the cache key of the fragment 'name' of the team at its current revision.
+        """
+        return f'bbm_app:fragment:{name}:{self.team.pk}:{self.team.revision}:{cache.get(RULES_VERSION_KEY)}'
+
+    def render_fragments(self, names):
+        """
+        Renders the fragments 'names' from the database, caches them and returns them as a dict.
+        """
+        context = {'team': self.team, 'manage': 'manage_staff' in names}
+        if 'roster_table' in names:
+            context['players'] = self.players
+        fragments = {name: render_to_string(FRAGMENTS[name], context) for name in names}
+        cache.set_many({self.fragment_key(name): html for name, html in fragments.items()}, FRAGMENT_CACHE_TIMEOUT)
+        return fragments
+
+    def _fragment_names(self, manage):
+        """
+        Returns the names of the fragments of the roster page, or of the manage page with 'manage'.
+        """
+        return ['roster_table', 'manage_staff' if manage else 'staff']
+
+    def _context(self, names, cached, extra):
+        """
+        Returns the template context from the cached fragments, under 'roster_table' and 'staff'.
+        """
+        context = {'team': self.team}
+        for name in names:
+            context['staff' if name.endswith('staff') else name] = mark_safe(cached[name])
+        context.update(extra)
+        return context
+
+    def get_context(self, manage=False, **extra):
+        """
+        Returns the template context for the roster page, or the manage page with 'manage',
+        rendering only the fragments that are not cached yet.
+        """
+        names = self._fragment_names(manage)
+        keys = {self.fragment_key(name): name for name in names}
+        cached = {keys[key]: html for key, html in cache.get_many(keys).items()}
+        missing = [name for name in names if name not in cached]
+        if missing:
+            cached.update(self.render_fragments(missing))
+        return self._context(names, cached, extra)
+
+    async def aget_context(self, manage=False, **extra):
+        """
+        Returns the template context for the roster page for async views. The fragments are read from the
+        cache asynchronously, and the missing ones are rendered in a worker thread, so rendering the page
+        runs no queries.
+        """
+        names = self._fragment_names(manage)
+        keys = {self.fragment_key(name): name for name in names}
+        cached = {keys[key]: html for key, html in (await cache.aget_many(keys)).items()}
+        missing = [name for name in names if name not in cached]
+        if missing:
+            cached.update(await sync_to_async(self.render_fragments)(missing))
+        return self._context(names, cached, extra)
@@ -0,0 +1,110 @@
+import threading
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Position, Race, RacePositionLimit, Skill, SkillCategory, Trait
+
+RULES_VERSION_KEY = 'bbm_app:rules_version'
+
+_lock = threading.Lock()
+_rules = None
+
+
+class RulesGraph:
+    """
+    An in-memory snapshot of the rules tables: races, positions, position limits, skills,
+    skill categories and traits, together with the many-to-many links between them.
+
+    The model instances held by the graph are shared by every request in the process
+    and must be treated as read-only.
+    """
+
+    def __init__(self, version):
+        """
+        Loads the whole rules graph with one query per table.
+        """
+        self.version = version
+        self.races = {race.pk: race for race in Race.objects.all()}
+        self.positions = {position.pk: position for position in Position.objects.order_by('pk')}
+        self.skills = {skill.pk: skill for skill in Skill.objects.all()}
+        self.traits = {trait.pk: trait for trait in Trait.objects.all()}
+        self.skill_categories = {category.pk: category for category in SkillCategory.objects.all()}
+
+        self.limits = {}
+        self.race_positions = {race_id: [] for race_id in self.races}
+        for race_id, position_id, max_count in (RacePositionLimit.objects.order_by('position_id')
+                                                .values_list('race_id', 'position_id', 'max_count')):
+            self.limits[(race_id, position_id)] = max_count
+            self.race_positions.setdefault(race_id, []).append(position_id)
+
+        self.starting_skills = self._links(Position.starting_skills.through, 'position_id', 'skill_id')
+        self.position_traits = self._links(Position.traits.through, 'position_id', 'trait_id')
+        self.primary_categories = self._links(Position.primary_skill_categories.through,
+                                              'position_id', 'skillcategory_id')
+        self.secondary_categories = self._links(Position.secondary_skill_categories.through,
+                                                'position_id', 'skillcategory_id')
+        self.category_skills = self._links(SkillCategory.skills.through, 'skillcategory_id', 'skill_id')
+
+    @staticmethod
+    def _links(through, source, target):
+        """
+        Reads a many-to-many through table into a dict mapping each source id to a list of target ids.
+        """
+        links = {}
+        for source_id, target_id in through.objects.order_by('pk').values_list(source, target):
+            links.setdefault(source_id, []).append(target_id)
+        return links
+
+    def positions_for_race(self, race_id):
+        """
+        Returns the positions available to the race, ordered by primary key.
+        """
+        return [self.positions[position_id] for position_id in self.race_positions.get(race_id, [])]
+
+    def position_limit(self, race_id, position_id):
+        """
+        Returns the maximum count of the position for the race, or None if the race has no limit for it.
+        """
+        return self.limits.get((race_id, position_id))
+
+
+def get_rules():
+    """
+    Returns the rules graph of the current rules version, rebuilding it if the version has changed.
+
+    The version is stored in Django's cache framework, so with a shared cache backend an invalidation
+    in one process is seen by every other process on its next request.
+    """
+    global _rules
+    version = cache.get(RULES_VERSION_KEY)
+    if version is None:
+        version = cache.get_or_set(RULES_VERSION_KEY, uuid.uuid4().hex, None)
+    rules = _rules
+    if rules is not None and rules.version == version:
+        return rules
+    with _lock:
+        if _rules is None or _rules.version != version:
+            _rules = RulesGraph(version)
+        return _rules
+
+
+def bump_version():
+    """
+    Stores a new rules version and drops the graph held by this process.
+    """
+    global _rules
+    cache.set(RULES_VERSION_KEY, uuid.uuid4().hex, None)
+    _rules = None
+
+
+def invalidate():
+    """
+    Invalidates the rules graph in every process.
+
+    The version is bumped right away and once more when the current transaction commits,
+    so a graph rebuilt from not yet committed data is never kept.
+    """
+    bump_version()
+    transaction.on_commit(bump_version)
@@ -0,0 +1,278 @@
+import json
+import os
+import time
+
+from django.db import transaction
+
+from . import rules
+from .models import Position, Race, RacePositionLimit, Skill, SkillCategory, Trait
+
+DEFAULT_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+POSITION_STATS = ('movement', 'strength', 'agility', 'armor', 'passing', 'cost')
+
+
+class DryRunRollback(Exception):
+    """
+    Raised inside the loader transaction to roll back a dry run.
+    """
+
+
+class RulesLoader:
+    """
+    Loads the rules data (skills, skill categories, traits, races and team positions) from JSON
+    into the database.
+
+    Names are resolved in memory against maps read once per table, and all rows are written with
+    bulk inserts and updates, so the number of queries does not depend on the size of the data.
+    Existing rows are matched by their natural keys, which makes loading the same data twice a no-op.
+    """
+
+    def __init__(self, stdout=None):
+        """
+        Initialize the loader. 'stdout' receives warnings about names that cannot be resolved.
+        """
+        self.stdout = stdout
+        self.timings = []
+        self.counts = {}
+        self.warnings = []
+
+    def _warn(self, message):
+        """
+        Records a warning and writes it to 'stdout' if one was given.
+        """
+        if message in self.warnings:
+            return
+        self.warnings.append(message)
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def _count(self, key, value):
+        """
+        Adds 'value' to the counter 'key'.
+        """
+        self.counts[key] = self.counts.get(key, 0) + value
+
+    def _timed(self, step, func, *args):
+        """
+        Runs func(*args) and records how long it took under 'step'.
+        """
+        start = time.perf_counter()
+        result = func(*args)
+        self.timings.append((step, time.perf_counter() - start))
+        return result
+
+    @staticmethod
+    def read_json(path):
+        """
+        Reads and returns the content of a JSON file.
+        """
+        with open(path, 'r') as json_file:
+            return json.load(json_file)
+
+    @classmethod
+    def read_team_files(cls, json_dir):
+        """
+        Reads every JSON file of the team directory, in file name order.
+        """
+        return [cls.read_json(os.path.join(json_dir, name))
+                for name in sorted(os.listdir(json_dir)) if name.endswith('.json')]
+
+    @classmethod
+    def read_data_dir(cls, data_dir):
+        """
+        Reads the skills, traits, races and team files of a data directory.
+        """
+        return (
+            cls.read_json(os.path.join(data_dir, 'skills.json')),
+            cls.read_json(os.path.join(data_dir, 'traits.json')),
+            cls.read_json(os.path.join(data_dir, 'races.json')),
+            cls.read_team_files(os.path.join(data_dir, 'teams')),
+        )
+
+    def load_all(self, data_dir=DEFAULT_DATA_DIR, dry_run=False):
+        """
+        Loads skills, traits, races and team positions from 'data_dir' in a single transaction.
+
+        With dry_run=True everything is written and then rolled back, so the counts and warnings
+        show what a real load would do.
+        """
+        skills, traits, races, teams = self._timed('read', self.read_data_dir, data_dir)
+        self.run(dry_run, [
+            ('skills', self.load_skills, skills),
+            ('traits', self.load_traits, traits),
+            ('races', self.load_races, races),
+            ('positions', self.load_positions, teams),
+        ])
+
+    def run(self, dry_run, steps):
+        """
+        Runs the (name, loader, data) steps in a single transaction, rolling it back on a dry run.
+        """
+        try:
+            with transaction.atomic():
+                for step, loader, data in steps:
+                    self._timed(step, loader, data)
+                if dry_run:
+                    raise DryRunRollback
+        except DryRunRollback:
+            return
+        rules.invalidate()
+
+    def load_skills(self, data):
+        """
+        Creates the missing skill categories and skills and links every skill to its category.
+        """
+        category_names = [entry['category'] for entry in data]
+        skill_names = [name for entry in data for name in entry['skills']]
+        categories = self._create_missing(SkillCategory, category_names, 'skill categories')
+        skills = self._create_missing(Skill, skill_names, 'skills')
+
+        through = SkillCategory.skills.through
+        existing = set(through.objects.values_list('skillcategory_id', 'skill_id'))
+        links = []
+        for entry in data:
+            category_id = categories[entry['category']]
+            for name in entry['skills']:
+                pair = (category_id, skills[name])
+                if pair not in existing:
+                    existing.add(pair)
+                    links.append(through(skillcategory_id=pair[0], skill_id=pair[1]))
+        through.objects.bulk_create(links)
+        self._count('skill category links', len(links))
+
+    def load_traits(self, data):
+        """
+        Creates the missing traits.
+        """
+        self._create_missing(Trait, [entry['name'] for entry in data], 'traits')
+
+    def load_races(self, data):
+        """
+        Creates the missing races and updates the re-roll cost and apothecary flag of existing ones.
+        """
+        races = {race.race_type: race for race in Race.objects.all()}
+        new_races, changed_races = [], []
+        for entry in data:
+            race = races.get(entry['race'])
+            if race is None:
+                race = Race(race_type=entry['race'])
+                races[race.race_type] = race
+                new_races.append(race)
+            elif (race.reroll_cost, race.has_apothecary) == (entry['reroll_cost'], entry['has_apothecary']):
+                continue
+            else:
+                changed_races.append(race)
+            race.reroll_cost = entry['reroll_cost']
+            race.has_apothecary = entry['has_apothecary']
+        Race.objects.bulk_create(new_races)
+        Race.objects.bulk_update(changed_races, ['reroll_cost', 'has_apothecary'])
+        self._count('races', len(new_races))
+        self._count('races updated', len(changed_races))
+
+    def load_positions(self, teams):
+        """
+        Creates or updates the positions of every team file, their position limits, starting skills,
+        traits and skill categories.
+
+        A position is identified by its race and name, so races sharing a position name
+        get positions of their own.
+        """
+        races = dict(Race.objects.values_list('race_type', 'pk'))
+        skills = dict(Skill.objects.values_list('name', 'pk'))
+        traits = dict(Trait.objects.values_list('name', 'pk'))
+        categories = dict(SkillCategory.objects.values_list('name', 'pk'))
+
+        limits = {}
+        positions = {}
+        for limit in RacePositionLimit.objects.select_related('position'):
+            limits[(limit.race_id, limit.position.name)] = limit
+            positions[limit.position_id] = limit.position
+
+        entries = []
+        for team in teams:
+            race_id = races.get(team['race_type'])
+            if race_id is None:
+                self._warn(f"Race {team['race_type']} does not exist in the database.")
+                continue
+            entries.extend((race_id, entry) for entry in team['positions'])
+
+        new_positions, changed_positions, changed_limits = [], [], []
+        loaded = []
+        seen = set()
+        for race_id, entry in entries:
+            if (race_id, entry['name']) in seen:
+                self._warn(f"Position {entry['name']} is listed twice for the same race.")
+                continue
+            seen.add((race_id, entry['name']))
+            limit = limits.get((race_id, entry['name']))
+            if limit is None:
+                position = Position(name=entry['name'], **{stat: entry[stat] for stat in POSITION_STATS})
+                new_positions.append(position)
+            else:
+                position = positions[limit.position_id]
+                if any(getattr(position, stat) != entry[stat] for stat in POSITION_STATS):
+                    for stat in POSITION_STATS:
+                        setattr(position, stat, entry[stat])
+                    changed_positions.append(position)
+                if limit.max_count != entry['max_count']:
+                    limit.max_count = entry['max_count']
+                    changed_limits.append(limit)
+            loaded.append((race_id, position, limit, entry))
+
+        Position.objects.bulk_create(new_positions)
+        Position.objects.bulk_update(changed_positions, POSITION_STATS)
+        RacePositionLimit.objects.bulk_update(changed_limits, ['max_count'])
+        RacePositionLimit.objects.bulk_create([
+            RacePositionLimit(race_id=race_id, position=position, max_count=entry['max_count'])
+            for race_id, position, limit, entry in loaded if limit is None
+        ])
+        self._count('positions', len(new_positions))
+        self._count('positions updated', len(changed_positions) + len(changed_limits))
+
+        position_ids = [position.pk for _, position, _, _ in loaded]
+        self._replace_links(Position.starting_skills.through, 'skill_id', position_ids, [
+            (position.pk, entry.get('starting_skills', entry.get('skills', [])))
+            for _, position, _, entry in loaded
+        ], skills, 'Skill')
+        self._replace_links(Position.traits.through, 'trait_id', position_ids, [
+            (position.pk, entry.get('traits', [])) for _, position, _, entry in loaded
+        ], traits, 'Trait')
+        self._replace_links(Position.primary_skill_categories.through, 'skillcategory_id', position_ids, [
+            (position.pk, entry['primary_skill_categories']) for _, position, _, entry in loaded
+        ], categories, 'Skill category')
+        self._replace_links(Position.secondary_skill_categories.through, 'skillcategory_id', position_ids, [
+            (position.pk, entry['secondary_skill_categories']) for _, position, _, entry in loaded
+        ], categories, 'Skill category')
+
+    def _create_missing(self, model, names, label):
+        """
+        Bulk creates the rows of 'model' whose name is not in the database yet
+        and returns a dict mapping every name to its primary key.
+        """
+        existing = dict(model.objects.values_list('name', 'pk'))
+        missing = [name for name in dict.fromkeys(names) if name not in existing]
+        model.objects.bulk_create([model(name=name) for name in missing])
+        self._count(label, len(missing))
+        if missing:
+            existing = dict(model.objects.values_list('name', 'pk'))
+        return existing
+
+    def _replace_links(self, through, target_field, position_ids, links, names, label):
+        """
+        Replaces the rows of a position many-to-many through table for the loaded positions
+        with one delete and one bulk insert. Names missing from 'names' are reported and skipped.
+        """
+        rows = []
+        for position_id, link_names in links:
+            target_ids = []
+            for name in link_names:
+                target_id = names.get(name)
+                if target_id is None:
+                    self._warn(f'{label} {name} does not exist in the database.')
+                elif target_id not in target_ids:
+                    target_ids.append(target_id)
+            rows.extend(through(position_id=position_id, **{target_field: target_id}) for target_id in target_ids)
+        through.objects.filter(position_id__in=position_ids).delete()
+        through.objects.bulk_create(rows)
+        self._count(f'{through._meta.model_name} rows', len(rows))
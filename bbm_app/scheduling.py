@@ -0,0 +1,99 @@
+import heapq
+import itertools
+import random
+
+from django.db import transaction
+
+from .models import Match
+
+FIXTURE_BATCH_SIZE = 1000
+
+
+def round_robin(team_ids, double=False):
+    """
+    Yields the (round number, home team id, away team id) fixtures of a round robin between 'team_ids',
+    using the circle method.
+
+    With an odd number of teams one team has a bye in every round. Home and away games are balanced:
+    every team's home and away counts differ by at most one (by none with an odd number of teams).
+    With double=True a second round robin with home and away swapped follows the first one.
+
+    Fixtures are generated lazily, one round at a time, so memory use does not depend on the number
+    of fixtures.
+    """
+    slots = list(team_ids)
+    if len(slots) < 2:
+        return
+    if len(slots) % 2:
+        slots.insert(0, None)
+    size = len(slots)
+    rounds = size - 1
+    for leg in range(2 if double else 1):
+        circle = slots[:]
+        for round_index in range(rounds):
+            for i in range(size // 2):
+                home, away = circle[i], circle[size - 1 - i]
+                if (i == 0 and round_index % 2) or (i > 0 and i % 2):
+                    home, away = away, home
+                if leg:
+                    home, away = away, home
+                if home is not None and away is not None:
+                    yield leg * rounds + round_index + 1, home, away
+            circle = [circle[0], circle[-1]] + circle[1:-1]
+
+
+def divisional(divisions, double=False):
+    """
+    Yields the (round number, home team id, away team id) fixtures of a round robin inside every division,
+    played in parallel: round N of every division makes up round N of the schedule.
+    """
+    return heapq.merge(*(round_robin(team_ids, double) for team_ids in divisions), key=lambda fixture: fixture[0])
+
+
+def without_same_coach(fixtures, coaches):
+    """
+    Filters out fixtures between two teams of the same coach. 'coaches' maps team ids to coach ids.
+    Teams whose fixture is dropped have a bye in that round.
+    """
+    return ((round_number, home, away) for round_number, home, away in fixtures
+            if coaches[home] != coaches[away])
+
+
+def generate_fixtures(league, double=False, by_division=False, seed=None):
+    """
+    Generates and saves the fixtures of a league as scheduled matches, following the last round already
+    scheduled. Returns the number of matches created.
+
+    With by_division=True every division of the league (Standing.division) plays its own round robin.
+    With a seed the teams are shuffled reproducibly before scheduling, otherwise they are scheduled in the
+    order they joined the league. Teams of the same coach never play each other.
+
+    Matches are written with bulk inserts in batches, straight from the fixture generator.
+    """
+    rows = list(league.standings.order_by('pk').values_list('team_id', 'team__coach_id', 'division'))
+    coaches = {team_id: coach_id for team_id, coach_id, _ in rows}
+    team_ids = [team_id for team_id, _, _ in rows]
+    if seed is not None:
+        random.Random(seed).shuffle(team_ids)
+
+    if by_division:
+        divisions = {}
+        division_of = {team_id: division for team_id, _, division in rows}
+        for team_id in team_ids:
+            divisions.setdefault(division_of[team_id], []).append(team_id)
+        fixtures = divisional(divisions.values(), double)
+    else:
+        fixtures = round_robin(team_ids, double)
+
+    last_round = league.matches.order_by('-round_number').values_list('round_number', flat=True).first() or 0
+    matches = (Match(league=league, round_number=last_round + round_number, home_team_id=home, away_team_id=away)
+               for round_number, home, away in without_same_coach(fixtures, coaches))
+    created = 0
+    with transaction.atomic():
+        while True:
+            batch = list(itertools.islice(matches, FIXTURE_BATCH_SIZE))
+            if not batch:
+                break
+            Match.objects.bulk_create(batch)
+            created += len(batch)
+    return created
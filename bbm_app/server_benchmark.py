@@ -0,0 +1,117 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+
+
+class BenchmarkResult:
+    """
+    The outcome of a benchmark run: how many requests were served, how long it took and the status codes.
+    """
+
+    def __init__(self, name, seconds, statuses):
+        """
+        Initialize the result of the run called 'name'.
+        """
+        self.name = name
+        self.seconds = seconds
+        self.statuses = statuses
+
+    @property
+    def requests(self):
+        return len(self.statuses)
+
+    @property
+    def requests_per_second(self):
+        return self.requests / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        """
+        Returns a one line summary of the run.
+        """
+        errors = sum(1 for status in self.statuses if status >= 400)
+        return (f'{self.name}: {self.requests} requests in {self.seconds:.2f} s, '
+                f'{self.requests_per_second:.1f} requests/s, {errors} errors')
+
+
+def run_wsgi(path, clients, requests_per_client=1, workers=4, client_delay=0.05, cookie=''):
+    """
+    Serves 'clients' concurrent clients, each sending 'requests_per_client' GET requests for 'path',
+    through Django's WSGI handler on a pool of 'workers' threads, like a threaded WSGI server.
+
+    Each client reads its response slowly, taking 'client_delay' seconds, and, as with a WSGI server,
+    the worker thread serving it is blocked until the response has been read.
+    """
+    handler = WSGIHandler()
+
+    def serve():
+        statuses = []
+        environ = {
+            'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SCRIPT_NAME': '',
+            'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'HTTP_HOST': 'testserver', 'HTTP_COOKIE': cookie,
+            'wsgi.input': BytesIO(), 'wsgi.url_scheme': 'http', 'wsgi.errors': BytesIO(),
+        }
+        body = handler(environ, lambda status, headers: statuses.append(int(status.split()[0])))
+        for _ in body:
+            time.sleep(client_delay)
+        body.close()
+        return statuses[0]
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        statuses = list(pool.map(lambda _: serve(), range(clients * requests_per_client)))
+    return BenchmarkResult('WSGI', time.perf_counter() - start, statuses)
+
+
+def run_asgi(path, clients, requests_per_client=1, client_delay=0.05, cookie=''):
+    """
+    Serves 'clients' concurrent clients, each sending 'requests_per_client' GET requests for 'path',
+    through Django's ASGI handler on one event loop, like a single ASGI worker.
+
+    Each client reads its response slowly, taking 'client_delay' seconds; the event loop keeps serving
+    the other clients meanwhile.
+    """
+    handler = ASGIHandler()
+    headers = [(b'host', b'testserver')]
+    if cookie:
+        headers.append((b'cookie', cookie.encode()))
+
+    async def serve():
+        statuses = []
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'', 'root_path': '',
+            'headers': headers, 'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+        }
+        requested = asyncio.Event()
+
+        async def receive():
+            if not requested.is_set():
+                requested.set()
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+            # The client never disconnects early; wait until the handler stops listening.
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+            elif message['type'] == 'http.response.body':
+                await asyncio.sleep(client_delay)
+
+        await handler(scope, receive, send)
+        return statuses[0]
+
+    async def client():
+        return [await serve() for _ in range(requests_per_client)]
+
+    async def main():
+        results = await asyncio.gather(*(client() for _ in range(clients)))
+        return [status for statuses in results for status in statuses]
+
+    start = time.perf_counter()
+    statuses = asyncio.run(main())
+    return BenchmarkResult('ASGI', time.perf_counter() - start, statuses)
@@ -0,0 +1,285 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import Player, Team
+from .rules import get_rules
+
+MAX_RE_ROLLS = 8
+MAX_ASSISTANT_COACHES = 8
+MAX_CHEERLEADERS = 8
+APOTHECARY_COST = 50000
+ASSISTANT_COACH_COST = 10000
+CHEERLEADER_COST = 10000
+ROSTER_NUMBERS = range(1, 17)
+NUMBER_RETRIES = 3
+
+
+class PurchaseResult:
+    """
+    The outcome of a purchase: whether it succeeded, a message explaining a failure,
+    and the hired player for player purchases.
+    """
+
+    def __init__(self, success, message='', player=None, players=None, errors=None):
+        """
+        Initialize the result. 'errors' is a list of (entry index, message) pairs for batch purchases.
+        """
+        self.success = success
+        self.message = message
+        self.player = player
+        self.players = players or []
+        self.errors = errors or []
+
+    def __bool__(self):
+        """
+        A result is truthy when the purchase succeeded.
+        """
+        return self.success
+
+    def __repr__(self):
+        """
+        Returns a debugging representation of the result.
+        """
+        return f'PurchaseResult(success={self.success!r}, message={self.message!r})'
+
+
+def _buy(team, cost, value, field, conditions, failure):
+    """
+    Buys one unit of the team 'field' with a single conditional UPDATE.
+
+    The treasury is only charged if it covers 'cost' and 'conditions' still hold in the database,
+    so concurrent purchases can never overspend. 'value' is added to the team value in the same statement.
+    On success the purchase related fields of 'team' are refreshed.
+    """
+    increment = True if field == 'apothecary' else F(field) + 1
+    updated = (Team.objects
+               .filter(pk=team.pk, treasury__gte=cost, **conditions)
+               .update(treasury=F('treasury') - cost, ctv=F('ctv') + value, revision=F('revision') + 1,
+                       **{field: increment}))
+    team.refresh_from_db(fields=['treasury', 'ctv', 'revision', field])
+    if not updated:
+        if team.treasury < cost:
+            return PurchaseResult(False, 'Insufficient funds.')
+        return PurchaseResult(False, failure)
+    team.track_history()
+    return PurchaseResult(True)
+
+
+def buy_reroll(team):
+    """
+    Buys a team re-roll at the current re-roll price. The team value grows by the base re-roll cost.
+    """
+    return _buy(team, team.reroll_cost, team.race_rules.reroll_cost, 'team_re_roll',
+                {'team_re_roll__lt': MAX_RE_ROLLS}, 'The team already has the maximum number of re-rolls.')
+
+
+def buy_apothecary(team):
+    """
+    Buys an apothecary, if the race of the team may have one.
+    """
+    if not team.race_rules.has_apothecary:
+        return PurchaseResult(False, 'This race cannot have an apothecary.')
+    return _buy(team, APOTHECARY_COST, APOTHECARY_COST, 'apothecary',
+                {'apothecary': False}, 'The team already has an apothecary.')
+
+
+def buy_assistant_coach(team):
+    """
+    Buys an assistant coach.
+    """
+    return _buy(team, ASSISTANT_COACH_COST, ASSISTANT_COACH_COST, 'assistant_coaches',
+                {'assistant_coaches__lt': MAX_ASSISTANT_COACHES},
+                'The team already has the maximum number of assistant coaches.')
+
+
+def buy_cheerleader(team):
+    """
+    Buys a cheerleader.
+    """
+    return _buy(team, CHEERLEADER_COST, CHEERLEADER_COST, 'cheerleaders',
+                {'cheerleaders__lt': MAX_CHEERLEADERS}, 'The team already has the maximum number of cheerleaders.')
+
+
+class PurchaseFailed(Exception):
+    """
+    Raised inside a purchase transaction to roll it back.
+    """
+
+    def __init__(self, message, errors=None):
+        """
+        Initialize the exception with the message reported to the user
+        and, for batch purchases, the (entry index, message) pairs of the invalid entries.
+        """
+        super().__init__(message)
+        self.message = message
+        self.errors = errors or []
+
+
+def new_player(team, name, number, position):
+    """
+    Returns a new, unsaved player of 'team' at 'position', with the characteristics and value of the position.
+    """
+    return Player(
+        name=name,
+        number=number,
+        position=position,
+        player_team=team,
+        movement=position.movement,
+        strength=position.strength,
+        agility=position.agility,
+        armor=position.armor,
+        passing=position.passing,
+        value=position.cost,
+    )
+
+
+def add_position_links(players, rules):
+    """
+    Gives newly created players the traits, starting skills and skill categories of their position,
+    taken from the rules data, with one bulk insert per many-to-many table.
+    """
+    links = (
+        (Player.traits.through, 'trait_id', rules.position_traits),
+        (Player.skills.through, 'skill_id', rules.starting_skills),
+        (Player.primary_skill_categories.through, 'skillcategory_id', rules.primary_categories),
+        (Player.secondary_skill_categories.through, 'skillcategory_id', rules.secondary_categories),
+    )
+    for through, target_field, position_links in links:
+        through.objects.bulk_create([
+            through(player_id=player.pk, **{target_field: target_id})
+            for player in players
+            for target_id in position_links.get(player.position_id, [])
+        ])
+
+
+def hire_player(team, name, position, number=None):
+    """
+    Hires a player at 'position' for the team.
+
+    The treasury is charged with a conditional UPDATE, which also locks the team row until the
+    transaction ends, so concurrent hires for the same team are serialized. The position limit
+    is checked and the player inserted under that lock. If 'number' is None the lowest free number
+    is used, and a collision with a concurrent hire is retried with the next free number.
+    """
+    try:
+        with transaction.atomic():
+            return PurchaseResult(True, player=_hire_player(team, name, position, number))
+    except PurchaseFailed as failure:
+        team.refresh_from_db(fields=['treasury', 'ctv', 'revision'])
+        return PurchaseResult(False, failure.message)
+
+
+def _hire_player(team, name, position, number):
+    """
+    Does the work of hire_player inside its transaction and returns the hired player.
+    Raises PurchaseFailed to roll the purchase back.
+    """
+    rules = get_rules()
+    charged = (Team.objects
+               .filter(pk=team.pk, treasury__gte=position.cost)
+               .update(treasury=F('treasury') - position.cost, revision=F('revision') + 1))
+    if not charged:
+        raise PurchaseFailed('Insufficient funds.')
+    team.track_history()
+
+    max_count = rules.position_limit(team.race_id, position.pk)
+    if max_count is not None and team.players.filter(position=position).count() >= max_count:
+        raise PurchaseFailed('Maximum number of this position has been reached for the team.')
+
+    for attempt in range(NUMBER_RETRIES):
+        player_number = number
+        if player_number is None:
+            taken_numbers = set(team.players.values_list('number', flat=True))
+            player_number = next((i for i in ROSTER_NUMBERS if i not in taken_numbers), None)
+            if player_number is None:
+                raise PurchaseFailed('The roster is full.')
+        player = new_player(team, name, player_number, position)
+        try:
+            with transaction.atomic():
+                player.save()
+        except IntegrityError:
+            if number is not None:
+                raise PurchaseFailed(f'Number {number} is already taken.')
+            continue
+        break
+    else:
+        raise PurchaseFailed('Could not find a free number, please try again.')
+
+    add_position_links([player], rules)
+    team.refresh_from_db(fields=['treasury', 'ctv', 'revision'])
+    return player
+
+
+def hire_players(team, entries):
+    """
+    Hires a whole list of players for the team in one transaction.
+
+    'entries' is a list of dicts with 'name', 'number' and 'position'. All entries are validated in memory
+    against the current roster, the position limits and the treasury; if any is invalid nothing is hired
+    and the result carries an error per invalid entry. Otherwise the treasury is charged with one conditional
+    UPDATE and the players and their skills, traits and skill categories are inserted with bulk_create.
+    """
+    try:
+        with transaction.atomic():
+            return PurchaseResult(True, players=_hire_players(team, entries))
+    except PurchaseFailed as failure:
+        team.refresh_from_db(fields=['treasury', 'ctv', 'revision'])
+        return PurchaseResult(False, failure.message, errors=failure.errors)
+
+
+def validate_hires(team, entries, roster, rules):
+    """
+    Validates hire entries against the roster, given as (number, position_id) pairs, and the rules data.
+    Returns a list of (entry index, message) pairs, empty when every entry is valid.
+    """
+    errors = []
+    taken_numbers = {number for number, _ in roster}
+    position_counts = {}
+    for _, position_id in roster:
+        position_counts[position_id] = position_counts.get(position_id, 0) + 1
+
+    race_positions = set(rules.race_positions.get(team.race_id, []))
+    for index, entry in enumerate(entries):
+        number, position = entry['number'], entry['position']
+        if position.pk not in race_positions:
+            errors.append((index, f'{position} is not available for this race.'))
+            continue
+        if number not in ROSTER_NUMBERS:
+            errors.append((index, f'Number {number} is not a valid roster number.'))
+        elif number in taken_numbers:
+            errors.append((index, f'Number {number} is already taken.'))
+        taken_numbers.add(number)
+        position_counts[position.pk] = position_counts.get(position.pk, 0) + 1
+        max_count = rules.position_limit(team.race_id, position.pk)
+        if max_count is not None and position_counts[position.pk] > max_count:
+            errors.append((index, 'Maximum number of this position has been reached for the team.'))
+    return errors
+
+
+def _hire_players(team, entries):
+    """
+    Does the work of hire_players inside its transaction and returns the hired players.
+    Raises PurchaseFailed to roll the purchase back.
+    """
+    if not entries:
+        raise PurchaseFailed('No players to hire.')
+    rules = get_rules()
+    total_cost = sum(entry['position'].cost for entry in entries)
+    charged = (Team.objects
+               .filter(pk=team.pk, treasury__gte=total_cost)
+               .update(treasury=F('treasury') - total_cost, ctv=F('ctv') + total_cost, revision=F('revision') + 1))
+    if not charged:
+        raise PurchaseFailed('Insufficient funds.')
+    team.track_history()
+
+    roster = list(team.players.values_list('number', 'position_id'))
+    errors = validate_hires(team, entries, roster, rules)
+    if errors:
+        raise PurchaseFailed('Some players could not be hired.', errors)
+
+    players = Player.objects.bulk_create([new_player(team, entry['name'], entry['number'], entry['position'])
+                                          for entry in entries])
+    add_position_links(players, rules)
+
+    team.refresh_from_db(fields=['treasury', 'ctv', 'revision'])
+    return players
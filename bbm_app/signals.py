@@ -0,0 +1,66 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import rules
+from .auth import remember_coach
+from .models import Player, Position, Race, RacePositionLimit, Skill, SkillCategory, Team, Trait
+
+RULES_MODELS = (Race, Position, RacePositionLimit, Skill, SkillCategory, Trait)
+RULES_THROUGH_MODELS = (
+    Position.traits.through,
+    Position.starting_skills.through,
+    Position.primary_skill_categories.through,
+    Position.secondary_skill_categories.through,
+    SkillCategory.skills.through,
+)
+PLAYER_THROUGH_MODELS = (Player.skills.through, Player.traits.through)
+
+
+def invalidate_rules_on_change(sender, **kwargs):
+    """
+    Invalidates the rules cache whenever a rules table row is saved or deleted, including admin edits.
+    """
+    rules.invalidate()
+
+
+def invalidate_rules_on_m2m_change(sender, action, **kwargs):
+    """
+    Invalidates the rules cache whenever a many-to-many link between rules tables changes.
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        rules.invalidate()
+
+
+def bump_revision_on_player_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Bumps the revision of the team of a player whose skills or traits are changed one by one,
+    including admin edits, so the cached roster of the team is rendered again.
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        Team.bump_revisions({instance.player_team_id} - {None})
+    elif pk_set:
+        Team.bump_revisions(set(Player.objects.filter(pk__in=pk_set, player_team__isnull=False)
+                                .values_list('player_team_id', flat=True)))
+
+
+@receiver(user_logged_in)
+def remember_coach_on_login(sender, request, user, **kwargs):
+    """
+    Stores the id of the coach of a user that logs in in the session, for CoachMiddleware.
+    """
+    if request is not None and hasattr(request, 'session'):
+        remember_coach(request, user)
+
+
+# The receivers are connected to their models only: a post_delete receiver listening to every model
+# would keep Django from deleting the rows of any other model in bulk.
+for model in RULES_MODELS:
+    post_save.connect(invalidate_rules_on_change, sender=model)
+    post_delete.connect(invalidate_rules_on_change, sender=model)
+for through in RULES_THROUGH_MODELS:
+    m2m_changed.connect(invalidate_rules_on_m2m_change, sender=through)
+for through in PLAYER_THROUGH_MODELS:
+    m2m_changed.connect(bump_revision_on_player_m2m_change, sender=through)
@@ -0,0 +1,308 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .models import Player
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy is an optional dependency
+    np = None
+
+FIELDED_PLAYERS = 11
+DRIVES_PER_TEAM = 4
+BLOCKS_PER_TEAM = 12
+SQUARES_TO_SCORE = 20
+CASUALTY_ROLL = 10
+CHUNK_SIZE = 20000
+
+
+def _require_numpy():
+    """
+    Raises ImproperlyConfigured if NumPy is not installed.
+    """
+    if np is None:
+        raise ImproperlyConfigured('The match simulator requires NumPy. Install it with "pip install numpy".')
+
+
+def _has_skill(names, skill):
+    """
+    Returns True if one of 'names' is 'skill', also when written with a value such as 'Mighty Blow (1+)'.
+    """
+    return any(name == skill or name.startswith(f'{skill} ') for name in names)
+
+
+class TeamProfile:
+    """
+    The numbers the simulator needs about one team, taken from its fielded players: the best ball carrier,
+    the average strength and armour of the line and the share of players with key skills.
+
+    Profiles only hold plain numbers, so they can be sent to worker processes.
+    """
+
+    def __init__(self, team_id, players, re_rolls=0):
+        """
+        Builds the profile from an iterable of (movement, strength, agility, armor, passing, skill names) tuples.
+        The most valuable players are expected first; only the first FIELDED_PLAYERS are used.
+        """
+        players = list(players)[:FIELDED_PLAYERS]
+        self.team_id = team_id
+        self.re_rolls = re_rolls
+        if not players:
+            players = [(0, 0, 7, 7, None, ())]
+        carrier = min(players, key=lambda player: (player[2], -player[0]))
+        self.carrier_movement = max(carrier[0], 1)
+        self.carrier_strength = carrier[1]
+        self.carrier_agility = carrier[2]
+        self.carrier_block = _has_skill(carrier[5], 'Block')
+        self.carrier_dodge = _has_skill(carrier[5], 'Dodge')
+        self.carrier_sure_hands = _has_skill(carrier[5], 'Sure Hands')
+        passers = [player[4] - _has_skill(player[5], 'Pass') for player in players if player[4]]
+        self.passing = min(passers) if passers else None
+        self.strength = sum(player[1] for player in players) / len(players)
+        self.armor = sum(player[3] for player in players) / len(players)
+        self.block_share = sum(_has_skill(player[5], 'Block') for player in players) / len(players)
+        self.dodge_share = sum(_has_skill(player[5], 'Dodge') for player in players) / len(players)
+        self.mighty_blow_share = sum(_has_skill(player[5], 'Mighty Blow') for player in players) / len(players)
+
+    @classmethod
+    def for_teams(cls, teams):
+        """
+        Builds the profiles of several teams with one query for their active players and one per
+        skill and trait table. Returns a dict mapping team ids to profiles.
+        """
+        teams = list(teams)
+        players = {team.pk: [] for team in teams}
+        for player in (Player.objects
+                       .filter(player_team__in=teams, status='active')
+                       .prefetch_related('skills', 'traits')
+                       .order_by('player_team_id', '-value', 'number')):
+            names = [skill.name for skill in player.skills.all()] + [trait.name for trait in player.traits.all()]
+            players[player.player_team_id].append(
+                (player.movement, player.strength, player.agility, player.armor, player.passing, names))
+        return {team.pk: cls(team.pk, players[team.pk], team.team_re_roll) for team in teams}
+
+
+class SimulationResult:
+    """
+    The aggregated outcome of many simulated games between a home and an away team.
+    """
+
+    FIELDS = ('games', 'home_wins', 'draws', 'away_wins', 'home_touchdowns', 'away_touchdowns',
+              'home_casualties', 'away_casualties')
+
+    def __init__(self, games=0, home_wins=0, draws=0, away_wins=0, home_touchdowns=0, away_touchdowns=0,
+                 home_casualties=0, away_casualties=0):
+        """
+        Initialize the result with totals over 'games' simulated games.
+        Casualties are counted for the team that suffered them.
+        """
+        self.games = games
+        self.home_wins = home_wins
+        self.draws = draws
+        self.away_wins = away_wins
+        self.home_touchdowns = home_touchdowns
+        self.away_touchdowns = away_touchdowns
+        self.home_casualties = home_casualties
+        self.away_casualties = away_casualties
+
+    def __add__(self, other):
+        """
+        Combines the totals of two results, for example of two chunks of games.
+        """
+        return SimulationResult(*(getattr(self, field) + getattr(other, field) for field in self.FIELDS))
+
+    def _share(self, value):
+        """
+        Returns 'value' divided by the number of games.
+        """
+        return value / self.games if self.games else 0.0
+
+    @property
+    def home_win_probability(self):
+        """
+        Returns the share of the games won by the home team.
+        """
+        return self._share(self.home_wins)
+
+    @property
+    def draw_probability(self):
+        """
+        Returns the share of the games that ended in a draw.
+        """
+        return self._share(self.draws)
+
+    @property
+    def away_win_probability(self):
+        """
+        Returns the share of the games won by the away team.
+        """
+        return self._share(self.away_wins)
+
+    @property
+    def expected_home_casualties(self):
+        """
+        Returns the average number of casualties suffered by the home team per game.
+        """
+        return self._share(self.home_casualties)
+
+    @property
+    def expected_away_casualties(self):
+        """
+        Returns the average number of casualties suffered by the away team per game.
+        """
+        return self._share(self.away_casualties)
+
+    def as_dict(self):
+        """
+        Returns the probabilities and expectations as a dict.
+        """
+        return {
+            'games': self.games,
+            'home_win': self.home_win_probability,
+            'draw': self.draw_probability,
+            'away_win': self.away_win_probability,
+            'expected_home_touchdowns': self._share(self.home_touchdowns),
+            'expected_away_touchdowns': self._share(self.away_touchdowns),
+            'expected_home_casualties': self.expected_home_casualties,
+            'expected_away_casualties': self.expected_away_casualties,
+        }
+
+
+def _carrier_down(rng, shape, attacker_strength, carrier):
+    """
+    Rolls block dice against the ball carrier for an array of the given shape and returns a boolean array
+    telling where the carrier was knocked down.
+
+    Two dice are rolled when the strengths differ; the stronger side picks. A 6 (Defender Down), a 5
+    (Defender Stumbles) without Dodge and a 2 (Both Down) without Block knock the carrier down.
+    """
+    dice = rng.integers(1, 7, size=shape + (2,), dtype=np.int8)
+    down = (dice == 6) | ((dice == 5) & (not carrier.carrier_dodge)) | ((dice == 2) & (not carrier.carrier_block))
+    if attacker_strength > carrier.carrier_strength:
+        return down.any(axis=-1)
+    if attacker_strength < carrier.carrier_strength:
+        return down.all(axis=-1)
+    return down[..., 0]
+
+
+def _touchdowns(rng, games, offense, defense):
+    """
+    Simulates the drives of 'offense' against 'defense' in every game and returns the touchdowns scored
+    per game. A drive scores if the carrier picks the ball up (d6 against its agility, re-rolled with
+    Sure Hands or a team re-roll) and survives a tackle attempt on every move needed to cover the field.
+    A completed pass (d6 against the best passing value of the team) halves the moves needed.
+    """
+    pickup = rng.integers(1, 7, size=(games, DRIVES_PER_TEAM), dtype=np.int8) >= offense.carrier_agility
+    if offense.carrier_sure_hands or offense.re_rolls:
+        retry = rng.integers(1, 7, size=(games, DRIVES_PER_TEAM), dtype=np.int8) >= offense.carrier_agility
+        pickup |= retry
+    steps = max(1, -(-SQUARES_TO_SCORE // offense.carrier_movement))
+    steps_needed = np.full((games, DRIVES_PER_TEAM), steps)
+    if offense.passing:
+        passed = rng.integers(1, 7, size=(games, DRIVES_PER_TEAM), dtype=np.int8) >= offense.passing
+        steps_needed[passed] = -(-steps // 2)
+    contact = rng.random(size=(games, DRIVES_PER_TEAM, steps)) < 0.5
+    contact &= np.arange(steps) < steps_needed[..., None]
+    down = _carrier_down(rng, (games, DRIVES_PER_TEAM, steps), round(defense.strength), offense)
+    survived = ~(contact & down).any(axis=-1)
+    return (pickup & survived).sum(axis=1)
+
+
+def _casualties(rng, games, attackers, defenders):
+    """
+    Simulates the blocks thrown by 'attackers' in every game and returns the casualties the defenders
+    suffered per game: knocked down, then armour broken (2d6, +1 with Mighty Blow) and an injury roll
+    of CASUALTY_ROLL or more on 2d6.
+    """
+    shape = (games, BLOCKS_PER_TEAM)
+    dice = rng.integers(1, 7, size=shape + (2,), dtype=np.int8)
+    dodge = rng.random(size=shape) < defenders.dodge_share
+    block = rng.random(size=shape) < defenders.block_share
+    down = (dice == 6) | ((dice == 5) & ~dodge[..., None]) | ((dice == 2) & ~block[..., None])
+    if attackers.strength > defenders.strength:
+        knocked_down = down.any(axis=-1)
+    elif attackers.strength < defenders.strength:
+        knocked_down = down.all(axis=-1)
+    else:
+        knocked_down = down[..., 0]
+    mighty_blow = rng.random(size=shape) < attackers.mighty_blow_share
+    armor_roll = rng.integers(1, 7, size=shape) + rng.integers(1, 7, size=shape) + mighty_blow
+    injury_roll = rng.integers(1, 7, size=shape) + rng.integers(1, 7, size=shape)
+    return (knocked_down & (armor_roll >= defenders.armor) & (injury_roll >= CASUALTY_ROLL)).sum(axis=1)
+
+
+def _simulate_chunk(home, away, games, seed):
+    """
+    Simulates 'games' games between two profiles with one random generator and returns a SimulationResult.
+    This is the unit of work sent to worker processes.
+    """
+    rng = np.random.default_rng(seed)
+    home_touchdowns = _touchdowns(rng, games, home, away)
+    away_touchdowns = _touchdowns(rng, games, away, home)
+    home_casualties = _casualties(rng, games, away, home)
+    away_casualties = _casualties(rng, games, home, away)
+    return SimulationResult(
+        games=games,
+        home_wins=int((home_touchdowns > away_touchdowns).sum()),
+        draws=int((home_touchdowns == away_touchdowns).sum()),
+        away_wins=int((home_touchdowns < away_touchdowns).sum()),
+        home_touchdowns=int(home_touchdowns.sum()),
+        away_touchdowns=int(away_touchdowns.sum()),
+        home_casualties=int(home_casualties.sum()),
+        away_casualties=int(away_casualties.sum()),
+    )
+
+
+def _chunks(fixtures, games, seed):
+    """
+    Splits the games of every (key, home, away) fixture into chunks of at most CHUNK_SIZE games, each with
+    its own independent random stream, and yields (key, home, away, games, seed) work items.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(len(fixtures))
+    for (key, home, away), fixture_seed in zip(fixtures, seeds):
+        chunk_count = -(-games // CHUNK_SIZE)
+        for index, chunk_seed in enumerate(fixture_seed.spawn(chunk_count)):
+            yield key, home, away, min(CHUNK_SIZE, games - index * CHUNK_SIZE), chunk_seed
+
+
+def simulate_fixtures(fixtures, games=10000, seed=None, workers=1):
+    """
+    Simulates 'games' games for every (key, home profile, away profile) fixture and returns a dict mapping
+    each key to its SimulationResult.
+
+    Dice are rolled in NumPy arrays across all games of a chunk at once. With workers > 1 the chunks are
+    spread over a process pool. A seed makes the results reproducible whatever the number of workers.
+    """
+    _require_numpy()
+    work = list(_chunks(list(fixtures), games, seed))
+    results = {}
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            outcomes = pool.map(_simulate_chunk, *zip(*[item[1:] for item in work]))
+            for (key, *_), outcome in zip(work, outcomes):
+                results[key] = results.get(key, SimulationResult()) + outcome
+    else:
+        for key, home, away, chunk_games, chunk_seed in work:
+            results[key] = results.get(key, SimulationResult()) + _simulate_chunk(home, away, chunk_games, chunk_seed)
+    return results
+
+
+def simulate_match(home_team, away_team, games=10000, seed=None, workers=1):
+    """
+    Simulates 'games' games between two teams and returns the SimulationResult.
+    """
+    profiles = TeamProfile.for_teams([home_team, away_team])
+    fixture = (None, profiles[home_team.pk], profiles[away_team.pk])
+    return simulate_fixtures([fixture], games, seed, workers)[None]
+
+
+def simulate_round(league, round_number, games=10000, seed=None, workers=1):
+    """
+    Simulates every match of a league round and returns a dict mapping matches to their SimulationResult.
+    """
+    matches = list(league.matches.filter(round_number=round_number).select_related('home_team', 'away_team'))
+    teams = {team.pk: team for match in matches for team in (match.home_team, match.away_team)}
+    profiles = TeamProfile.for_teams(teams.values())
+    fixtures = [(match, profiles[match.home_team_id], profiles[match.away_team_id]) for match in matches]
+    return simulate_fixtures(fixtures, games, seed, workers)
@@ -0,0 +1,104 @@
+from django.core.cache import cache
+
+from .models import Player
+from .rules import get_rules
+from .services import ROSTER_NUMBERS
+
+SLOTS_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+class RosterSlots:
+    """
+    What a team can still hire: its free shirt numbers, how many more players it may have at every
+    position of its race, and which positions it can afford.
+
+    The roster is read with one query and cached under the revision of the team, which every roster
+    change bumps, so a new revision reads it again and no explicit invalidation is needed. The position
+    limits and costs come from the rules cache and the treasury from the team, so only the roster is cached.
+    The hire form, the roster page and the API all read the slots from here. They only guide the user:
+    the hire services check the position limits and numbers again in the database.
+    """
+
+    def __init__(self, team, roster, rules=None):
+        """
+        Initialize the slots of 'team' from its roster, given as (number, position_id) pairs.
+        """
+        self.team = team
+        self.rules = rules or get_rules()
+        self.roster = roster
+        taken_numbers = {number for number, _ in roster}
+        self.free_numbers = [number for number in ROSTER_NUMBERS if number not in taken_numbers]
+        self.position_counts = {}
+        for _, position_id in roster:
+            self.position_counts[position_id] = self.position_counts.get(position_id, 0) + 1
+
+    @staticmethod
+    def cache_key(team):
+        """
+        Returns the cache key of the roster of the team at its current revision.
+        """
+        return f'bbm_app:slots:{team.pk}:{team.revision}'
+
+    @classmethod
+    def for_team(cls, team):
+        """
+        Returns the slots of the team, reading its roster from the cache or, after a roster change,
+        with one query.
+        """
+        key = cls.cache_key(team)
+        roster = cache.get(key)
+        if roster is None:
+            roster = list(Player.objects.filter(player_team=team).values_list('number', 'position_id'))
+            cache.set(key, roster, SLOTS_CACHE_TIMEOUT)
+        return cls(team, roster)
+
+    @property
+    def positions(self):
+        """
+        Returns the positions of the race of the team, ordered by primary key.
+        """
+        return self.rules.positions_for_race(self.team.race_id)
+
+    def remaining(self, position):
+        """
+        Returns how many more players the team may have at 'position', or None when the race has no limit.
+        """
+        max_count = self.rules.position_limit(self.team.race_id, position.pk)
+        if max_count is None:
+            return None
+        return max(max_count - self.position_counts.get(position.pk, 0), 0)
+
+    def affordable(self, position):
+        """
+        Returns True when the treasury of the team covers the cost of 'position'.
+        """
+        return position.cost <= self.team.treasury
+
+    def errors(self, position):
+        """
+        Returns the reasons the team cannot hire a player at 'position', empty when it can.
+        """
+        errors = []
+        if not self.affordable(position):
+            errors.append('Insufficient funds.')
+        if self.remaining(position) == 0:
+            errors.append('Maximum number of this position has been reached for the team.')
+        return errors
+
+    def available(self):
+        """
+        Returns a list of (position, remaining count, affordable) for every position of the race of the team.
+        """
+        return [(position, self.remaining(position), self.affordable(position)) for position in self.positions]
+
+    def as_dict(self):
+        """
+        Returns the slots as a JSON serializable dict.
+        """
+        return {
+            'free_numbers': self.free_numbers,
+            'treasury': self.team.treasury,
+            'positions': [{'id': position.pk, 'name': position.name, 'cost': position.cost,
+                           'remaining': remaining, 'affordable': affordable}
+                          for position, remaining, affordable in self.available()],
+        }
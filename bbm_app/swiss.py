@@ -0,0 +1,240 @@
+from collections import deque
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import Match, Standing
+
+BYE = None
+
+
+class PairingError(Exception):
+    """
+    Raised when no pairing exists that avoids rematches and same coach or same club games.
+    """
+
+
+class SwissEntrant:
+    """
+    A team taking part in a Swiss round: its standing, team value and the coach and club it may not be
+    paired against.
+    """
+
+    def __init__(self, team_id, points=0, tiebreakers=(), ctv=0, coach_id=None, club='', had_bye=False):
+        """
+        Initialize the entrant. 'tiebreakers' is a tuple compared after 'points', higher is better.
+        """
+        self.team_id = team_id
+        self.points = points
+        self.tiebreakers = tuple(tiebreakers)
+        self.ctv = ctv
+        self.coach_id = coach_id
+        self.club = club
+        self.had_bye = had_bye
+
+    def __repr__(self):
+        """
+        Returns a debugging representation of the entrant.
+        """
+        return f'SwissEntrant(team_id={self.team_id!r}, points={self.points!r})'
+
+
+def pair_round(entrants, played_pairs=()):
+    """
+    Pairs the entrants of a Swiss round and returns a list of (home team id, away team id) pairs,
+    where the away team id is None for the bye.
+
+    Entrants are ranked by points, tiebreakers and team id. Two entrants may only meet if they have not
+    played each other ('played_pairs' holds (team id, team id) tuples in any order) and do not share
+    a coach or a non-empty club. With an odd number of entrants the bye goes to the lowest ranked
+    entrant that has not had one yet.
+
+    Every entrant is first paired greedily, top down, with the closest unpaired opponent: fewest points
+    apart, then closest team value, then closest rank. Entrants left over are then paired by growing
+    augmenting paths in the compatibility graph (Edmonds' blossom algorithm), which re-pairs as few
+    entrants as needed and finds a full pairing whenever one exists. Ties are always broken by rank,
+    so the result is deterministic. Raises PairingError if no full pairing exists.
+    """
+    ranked = sorted(entrants, key=lambda entrant: (-entrant.points, tuple(-t for t in entrant.tiebreakers),
+                                                   entrant.team_id))
+    count = len(ranked)
+    if count % 2:
+        ranked.append(BYE)
+    size = len(ranked)
+    adjacency = _compatibility_graph(ranked, played_pairs)
+    match = _greedy_pairing(ranked, adjacency)
+    for root in range(size):
+        if match[root] == -1:
+            _augment(adjacency, match, root)
+    unpaired = [ranked[i] for i in range(size) if match[i] == -1 and ranked[i] is not BYE]
+    if unpaired:
+        raise PairingError(f'No valid pairing for {", ".join(str(entrant.team_id) for entrant in unpaired)}.')
+
+    pairs = []
+    for i in range(size):
+        j = match[i]
+        if i < j:
+            home, away = ranked[i], ranked[j]
+            if home is BYE:
+                home, away = away, home
+            pairs.append((home.team_id, away.team_id if away is not BYE else None))
+    return pairs
+
+
+def _compatibility_graph(ranked, played_pairs):
+    """
+    Returns the adjacency lists of the compatibility graph of the ranked entrants: adjacency[i] lists,
+    in rank order, every j that i may be paired with.
+    """
+    opponents = {}
+    for a, b in played_pairs:
+        opponents.setdefault(a, set()).add(b)
+        opponents.setdefault(b, set()).add(a)
+    size = len(ranked)
+    adjacency = [[] for _ in range(size)]
+    for i, a in enumerate(ranked):
+        if a is BYE:
+            continue
+        played = opponents.get(a.team_id, ())
+        for j in range(i + 1, size):
+            b = ranked[j]
+            if b is BYE:
+                compatible = not a.had_bye
+            else:
+                compatible = (b.team_id not in played
+                              and (a.coach_id is None or a.coach_id != b.coach_id)
+                              and (not a.club or a.club != b.club))
+            if compatible:
+                adjacency[i].append(j)
+                adjacency[j].append(i)
+    return adjacency
+
+
+def _greedy_pairing(ranked, adjacency):
+    """
+    Pairs every entrant, top down, with the closest compatible unpaired entrant ranked below it.
+    Returns the match list: match[i] is the index paired with i, or -1.
+    """
+    size = len(ranked)
+    match = [-1] * size
+    for i in range(size):
+        if match[i] != -1 or ranked[i] is BYE:
+            continue
+        best, best_cost = -1, None
+        for j in adjacency[i]:
+            if j < i or match[j] != -1:
+                continue
+            if ranked[j] is BYE:
+                cost = (float('inf'), 0)
+            else:
+                cost = (abs(ranked[i].points - ranked[j].points), abs(ranked[i].ctv - ranked[j].ctv))
+            if best_cost is not None and cost[0] > best_cost[0]:
+                break
+            if best_cost is None or cost < best_cost:
+                best, best_cost = j, cost
+        if best != -1:
+            match[i], match[best] = best, i
+    return match
+
+
+def _augment(adjacency, match, root):
+    """
+    Looks for an augmenting path from the unpaired vertex 'root' with Edmonds' blossom algorithm
+    and, if one exists, flips it so 'root' becomes paired. Returns True if the matching grew.
+    """
+    size = len(adjacency)
+    used = [False] * size
+    parent = [-1] * size
+    base = list(range(size))
+    used[root] = True
+    queue = deque([root])
+
+    def lowest_common_ancestor(a, b):
+        seen = [False] * size
+        while True:
+            a = base[a]
+            seen[a] = True
+            if match[a] == -1:
+                break
+            a = parent[match[a]]
+        while True:
+            b = base[b]
+            if seen[b]:
+                return b
+            b = parent[match[b]]
+
+    def mark_path(v, blossom_base, child, blossom):
+        while base[v] != blossom_base:
+            blossom[base[v]] = blossom[base[match[v]]] = True
+            parent[v] = child
+            child = match[v]
+            v = parent[match[v]]
+
+    while queue:
+        v = queue.popleft()
+        for to in adjacency[v]:
+            if base[v] == base[to] or match[v] == to:
+                continue
+            if to == root or (match[to] != -1 and parent[match[to]] != -1):
+                blossom_base = lowest_common_ancestor(v, to)
+                blossom = [False] * size
+                mark_path(v, blossom_base, to, blossom)
+                mark_path(to, blossom_base, v, blossom)
+                for i in range(size):
+                    if blossom[base[i]]:
+                        base[i] = blossom_base
+                        if not used[i]:
+                            used[i] = True
+                            queue.append(i)
+            elif parent[to] == -1:
+                parent[to] = v
+                if match[to] == -1:
+                    while to != -1:
+                        previous = parent[to]
+                        next_to = match[previous]
+                        match[to], match[previous] = previous, to
+                        to = next_to
+                    return True
+                used[match[to]] = True
+                queue.append(match[to])
+    return False
+
+
+def entrants_for_league(league):
+    """
+    Builds the Swiss entrants of a league from its standings, with one query.
+    """
+    rows = (Standing.objects
+            .filter(league=league)
+            .values_list('team_id', 'points', 'touchdowns_for', 'touchdowns_against', 'casualties_for',
+                         'casualties_against', 'strength_of_schedule', 'team__ctv', 'team__coach_id',
+                         'team__coach__club', 'byes'))
+    return [
+        SwissEntrant(team_id, points, (td_for - td_against, cas_for - cas_against, sos), ctv, coach_id, club, byes > 0)
+        for team_id, points, td_for, td_against, cas_for, cas_against, sos, ctv, coach_id, club, byes in rows
+    ]
+
+
+def played_pairs_for_league(league):
+    """
+    Returns the (home team id, away team id) pairs of every match of the league, played or scheduled.
+    """
+    return league.matches.values_list('home_team_id', 'away_team_id')
+
+
+@transaction.atomic
+def pair_next_round(league):
+    """
+    Pairs the next Swiss round of a league and saves it as scheduled matches.
+    The team with the bye has its bye counted in its standings row. Returns the created matches.
+    """
+    pairs = pair_round(entrants_for_league(league), played_pairs_for_league(league))
+    last_round = league.matches.order_by('-round_number').values_list('round_number', flat=True).first() or 0
+    matches = Match.objects.bulk_create([
+        Match(league=league, round_number=last_round + 1, home_team_id=home, away_team_id=away)
+        for home, away in pairs if away is not None
+    ])
+    bye_teams = [home for home, away in pairs if away is None]
+    if bye_teams:
+        Standing.objects.filter(league=league, team_id__in=bye_teams).update(byes=F('byes') + 1)
+    return matches
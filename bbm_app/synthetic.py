@@ -0,0 +1,233 @@
+import random
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .matches import STANDING_FIELDS, expected_standings
+from .models import Coach, League, Match, Player, Standing, Team
+from .rules import get_rules
+from .scheduling import round_robin
+from .services import add_position_links, new_player
+
+CHUNK_SIZE = 5000
+INJURED_RATE = 0.08
+DEAD_RATE = 0.04
+FIRST_NAMES = ('Grom', 'Ulf', 'Karla', 'Snik', 'Borin', 'Thrud', 'Elia', 'Morg', 'Varag', 'Lothar', 'Skrit',
+               'Hilda', 'Griff', 'Zug', 'Anya', 'Dorn', 'Fenn', 'Ragna', 'Kroxi', 'Nuffle')
+LAST_NAMES = ('Bonecrusher', 'Oberwald', 'Quickfoot', 'Ironhide', 'Skullsplitter', 'Greenthumb', 'Stormcrow',
+              'Grimjaw', 'Longstride', 'Deathroller', 'Fleetfoot', 'Blackmane', 'Gutripper', 'Swiftwind')
+
+
+class GenerationReport:
+    """
+    The number of rows of each kind created by generate_league.
+    """
+
+    def __init__(self):
+        """
+        Initialize the report with every count at zero.
+        """
+        self.coaches = 0
+        self.teams = 0
+        self.players = 0
+        self.injured = 0
+        self.dead = 0
+        self.matches = 0
+
+    def __str__(self):
+        """
+        Returns a one line summary of the report.
+        """
+        return (f'{self.coaches} coaches, {self.teams} teams, {self.players} players '
+                f'({self.injured} injured, {self.dead} dead), {self.matches} matches')
+
+
+def _chunks(items, size):
+    """
+    Yields lists of at most 'size' items.
+    """
+    items = iter(items)
+    while chunk := list(islice(items, size)):
+        yield chunk
+
+
+def draw_team(rng, rules, coach, team_name, race_ids):
+    """
+    Returns a new, unsaved team of the coach with a random race among 'race_ids', treasury and staff.
+    """
+    race_id = rng.choice(race_ids)
+    return Team(
+        coach=coach,
+        team_name=team_name,
+        race_id=race_id,
+        treasury=rng.randrange(0, 200001, 5000),
+        team_re_roll=rng.randint(0, 4),
+        fan_factor=rng.randint(1, 6),
+        apothecary=rules.races[race_id].has_apothecary and rng.random() < 0.5,
+        assistant_coaches=rng.randint(0, 3),
+        cheerleaders=rng.randint(0, 3),
+    )
+
+
+def draw_roster(rng, rules, race_id):
+    """
+    Returns a random roster for the race as a list of positions, one per shirt number, between 11 and 16
+    players long, respecting the position limits of the race.
+    """
+    positions = rules.positions_for_race(race_id)
+    counts = dict.fromkeys((position.pk for position in positions), 0)
+    roster = []
+    for _ in range(rng.randint(11, 16)):
+        available = [position for position in positions
+                     if rules.position_limit(race_id, position.pk) is None
+                     or counts[position.pk] < rules.position_limit(race_id, position.pk)]
+        if not available:
+            break
+        # Positions with a high limit (linemen) are drawn more often, as on real rosters.
+        position = rng.choices(available, weights=[rules.position_limit(race_id, position.pk) or 16
+                                                   for position in available])[0]
+        counts[position.pk] += 1
+        roster.append(position)
+    return roster
+
+
+def draw_player(rng, rules, team, number, position):
+    """
+    Returns a new, unsaved player with random experience and status, and the extra skills it earned
+    as a list of skill ids. Injured players are not counted in the team value, dead ones are in the
+    graveyard of their team.
+    """
+    player = new_player(team, f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}', number, position)
+    player.spp = int(rng.expovariate(1 / 12))
+    player.check_level_up()
+    player.value = player.calculate_value(rules)
+    roll = rng.random()
+    if roll < DEAD_RATE:
+        player.status = 'dead'
+        player.graveyard = team
+    elif roll < DEAD_RATE + INJURED_RATE:
+        player.status = 'injured'
+        player.niggling_injuries = rng.randint(0, 1)
+    known = set(rules.starting_skills.get(position.pk, []))
+    extra_skills = []
+    for _ in range(player.level - 1):
+        choices = [skill_id for category_id in rules.primary_categories.get(position.pk, [])
+                   for skill_id in rules.category_skills.get(category_id, []) if skill_id not in known]
+        if choices:
+            skill_id = rng.choice(choices)
+            known.add(skill_id)
+            extra_skills.append(skill_id)
+    return player, extra_skills
+
+
+def _create_teams(rng, rules, teams, report):
+    """
+    Draws the rosters of a chunk of unsaved teams, sets their team values and creates the teams,
+    their players and the players' skills, traits and skill categories in bulk.
+    """
+    rosters = []
+    for team in teams:
+        players = [draw_player(rng, rules, team, number, position)
+                   for number, position in enumerate(draw_roster(rng, rules, team.race_id), start=1)]
+        team.ctv = team.staff_value + sum(player.ctv_contribution for player, _ in players)
+        rosters.append(players)
+    Team.objects.bulk_create(teams)
+    players = [player for roster in rosters for player, _ in roster]
+    extra_skills = [skills for roster in rosters for _, skills in roster]
+    Player.objects.bulk_create(players)
+    add_position_links(players, rules)
+    Player.skills.through.objects.bulk_create([
+        Player.skills.through(player_id=player.pk, skill_id=skill_id)
+        for player, skills in zip(players, extra_skills) for skill_id in skills
+    ])
+    report.teams += len(teams)
+    report.players += len(players)
+    report.injured += sum(player.status == 'injured' for player in players)
+    report.dead += sum(player.status == 'dead' for player in players)
+
+
+def _play_matches(rng, league, rounds, chunk_size=CHUNK_SIZE):
+    """
+    Creates the played matches of the first 'rounds' rounds of a round robin between the teams of the league,
+    with random results, then sets the standings and the wins, draws and losses of the teams from them.
+    Matches, standings and teams are written in chunks of 'chunk_size' rows.
+    """
+    team_ids = list(league.standings.order_by('team_id').values_list('team_id', flat=True))
+    now = timezone.now()
+    matches = []
+    for round_number, home, away in round_robin(team_ids):
+        if round_number > rounds:
+            break
+        matches.append(Match(
+            league=league, round_number=round_number, home_team_id=home, away_team_id=away, status='played',
+            home_score=rng.choice((0, 0, 1, 1, 1, 2, 2, 3)), away_score=rng.choice((0, 0, 1, 1, 1, 2, 2, 3)),
+            home_casualties=rng.randint(0, 3), away_casualties=rng.randint(0, 3),
+            home_winnings=rng.randrange(20000, 100001, 10000), away_winnings=rng.randrange(20000, 100001, 10000),
+            played_at=now, processed=True,
+        ))
+    for chunk in _chunks(matches, chunk_size):
+        Match.objects.bulk_create(chunk)
+
+    expected = expected_standings(league)
+    standings = list(league.standings.all())
+    for standing in standings:
+        for field, value in expected[standing.team_id].items():
+            setattr(standing, field, value)
+    Standing.objects.bulk_update(standings, STANDING_FIELDS, batch_size=chunk_size)
+    teams = list(Team.objects.filter(leagues=league).only('pk'))
+    for team in teams:
+        team.wins, team.draws, team.losses = (expected[team.pk][field] for field in ('wins', 'draws', 'losses'))
+    Team.objects.bulk_update(teams, ['wins', 'draws', 'losses'], batch_size=chunk_size)
+    return len(matches)
+
+
+@transaction.atomic
+def generate_league(name, coaches, teams_per_coach, rounds=5, seed=None, chunk_size=CHUNK_SIZE):
+    """
+    Fills the database with a synthetic league called 'name' for load and scale testing: 'coaches' coaches
+    with 'teams_per_coach' teams each, rosters drawn from the race positions and limits of the rules data,
+    with experienced, injured and dead players, and the played matches of 'rounds' rounds.
+
+    Everything is written with bulk inserts of at most 'chunk_size' rows, and the same seed gives the
+    same data. Raises ValueError when the rules data is not loaded or the names are already taken.
+    """
+    rng = random.Random(seed)
+    rules = get_rules()
+    race_ids = sorted(race_id for race_id, positions in rules.race_positions.items() if positions)
+    if not race_ids:
+        raise ValueError('No race has positions, load the rules data first.')
+    if League.objects.filter(name=name).exists():
+        raise ValueError(f'League {name} already exists.')
+    User = get_user_model()
+    prefix = name.lower().replace(' ', '_')
+    usernames = [f'{prefix}_coach_{index}' for index in range(1, coaches + 1)]
+    team_names = [f'{name} Team {number}' for number in range(1, coaches * teams_per_coach + 1)]
+    # Every name is checked before the first insert, so a rerun never fails halfway through the bulk inserts.
+    for chunk in _chunks(usernames, chunk_size):
+        if (User.objects.filter(username__in=chunk).exists()
+                or Coach.objects.filter(coach_name__in=chunk).exists()):
+            raise ValueError(f'Coaches of {name} already exist.')
+    for chunk in _chunks(team_names, chunk_size):
+        if Team.objects.filter(team_name__in=chunk).exists():
+            raise ValueError(f'Teams of {name} already exist.')
+
+    report = GenerationReport()
+    password = make_password(None)
+    created_coaches = []
+    for chunk in _chunks(usernames, chunk_size):
+        users = User.objects.bulk_create([User(username=username, password=password) for username in chunk])
+        created_coaches += Coach.objects.bulk_create([Coach(user=user, coach_name=user.username) for user in users])
+    report.coaches = len(created_coaches)
+
+    league = League.objects.create(name=name)
+    # Every team is drawn before any roster, so the data does not depend on the chunk size.
+    teams = [draw_team(rng, rules, coach, team_names[index * teams_per_coach + number], race_ids)
+             for index, coach in enumerate(created_coaches) for number in range(teams_per_coach)]
+    for chunk in _chunks(teams, max(chunk_size // 16, 1)):
+        _create_teams(rng, rules, chunk, report)
+        Standing.objects.bulk_create([Standing(league=league, team=team) for team in chunk])
+    report.matches = _play_matches(rng, league, rounds, chunk_size)
+    return report
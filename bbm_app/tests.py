@@ -1,8 +1,43 @@
+import asyncio
+import csv
+import inspect
+import itertools
+import json
+import os
 import pytest
+import random
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+from io import StringIO
+from asgiref.sync import sync_to_async
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+from django.db.models.deletion import Collector
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth.models import User
-from .models import Coach, Team, RacePositionLimit, Player
-from .forms import SelectTeamForm
+from .models import Coach, Team, RacePositionLimit, Player, Skill, Trait, Race, Position, League, LeagueEvent, Match, \
+    TeamHistory
+from . import budgets, history, progression, query_plans, server_benchmark, services, simulation
+from .advancement import advancements, get_engine, legal_picks
+from .archive import archive_dead_players, fire_player, graveyard, retire_player
+from .auth import COACH_SESSION_KEY, CoachBackend
+from .events import EVENT_RETENTION, event_stream, format_event, publish
+from .exports import stream_export
+from .imports import import_teams
+from .history import record_team_values, team_history
+from .forms import AddPlayerForm, SelectTeamForm
+from .matches import STANDING_FIELDS, MatchAlreadyPlayed, expected_standings, record_match_result
+from .rules import get_rules
+from .scheduling import generate_fixtures, round_robin
+from .slots import RosterSlots
+from .swiss import PairingError, SwissEntrant, pair_next_round, pair_round
 
 
 @pytest.mark.django_db
@@ -318,3 +353,1428 @@ def test_select_team_view(logged_in_client, test_team):
     response = logged_in_client.post(reverse('select_team'), data=form_data)
     assert response.status_code == 302
     assert response.url == reverse('manage_team', args=[test_team.pk])
+
+
+def test_ctv_follows_player_changes(test_team, test_position):
+    """
+    Test that the stored team value follows hiring, injuring, re-valuing and firing players.
+
+    After every change the stored value must match a full recomputation.
+    """
+    player = Player.objects.create(name='Player One', number=1, position=test_position, value=50000,
+                                   player_team=test_team)
+    test_team.refresh_from_db()
+    assert test_team.ctv == 50000
+
+    player = Player.objects.get(pk=player.pk)
+    player.value = 70000
+    player.save()
+    test_team.refresh_from_db()
+    assert test_team.ctv == 70000
+
+    player.status = 'injured'
+    player.save()
+    test_team.refresh_from_db()
+    assert test_team.ctv == 0
+
+    player.status = 'active'
+    player.save()
+    player.delete()
+    test_team.refresh_from_db()
+    assert test_team.ctv == 0
+    assert test_team.verify_ctv()
+
+
+def test_ctv_staff_purchase_keeps_player_value(test_team, test_position):
+    """
+    Test that saving a team with a stale in-memory team value only applies the staff delta
+    and does not overwrite player value written in the meantime.
+    """
+    Player.objects.create(name='Player One', number=1, position=test_position, value=50000,
+                          player_team_id=test_team.pk)
+    test_team.cheerleaders += 1
+    test_team.save()
+    test_team.refresh_from_db()
+    assert test_team.ctv == 60000
+    assert test_team.verify_ctv()
+
+
+def test_ctv_save_does_not_scan_roster(test_team, test_position, django_assert_num_queries,
+                                       django_capture_on_commit_callbacks):
+    """
+    Test that buying staff does not load the players of the team: one query for the rules data version
+    and one update, then five once committed to record the history point (savepoint, history rows,
+    team values, insert, release).
+    """
+    for number in range(1, 5):
+        Player.objects.create(name=f'Player {number}', number=number, position=test_position, value=50000,
+                              player_team=test_team)
+    team = Team.objects.get(pk=test_team.pk)
+    get_rules()
+    team.cheerleaders += 1
+    with django_assert_num_queries(7), django_capture_on_commit_callbacks(execute=True):
+        team.save()
+
+
+def test_verify_ctv_fix(test_team):
+    """
+    Test that verify_ctv detects a wrong stored team value and fixes it on request.
+    """
+    Team.objects.filter(pk=test_team.pk).update(ctv=12345)
+    test_team.refresh_from_db()
+    assert not test_team.verify_ctv()
+    assert not test_team.verify_ctv(fix=True)
+    test_team.refresh_from_db()
+    assert test_team.ctv == 0
+    assert test_team.verify_ctv()
+
+
+def add_roster_players(team, position, numbers):
+    """
+    Helper creating players with a skill and a trait for the given shirt numbers.
+    """
+    skill, _ = Skill.objects.get_or_create(name='Block')
+    trait, _ = Trait.objects.get_or_create(name='Loner')
+    for number in numbers:
+        player = Player.objects.create(name=f'Player {number}', number=number, position=position, value=50000,
+                                       player_team=team)
+        player.skills.add(skill)
+        player.traits.add(trait)
+
+
+def test_manage_team_query_count_does_not_grow_with_roster(logged_in_client, test_team, test_position,
+                                                           test_race_position_limit):
+    """
+    Test that the roster page runs the same, bounded number of queries for a small and a full roster.
+    """
+    url = reverse('manage_team', args=[test_team.pk])
+    add_roster_players(test_team, test_position, [1])
+    get_rules()
+    with CaptureQueriesContext(connection) as small_roster:
+        response = logged_in_client.get(url)
+    assert response.status_code == 200
+
+    add_roster_players(test_team, test_position, range(2, 17))
+    with CaptureQueriesContext(connection) as full_roster:
+        response = logged_in_client.get(url)
+    assert response.status_code == 200
+    assert 'Player 16' in response.content.decode()
+
+    assert len(full_roster) == len(small_roster)
+    assert len(full_roster) <= 7
+
+
+def test_rules_cache_is_invalidated_on_save(test_race):
+    """
+    Test that the cached rules data is reused between calls and rebuilt after a rules table is edited.
+    """
+    cached = get_rules()
+    assert get_rules() is cached
+    assert cached.races[test_race.pk].reroll_cost == 0
+
+    test_race.reroll_cost = 50000
+    test_race.save()
+    assert get_rules() is not cached
+    assert get_rules().races[test_race.pk].reroll_cost == 50000
+
+
+def test_rules_signals_leave_other_models_fast_deletable(test_race, test_position):
+    """
+    Test that the rules cache receivers only listen to the rules tables, so other tables and the rules
+    link tables are still deleted in bulk, while deleting a rules row still invalidates the cache.
+    """
+    collector = Collector(using='default')
+    assert collector.can_fast_delete(LeagueEvent.objects.all())
+    assert collector.can_fast_delete(Position.traits.through.objects.all())
+    cached = get_rules()
+    Trait.objects.create(name='Stunty').delete()
+    assert get_rules() is not cached
+
+
+def test_rules_cache_knows_position_limits(test_race, test_position, test_race_position_limit):
+    """
+    Test that the cached rules data exposes the positions and limits of a race.
+    """
+    rules = get_rules()
+    assert rules.positions_for_race(test_race.pk) == [test_position]
+    assert rules.position_limit(test_race.pk, test_position.pk) == 4
+
+
+def test_add_player_form_uses_cached_rules(test_team, test_position, test_race_position_limit,
+                                           django_assert_num_queries):
+    """
+    Test that building and validating AddPlayerForm reads the roster once and then only the cached slots.
+    """
+    get_rules()
+    data = {'name': 'Player One', 'number': 1, 'position': test_position.pk}
+    with django_assert_num_queries(1):
+        form = AddPlayerForm(data, team=test_team)
+        assert form.is_valid()
+    with django_assert_num_queries(0):
+        form = AddPlayerForm(data, team=test_team)
+        assert form.is_valid()
+
+
+@pytest.mark.django_db
+def test_load_rules_bulk_loads_all_data(django_assert_max_num_queries):
+    """
+    Test that load_rules loads every rules file with a bounded number of queries
+    and that running it a second time changes nothing.
+    """
+    with django_assert_max_num_queries(40):
+        call_command('load_rules', stdout=StringIO())
+    assert Race.objects.count() == 24
+    assert Position.objects.count() == RacePositionLimit.objects.count() == 117
+    human_thrower = Position.objects.get(name='Human Thrower', race__race_type='HUM')
+    assert set(human_thrower.starting_skills.values_list('name', flat=True)) == {'Pass', 'Sure Hands'}
+    assert human_thrower.primary_skill_categories.count() == 2
+
+    out = StringIO()
+    call_command('load_rules', stdout=out)
+    assert Position.objects.count() == 117
+    assert 'positions: 0' in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_load_rules_dry_run_saves_nothing():
+    """
+    Test that a dry run of load_rules reports what it would load but leaves the database empty.
+    """
+    out = StringIO()
+    call_command('load_rules', '--dry-run', '--timings', stdout=out)
+    assert 'races: 24' in out.getvalue()
+    assert 'total:' in out.getvalue()
+    assert not Race.objects.exists()
+    assert not Skill.objects.exists()
+
+
+def test_buy_cheerleader_fails_without_funds(test_team):
+    """
+    Test that a purchase the treasury cannot cover fails without changing the team.
+    """
+    Team.objects.filter(pk=test_team.pk).update(treasury=5000)
+    result = services.buy_cheerleader(test_team)
+    assert not result
+    assert result.message == 'Insufficient funds.'
+    test_team.refresh_from_db()
+    assert test_team.treasury == 5000
+    assert test_team.cheerleaders == 0
+
+
+def test_buy_reroll_uses_stored_treasury(test_team):
+    """
+    Test that a purchase is checked against the treasury in the database, not a stale in-memory copy.
+    """
+    test_team.race.reroll_cost = 50000
+    test_team.race.save()
+    Team.objects.filter(pk=test_team.pk).update(treasury=0)
+    assert not services.buy_reroll(test_team)
+    assert test_team.treasury == 0
+    assert test_team.team_re_roll == 0
+
+
+def test_hire_player_reports_taken_number(test_team, test_position, test_race_position_limit):
+    """
+    Test that hiring onto a taken number fails, refunds nothing twice and does not raise IntegrityError.
+    """
+    assert services.hire_player(test_team, 'Player One', test_position, 1)
+    result = services.hire_player(test_team, 'Player Two', test_position, 1)
+    assert not result
+    assert result.message == 'Number 1 is already taken.'
+    test_team.refresh_from_db()
+    assert test_team.treasury == 1000000 - test_position.cost
+    assert test_team.ctv == test_position.cost
+    assert test_team.players.count() == 1
+
+
+def test_hire_player_picks_free_number(test_team, test_position, test_race_position_limit):
+    """
+    Test that hiring without a number uses the lowest free one.
+    """
+    services.hire_player(test_team, 'Player One', test_position, 1)
+    result = services.hire_player(test_team, 'Player Two', test_position)
+    assert result.player.number == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_purchases_never_overspend(test_team):
+    """
+    Test that many threads buying cheerleaders at once never spend more than the treasury holds.
+
+    Every thread uses its own database connection. Purchases that lose a race on the team row,
+    or are refused by the database lock, must leave the treasury untouched.
+    """
+    Team.objects.filter(pk=test_team.pk).update(treasury=3 * services.CHEERLEADER_COST)
+    barrier = threading.Barrier(8)
+    results = []
+
+    def buy():
+        team = Team.objects.get(pk=test_team.pk)
+        barrier.wait()
+        try:
+            results.append(bool(services.buy_cheerleader(team)))
+        except OperationalError:
+            results.append(False)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=buy) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    test_team.refresh_from_db()
+    successes = results.count(True)
+    assert 1 <= successes <= 3
+    assert test_team.cheerleaders == successes
+    assert test_team.treasury == (3 - successes) * services.CHEERLEADER_COST
+    assert test_team.ctv == successes * services.CHEERLEADER_COST
+
+
+def batch_hire_data(rows):
+    """
+    Helper building the POST data of the batch hire formset from (name, number, position pk) rows.
+    """
+    data = {'form-TOTAL_FORMS': '16', 'form-INITIAL_FORMS': '0', 'form-MIN_NUM_FORMS': '0',
+            'form-MAX_NUM_FORMS': '16'}
+    for index, (name, number, position_pk) in enumerate(rows):
+        data[f'form-{index}-name'] = name
+        data[f'form-{index}-number'] = number
+        data[f'form-{index}-position'] = position_pk
+    return data
+
+
+def test_batch_hire_creates_roster(logged_in_client, test_team, test_position, test_race_position_limit):
+    """
+    Test that the batch hire view hires every filled row, charges the treasury once and
+    copies the starting skills of the position.
+    """
+    skill = Skill.objects.create(name='Block')
+    test_position.starting_skills.add(skill)
+    rows = [(f'Player {number}', number, test_position.pk) for number in range(1, 5)]
+    response = logged_in_client.post(reverse('batch_hire', args=[test_team.pk]), batch_hire_data(rows))
+    assert response.status_code == 302
+
+    test_team.refresh_from_db()
+    assert test_team.players.count() == 4
+    assert test_team.treasury == 1000000 - 4 * test_position.cost
+    assert test_team.ctv == 4 * test_position.cost
+    assert test_team.verify_ctv()
+    assert Player.skills.through.objects.filter(skill=skill).count() == 4
+
+
+def test_batch_hire_rejects_whole_batch_over_position_limit(logged_in_client, test_team, test_position,
+                                                            test_race_position_limit):
+    """
+    Test that a batch exceeding a position limit hires nobody and reports the offending row.
+    """
+    rows = [(f'Player {number}', number, test_position.pk) for number in range(1, 6)]
+    response = logged_in_client.post(reverse('batch_hire', args=[test_team.pk]), batch_hire_data(rows))
+    assert response.status_code == 200
+    assert 'Maximum number of this position has been reached' in response.content.decode()
+    assert not test_team.players.exists()
+
+
+def test_hire_players_query_count_does_not_grow(test_team, test_position, test_race_position_limit,
+                                                django_assert_max_num_queries, django_capture_on_commit_callbacks):
+    """
+    Test that hiring a batch of players runs a fixed number of queries.
+    """
+    entries = [{'name': f'Player {number}', 'number': number, 'position': test_position} for number in range(1, 5)]
+    get_rules()
+    # Includes the five queries recording the history point once committed.
+    with django_assert_max_num_queries(11), django_capture_on_commit_callbacks(execute=True):
+        result = services.hire_players(test_team, entries)
+    assert result
+    assert len(result.players) == 4
+
+
+def make_team(name, race):
+    """
+    Helper creating a coach and a team with the given name.
+    """
+    user = User.objects.create_user(username=name, password='password123')
+    coach = Coach.objects.create(user=user, coach_name=name)
+    return Team.objects.create(coach=coach, race=race, team_name=name)
+
+
+@pytest.fixture
+def test_league(test_team, test_race):
+    """Create a league with the test team and three more teams."""
+    league = League.objects.create(name='Test League')
+    league.add_team(test_team)
+    for name in ('Second', 'Third', 'Fourth'):
+        league.add_team(make_team(name, test_race))
+    return league
+
+
+def test_standings_follow_recorded_results(test_league):
+    """
+    Test that the incrementally maintained standings, including strength of schedule,
+    match a recomputation after every recorded result.
+    """
+    teams = list(test_league.teams.order_by('pk'))
+    results = [(0, 1, 2, 1), (2, 3, 0, 0), (0, 2, 1, 1), (1, 3, 0, 3), (0, 3, 1, 0), (1, 2, 2, 2), (1, 0, 1, 0)]
+    for home, away, home_score, away_score in results:
+        match = Match.objects.create(league=test_league, home_team=teams[home], away_team=teams[away])
+        record_match_result(match, home_score, away_score, home_casualties=home_score, away_casualties=1)
+        expected = expected_standings(test_league)
+        for standing in test_league.standings.all():
+            assert {field: getattr(standing, field) for field in STANDING_FIELDS} == expected[standing.team_id]
+
+    teams[0].refresh_from_db()
+    assert (teams[0].wins, teams[0].draws, teams[0].losses) == (2, 1, 1)
+
+
+def test_record_match_result_only_once(test_league, test_team, test_position):
+    """
+    Test that recording a result records the SPP awards and that the same match cannot be recorded twice.
+    """
+    player = Player.objects.create(name='Player One', number=1, position=test_position, value=50000,
+                                   player_team=test_team)
+    opponent = test_league.teams.exclude(pk=test_team.pk).first()
+    match = Match.objects.create(league=test_league, home_team=test_team, away_team=opponent)
+    record_match_result(match, 1, 0, home_winnings=50000, spp_awards={player: 3})
+    with pytest.raises(MatchAlreadyPlayed):
+        record_match_result(match, 1, 0, spp_awards={player: 3})
+
+    test_team.refresh_from_db()
+    assert match.spp_awards.get().spp == 3
+    assert test_team.treasury == 1050000
+    assert test_league.standings.get(team=test_team).points == 3
+
+
+def test_record_match_result_view(logged_in_client, test_league, test_team):
+    """
+    Test that a coach of one of the teams can record a result and is redirected to the standings.
+    """
+    opponent = test_league.teams.exclude(pk=test_team.pk).first()
+    match = Match.objects.create(league=test_league, home_team=opponent, away_team=test_team)
+    data = {'home_score': 0, 'away_score': 2, 'home_casualties': 0, 'away_casualties': 1,
+            'home_winnings': 0, 'away_winnings': 0}
+    response = logged_in_client.post(reverse('record_match_result', args=[test_league.pk, match.pk]), data)
+    assert response.status_code == 302
+    assert response.url == reverse('standings', args=[test_league.pk])
+
+    response = logged_in_client.get(response.url)
+    assert list(response.context['standings'])[0].team == test_team
+
+
+def test_record_match_result_and_import_views_require_login_first(test_league):
+    """
+    Test that an anonymous user is sent to the login page without the match or league being looked up,
+    so the views do not tell which matches and leagues exist.
+    """
+    for url in (reverse('record_match_result', args=[test_league.pk, 999999]),
+                reverse('import_teams', kwargs={'league_pk': 999999})):
+        response = Client().get(url)
+        assert response.status_code == 302
+        assert response.url.startswith(reverse('login'))
+
+
+@pytest.mark.parametrize('team_count', [2, 5, 8, 9])
+def test_round_robin_plays_every_pairing_once(team_count):
+    """
+    Test that a single round robin plays every pairing exactly once, at most once per round per team,
+    with home and away games balanced.
+    """
+    fixtures = list(round_robin(range(team_count)))
+    assert len({frozenset((home, away)) for _, home, away in fixtures}) == len(fixtures) == \
+        team_count * (team_count - 1) // 2
+    rounds = {}
+    for round_number, home, away in fixtures:
+        rounds.setdefault(round_number, []).extend([home, away])
+    assert all(len(teams) == len(set(teams)) for teams in rounds.values())
+    for team in range(team_count):
+        home_games = sum(1 for _, home, _ in fixtures if home == team)
+        away_games = sum(1 for _, _, away in fixtures if away == team)
+        assert abs(home_games - away_games) <= 1
+
+
+def test_double_round_robin_swaps_home_and_away():
+    """
+    Test that the second half of a double round robin repeats every pairing with home and away swapped.
+    """
+    fixtures = list(round_robin(range(6), double=True))
+    first_half = {(home, away) for round_number, home, away in fixtures if round_number <= 5}
+    second_half = {(away, home) for round_number, home, away in fixtures if round_number > 5}
+    assert first_half == second_half
+
+
+def test_round_robin_is_lazy_for_large_leagues():
+    """
+    Test that a 200 team double round robin is generated lazily, one fixture at a time, and pairs every two
+    teams exactly once per leg, with 100 games per round.
+    """
+    fixtures = round_robin(range(200), double=True)
+    assert inspect.isgenerator(fixtures)
+    first = next(fixtures)
+    assert first[0] == 1
+    games, rounds = Counter(), Counter()
+    for round_number, home, away in itertools.chain([first], fixtures):
+        games[min(home, away), max(home, away)] += 1
+        rounds[round_number] += 1
+    assert len(rounds) == 2 * 199 and set(rounds.values()) == {100}
+    assert len(games) == 200 * 199 // 2 and set(games.values()) == {2}
+
+
+def test_generate_fixtures_skips_same_coach(test_league, test_team, test_race):
+    """
+    Test that generate_fixtures saves the schedule and never pairs two teams of the same coach.
+    """
+    second_team = Team.objects.create(coach=test_team.coach, race=test_race, team_name='Second Test Team')
+    test_league.add_team(second_team)
+    created = generate_fixtures(test_league)
+    assert created == Match.objects.filter(league=test_league).count() == 5 * 4 // 2 - 1
+    assert not Match.objects.filter(home_team__coach=F('away_team__coach')).exists()
+
+
+def test_generate_fixtures_by_division(test_league, test_race):
+    """
+    Test that divisional fixtures only pair teams of the same division.
+    """
+    test_league.standings.filter(team__team_name__in=['Second', 'Fourth']).update(division='North')
+    generate_fixtures(test_league, by_division=True)
+    divisions = dict(test_league.standings.values_list('team_id', 'division'))
+    matches = list(test_league.matches.values_list('home_team_id', 'away_team_id'))
+    assert len(matches) == 2
+    assert all(divisions[home] == divisions[away] for home, away in matches)
+
+
+def test_swiss_pairing_avoids_rematches_and_same_coach():
+    """
+    Test that Swiss pairing pairs by standing, never repeats a game, never pairs teams of the same coach
+    and gives the bye to the lowest ranked entrant without one.
+    """
+    entrants = [SwissEntrant(team_id, points=points, coach_id=team_id) for team_id, points in
+                [(1, 6), (2, 6), (3, 3), (4, 3), (5, 0), (6, 0), (7, 0)]]
+    entrants[5].coach_id = entrants[4].coach_id
+    entrants[6].had_bye = True
+    pairs = pair_round(entrants, played_pairs=[(1, 2), (3, 4)])
+    assert pairs == [(1, 3), (2, 4), (5, 7), (6, None)]
+    assert pair_round(entrants, played_pairs=[(1, 2), (3, 4)]) == pairs
+
+
+def test_swiss_pairing_repairs_greedy_dead_end():
+    """
+    Test that pairing finds a full pairing when pairing the top entrants greedily would leave two entrants
+    that already played each other.
+    """
+    entrants = [SwissEntrant(team_id, points=10 - team_id) for team_id in range(1, 5)]
+    pairs = pair_round(entrants, played_pairs=[(3, 4), (1, 3)])
+    assert sorted(pairs) == [(1, 4), (2, 3)]
+
+
+def test_swiss_pairing_reports_impossible_round():
+    """
+    Test that pairing raises PairingError when every possible game has been played.
+    """
+    entrants = [SwissEntrant(team_id) for team_id in range(1, 5)]
+    played = [(a, b) for a in range(1, 5) for b in range(a + 1, 5)]
+    with pytest.raises(PairingError):
+        pair_round(entrants, played_pairs=played)
+
+
+def late_swiss_round():
+    """
+    Helper returning 500 entrants in a late round in which every entrant has already played up to 400 of the
+    entrants closest to it in the standings, so most candidate games are used and the greedy first choice
+    is almost never available, with the games played.
+    """
+    rng = random.Random(7)
+    entrants = [SwissEntrant(team_id, points=(500 - team_id) // 25, ctv=rng.randrange(900, 1300) * 1000,
+                             coach_id=team_id // 2) for team_id in range(500)]
+    return entrants, [(a, b) for a in range(500) for b in range(a + 1, min(a + 201, 500))]
+
+
+def test_swiss_pairing_late_round_of_a_large_league():
+    """
+    Test that pairing a late round of 500 entrants produces a valid full pairing.
+    """
+    entrants, played = late_swiss_round()
+    pairs = pair_round(entrants, played_pairs=played)
+
+    played = set(played)
+    assert len(pairs) == 250
+    assert len({team for pair in pairs for team in pair}) == 500
+    assert not any((min(a, b), max(a, b)) in played or a // 2 == b // 2 for a, b in pairs)
+
+
+@pytest.mark.benchmark
+def test_swiss_pairing_benchmark_late_round():
+    """
+    Benchmark: pairing a late round of 500 entrants takes well under a second.
+    """
+    entrants, played = late_swiss_round()
+    start = time.perf_counter()
+    pair_round(entrants, played_pairs=played)
+    assert time.perf_counter() - start < 1.0
+
+
+def test_pair_next_round_saves_matches(test_league):
+    """
+    Test that pairing the next round of a league saves its matches.
+    """
+    matches = pair_next_round(test_league)
+    assert len(matches) == 2
+    assert test_league.matches.filter(round_number=1).count() == 2
+
+
+def test_simulation_favours_the_stronger_team():
+    """
+    Test that the simulator gives the stronger, better armoured team the better odds and fewer casualties,
+    that probabilities add up and that a seed makes the results reproducible across chunks.
+    """
+    pytest.importorskip('numpy')
+    strong = simulation.TeamProfile(1, [(6, 4, 3, 10, 3, ['Block', 'Mighty Blow (1+)'])] * 11, re_rolls=3)
+    weak = simulation.TeamProfile(2, [(5, 2, 4, 7, None, [])] * 11)
+    results = simulation.simulate_fixtures([('game', strong, weak)], games=30000, seed=1)
+    result = results['game']
+
+    assert result.games == 30000
+    assert result.home_win_probability + result.draw_probability + result.away_win_probability == pytest.approx(1)
+    assert result.home_win_probability > result.away_win_probability
+    assert result.expected_away_casualties > result.expected_home_casualties
+    assert simulation.simulate_fixtures([('game', strong, weak)], games=30000, seed=1)['game'].as_dict() == \
+        result.as_dict()
+
+
+def test_simulate_round_predicts_every_match(test_league, test_position):
+    """
+    Test that a round is predicted from the team rosters, with the requested number of games per match.
+    """
+    pytest.importorskip('numpy')
+    for team in test_league.teams.all():
+        add_roster_players(team, test_position, range(1, 12))
+    pair_next_round(test_league)
+    results = simulation.simulate_round(test_league, 1, games=10000, seed=3)
+
+    assert len(results) == 2
+    assert all(result.games == 10000 for result in results.values())
+
+
+@pytest.mark.benchmark
+def test_simulate_round_is_fast(test_league, test_position):
+    """
+    Benchmark: predict a round from the team rosters with 10000 games per match in well under a few seconds.
+    """
+    pytest.importorskip('numpy')
+    for team in test_league.teams.all():
+        add_roster_players(team, test_position, range(1, 12))
+    pair_next_round(test_league)
+    start = time.perf_counter()
+    simulation.simulate_round(test_league, 1, games=10000, seed=3)
+    assert time.perf_counter() - start < 3.0
+
+
+def test_process_round_applies_spp_injuries_and_values(test_league, test_position, django_assert_max_num_queries,
+                                                       django_capture_on_commit_callbacks):
+    """
+    Test that the post-match pipeline applies SPP and level-ups, lists the skill picks of the players who
+    levelled up, rolls every casualty, keeps the team values in line with a full recomputation and the custom
+    value of a player it did not change, runs a fixed number of queries and never processes a match twice.
+    """
+    teams = list(test_league.teams.order_by('pk'))
+    for team in teams:
+        add_roster_players(team, test_position, range(1, 17))
+    star = teams[0].players.get(number=1)
+    custom = teams[3].players.get(number=16)
+    custom.value = 55000
+    custom.save()
+    matches = [Match.objects.create(league=test_league, home_team=teams[0], away_team=teams[1]),
+               Match.objects.create(league=test_league, home_team=teams[2], away_team=teams[3])]
+    record_match_result(matches[0], 2, 0, home_casualties=3, away_casualties=1, spp_awards={star: 16})
+    record_match_result(matches[1], 1, 1, home_casualties=2, away_casualties=2)
+    get_rules()
+
+    # Includes one query for the skills of the players who levelled up, and the queries recording
+    # the history points of the teams once committed.
+    with django_assert_max_num_queries(16), django_capture_on_commit_callbacks(execute=True):
+        report = progression.process_round(test_league, 1, seed=5, chunk_size=10)
+
+    star.refresh_from_db()
+    assert report.matches == 2
+    assert len(report.casualties) == 8
+    assert star.spp == 16
+    assert star.level == 3
+    assert star.value == 90000
+    assert Player.objects.get(pk=custom.pk).value == 55000
+    assert report.advancements == ({} if star.status == 'dead' else {star.pk: ([], [])})
+    assert all(team.verify_ctv() for team in Team.objects.filter(pk__in=[team.pk for team in teams]))
+    assert progression.process_round(test_league, 1, seed=5).matches == 0
+
+
+def test_process_round_spares_the_players_who_missed_the_match(test_league, test_position):
+    """
+    Test that the players injured before a match, who missed it, are healed but never rolled as its casualties.
+    """
+    home, away = test_league.teams.order_by('pk')[:2]
+    add_roster_players(home, test_position, range(1, 12))
+    add_roster_players(away, test_position, range(1, 12))
+    Player.objects.filter(player_team=away, number__gt=3).update(status='injured')
+    missed = set(away.players.filter(status='injured').values_list('pk', flat=True))
+    match = Match.objects.create(league=test_league, home_team=home, away_team=away)
+    record_match_result(match, 1, 0, home_casualties=8)
+
+    for seed in range(5):
+        Match.objects.filter(pk=match.pk).update(processed=False)
+        Player.objects.filter(player_team=away).update(status='active', graveyard=None)
+        Player.objects.filter(pk__in=missed).update(status='injured')
+        report = progression.process_matches([match], seed=seed)
+        assert len(report.casualties) == 3
+        assert not {player.pk for player, _ in report.casualties} & missed
+        assert not Player.objects.filter(pk__in=missed).exclude(status='active').exists()
+
+
+def test_team_history_is_compact_and_filters_by_range(test_team):
+    """
+    Test that value changes are stored as delta-encoded points, only when a value changed,
+    and that range queries return exactly the points in the range.
+    """
+    start = timezone.now().replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+    for hour in range(200):
+        Team.objects.filter(pk=test_team.pk).update(treasury=F('treasury') - 10000 * (hour % 3),
+                                                    ctv=F('ctv') + 10000 * (hour % 3))
+        record_team_values([test_team.pk], now=start + timedelta(hours=hour))
+
+    row = test_team.history.get()
+    points = team_history(test_team)
+    test_team.refresh_from_db()
+    assert row.point_count == len(points) == 134
+    assert len(bytes(row.data)) <= 6 * row.point_count
+    assert points[-1][1:] == (test_team.ctv, test_team.treasury, test_team.fan_factor)
+    in_range = team_history(test_team, start + timedelta(hours=10), start + timedelta(hours=20))
+    assert [point[0] for point in in_range] == [point[0] for point in points
+                                                if start + timedelta(hours=10) <= point[0] <= start + timedelta(hours=20)]
+
+
+def test_team_history_follows_atomic_blocks(test_team, test_league, monkeypatch, django_capture_on_commit_callbacks):
+    """
+    Test that a change rolled back with its atomic block adds no point at the next commit, and that
+    a team marked in nested blocks is recorded once.
+    """
+    other = test_league.teams.exclude(pk=test_team.pk).first()
+    with django_capture_on_commit_callbacks(execute=True):
+        test_team.track_history()
+        other.track_history()
+    recorded = []
+    record_team_values = history.record_team_values
+
+    def record(team_ids):
+        recorded.append(set(team_ids))
+        record_team_values(team_ids)
+    monkeypatch.setattr(history, 'record_team_values', record)
+
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        try:
+            with transaction.atomic():
+                Team.objects.filter(pk=other.pk).update(treasury=F('treasury') - 10000)
+                other.track_history()
+                raise OperationalError('rolled back')
+        except OperationalError:
+            pass
+        test_team.track_history()
+    assert len(callbacks) == 1
+    assert recorded == [{test_team.pk, other.pk}]
+    assert TeamHistory.objects.get(team=other).point_count == 1
+
+    with django_capture_on_commit_callbacks(execute=True) as callbacks:
+        test_team.track_history()
+        with transaction.atomic():
+            test_team.track_history()
+    assert len(callbacks) == 2
+    assert recorded == [{test_team.pk, other.pk}, {test_team.pk}]
+
+
+def test_team_history_endpoints(logged_in_client, test_team, test_league, django_capture_on_commit_callbacks):
+    """
+    Test that a purchase adds one history point once committed, that the team and league endpoints
+    return the series, and that they only give the treasury of the teams of the logged-in coach.
+    """
+    with django_capture_on_commit_callbacks(execute=True):
+        test_team.save()
+    with django_capture_on_commit_callbacks(execute=True):
+        services.buy_cheerleader(test_team)
+
+    response = logged_in_client.get(reverse('team_history', kwargs={'team_pk': test_team.pk}))
+    assert response.status_code == 200
+    points = response.json()['team']['points']
+    assert [point[1:] for point in points] == [[0, 1000000, 1], [10000, 990000, 1]]
+
+    response = logged_in_client.get(reverse('league_history', kwargs={'league_pk': test_league.pk}),
+                                     {'from': '2000-01-01'})
+    assert response.status_code == 200
+    assert len(response.json()['teams']) == 4
+    with django_capture_on_commit_callbacks(execute=True):
+        for team in test_league.teams.exclude(pk=test_team.pk):
+            team.track_history()
+    teams = logged_in_client.get(reverse('league_history', kwargs={'league_pk': test_league.pk})).json()['teams']
+    assert {team['id']: {point[2] is None for point in team['points']} for team in teams} == {
+        team['id']: {team['id'] != test_team.pk} for team in teams}
+    other = test_league.teams.exclude(pk=test_team.pk).first()
+    points = logged_in_client.get(reverse('team_history', kwargs={'team_pk': other.pk})).json()['team']['points']
+    assert [point[2] for point in points] == [None]
+    response = logged_in_client.get(reverse('league_history', kwargs={'league_pk': test_league.pk}), {'to': 'soon'})
+    assert response.status_code == 400
+
+
+def test_api_roster_etag_follows_team_revision(client, test_team, test_position, django_assert_num_queries):
+    """
+    Test that the roster endpoint answers a matching If-None-Match with a 304 after one query,
+    and that changing a player changes the ETag.
+    """
+    add_roster_players(test_team, test_position, range(1, 6))
+    url = reverse('api_team_players', kwargs={'team_pk': test_team.pk})
+    response = client.get(url)
+    etag = response['ETag']
+    assert response.status_code == 200
+    assert [player['number'] for player in response.json()['results']] == [1, 2, 3, 4, 5]
+
+    with django_assert_num_queries(1):
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 304
+
+    player = test_team.players.get(number=3)
+    player.name = 'Renamed'
+    player.save()
+    response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+    assert response.status_code == 200
+    assert response['ETag'] != etag
+    assert response.json()['results'][2]['name'] == 'Renamed'
+
+
+def test_api_team_treasury_is_private_and_etag_follows_coach_name(logged_in_client, test_team):
+    """
+    Test that only the coach of a team sees its treasury, and that renaming the coach changes the team ETag.
+    """
+    client = Client()
+    url = reverse('api_team', kwargs={'team_pk': test_team.pk})
+    response = client.get(url)
+    assert 'treasury' not in response.json()
+    assert 'treasury' not in client.get(reverse('api_teams')).json()['results'][0]
+    assert logged_in_client.get(url).json()['treasury'] == test_team.treasury
+    assert logged_in_client.get(reverse('api_teams')).json()['results'][0]['treasury'] == test_team.treasury
+    assert logged_in_client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 200
+
+    Coach.objects.filter(pk=test_team.coach_id).update(coach_name='Renamed Coach')
+    response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+    assert response.status_code == 200
+    assert response.json()['coach']['name'] == 'Renamed Coach'
+
+
+def test_api_cursor_pagination(client, test_team, test_position, test_race):
+    """
+    Test that following the 'next' links visits every team and every player exactly once.
+    """
+    for name in ('Second', 'Third', 'Fourth', 'Fifth'):
+        make_team(name, test_race)
+    add_roster_players(test_team, test_position, range(1, 8))
+
+    seen, url = [], reverse('api_teams') + '?limit=2'
+    while url:
+        body = client.get(url).json()
+        seen += [team['id'] for team in body['results']]
+        url = body['next']
+    assert seen == list(Team.objects.order_by('pk').values_list('pk', flat=True))
+
+    numbers, url = [], reverse('api_team_players', kwargs={'team_pk': test_team.pk}) + '?limit=3'
+    while url:
+        body = client.get(url).json()
+        numbers += [player['number'] for player in body['results']]
+        url = body['next']
+    assert numbers == list(range(1, 8))
+    assert client.get(reverse('api_teams'), {'cursor': 'nonsense'}).status_code == 400
+
+
+def test_api_rules_and_coach_endpoints(client, test_team, test_position, test_race_position_limit):
+    """
+    Test that the race, position and coach endpoints return their data.
+    """
+    races = client.get(reverse('api_races')).json()['results']
+    assert races[0]['positions'] == [{'id': test_position.pk, 'max_count': 4}]
+    assert client.get(reverse('api_positions')).json()['results'][0]['cost'] == 50000
+    coach = client.get(reverse('api_coach', kwargs={'coach_pk': test_team.coach_id})).json()
+    assert [team['id'] for team in coach['teams']] == [test_team.pk]
+
+
+def test_async_roster_and_standings_views(client, test_league, test_team, test_position,
+                                          django_assert_max_num_queries):
+    """
+    Test that the async roster and standings pages render with the async ORM and a fixed number of queries.
+    """
+    add_roster_players(test_team, test_position, range(1, 12))
+    with django_assert_max_num_queries(4):
+        response = client.get(reverse('team_roster', kwargs={'team_pk': test_team.pk}))
+    assert response.status_code == 200
+    assert response.context['roster_table'].count('<tr>') == 12
+    response = client.get(reverse('standings', kwargs={'league_pk': test_league.pk}))
+    assert response.status_code == 200
+    assert len(response.context['standings']) == 4
+
+
+@pytest.mark.django_db(transaction=True)
+def test_server_benchmark_serves_every_request(test_league):
+    """
+    Test that the server benchmark runs the standings page through both the WSGI and the ASGI handlers.
+    """
+    path = reverse('standings', kwargs={'league_pk': test_league.pk})
+    wsgi = server_benchmark.run_wsgi(path, clients=4, workers=2, client_delay=0)
+    asgi = server_benchmark.run_asgi(path, clients=4, client_delay=0)
+    assert wsgi.statuses == asgi.statuses == [200] * 4
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db(transaction=True)
+def test_asgi_outperforms_wsgi_with_slow_clients(test_league):
+    """
+    Benchmark: with slow clients the async standings page on one ASGI event loop serves more requests
+    per second than the WSGI handler on a small thread pool.
+    """
+    path = reverse('standings', kwargs={'league_pk': test_league.pk})
+    wsgi = server_benchmark.run_wsgi(path, clients=20, workers=2, client_delay=0.05)
+    asgi = server_benchmark.run_asgi(path, clients=20, client_delay=0.05)
+    assert wsgi.statuses == asgi.statuses == [200] * 20
+    assert asgi.requests_per_second > wsgi.requests_per_second
+
+
+def test_recorded_result_publishes_league_events(client, test_league):
+    """
+    Test that recording a result adds the result and the new standings to the change feed of the league.
+    """
+    teams = list(test_league.teams.order_by('pk'))
+    match = Match.objects.create(league=test_league, home_team=teams[0], away_team=teams[1])
+    record_match_result(match, 2, 1)
+    result, standings = LeagueEvent.objects.filter(league=test_league).order_by('pk')
+    assert result.kind == 'result' and result.data['home_score'] == 2
+    assert standings.kind == 'standings' and standings.data[0]['team'] == teams[0].pk
+    assert format_event(result).startswith(f'id: {result.pk}\nevent: result\ndata: {{"match":{match.pk},')
+    assert client.get(reverse('league_events', kwargs={'league_pk': test_league.pk + 1})).status_code == 404
+
+
+@pytest.mark.django_db(transaction=True)
+def test_league_feed_is_only_offered_under_asgi(client, async_client, test_league):
+    """
+    Test that under WSGI the standings page does not open the change feed and the feed answers 501,
+    while under ASGI the page subscribes to it.
+    """
+    standings_url = reverse('standings', kwargs={'league_pk': test_league.pk})
+    events_url = reverse('league_events', kwargs={'league_pk': test_league.pk})
+    assert 'EventSource' not in client.get(standings_url).content.decode()
+    assert client.get(events_url).status_code == 501
+    response = asyncio.run(async_client.get(standings_url))
+    assert 'EventSource' in response.content.decode()
+
+
+def test_recorded_result_prunes_old_league_events(test_league):
+    """
+    Test that publishing a result deletes the events of the league older than the retention period.
+    """
+    teams = list(test_league.teams.order_by('pk'))
+    old = publish(test_league, 'result', {})
+    LeagueEvent.objects.filter(pk=old.pk).update(created_at=timezone.now() - EVENT_RETENTION - timedelta(days=1))
+    record_match_result(Match.objects.create(league=test_league, home_team=teams[0], away_team=teams[1]), 1, 0)
+    assert not LeagueEvent.objects.filter(pk=old.pk).exists()
+    assert LeagueEvent.objects.filter(league=test_league).count() == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_event_stream_replays_missed_events_then_goes_live(test_league):
+    """
+    Test that a reconnecting client first gets the events it missed, then new results as they are
+    recorded, and keepalive comments while nothing happens.
+    """
+    teams = list(test_league.teams.order_by('pk'))
+    first = Match.objects.create(league=test_league, home_team=teams[0], away_team=teams[1])
+    second = Match.objects.create(league=test_league, home_team=teams[2], away_team=teams[3])
+    record_match_result(first, 1, 0)
+    last_seen = LeagueEvent.objects.get(kind='result').pk
+
+    async def listen():
+        stream = event_stream(test_league.pk, last_event_id=last_seen, heartbeat=0.1)
+        try:
+            received = [await stream.__anext__(), await stream.__anext__()]
+            await sync_to_async(record_match_result)(second, 0, 3)
+            for _ in range(3):
+                received.append(await asyncio.wait_for(stream.__anext__(), 1))
+            return received
+        finally:
+            await stream.aclose()
+
+    retry, missed, result, standings, keepalive = asyncio.run(listen())
+    assert retry.startswith('retry:')
+    assert 'event: standings' in missed
+    assert 'event: result' in result and f'"match":{second.pk}' in result
+    assert 'event: standings' in standings
+    assert keepalive == ': keepalive\n\n'
+
+
+def test_league_exports_stream_players_in_chunks(logged_in_client, test_league, test_team, test_position,
+                                                  django_assert_max_num_queries):
+    """
+    Test that the player export includes dead players, reads the players in chunks with their skills
+    and traits prefetched per chunk, then the archived players, and is streamed by the command and the export view.
+    """
+    add_roster_players(test_team, test_position, range(1, 12))
+    Player.objects.filter(player_team=test_team, number=11).update(status='dead', graveyard=test_team)
+    get_rules()
+    with django_assert_max_num_queries(2 + 2 * 3 + 1):
+        lines = list(stream_export(test_league, 'players', 'csv', chunk_size=4))
+    assert len(lines) == 12
+    assert lines[0].startswith('id,team_id,team,number,name,position,status')
+    assert lines[-1].split(',')[6] == 'dead' and 'Block' in lines[-1]
+
+    out = StringIO()
+    call_command('export_league', test_league.name, 'teams', '--format', 'jsonl', stdout=out)
+    teams = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [team['name'] for team in teams] == list(test_league.teams.order_by('pk').values_list('team_name', flat=True))
+
+    response = logged_in_client.get(reverse('league_export', kwargs={
+        'league_pk': test_league.pk, 'kind': 'players', 'export_format': 'jsonl'}))
+    assert response.streaming and response['Content-Type'] == 'application/x-ndjson'
+    players = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+    assert len(players) == 11 and players[0]['skills'] == ['Block'] and players[0]['traits'] == ['Loner']
+    assert logged_in_client.get(reverse('league_export', kwargs={
+        'league_pk': test_league.pk, 'kind': 'matches', 'export_format': 'csv'})).status_code == 404
+
+
+def test_league_team_export_only_includes_the_treasuries_of_the_coach(logged_in_client, test_league, test_team):
+    """
+    Test that the team export of the view includes the treasury of the teams of the logged-in coach only,
+    while the command, run by the site operator, exports every treasury.
+    """
+    url = reverse('league_export', kwargs={'league_pk': test_league.pk, 'kind': 'teams', 'export_format': 'jsonl'})
+    teams = [json.loads(line) for line in b''.join(logged_in_client.get(url).streaming_content).decode().splitlines()]
+    assert len(teams) > 1
+    assert {team['id']: team.get('treasury') for team in teams} == {
+        team['id']: test_team.treasury if team['id'] == test_team.pk else None for team in teams}
+
+    url = reverse('league_export', kwargs={'league_pk': test_league.pk, 'kind': 'teams', 'export_format': 'csv'})
+    rows = list(csv.DictReader(b''.join(logged_in_client.get(url).streaming_content).decode().splitlines()))
+    assert {row['id']: row['treasury'] for row in rows} == {
+        row['id']: str(test_team.treasury) if row['id'] == str(test_team.pk) else '' for row in rows}
+
+    out = StringIO()
+    call_command('export_league', test_league.name, 'teams', '--format', 'jsonl', stdout=out)
+    assert all('treasury' in json.loads(line) for line in out.getvalue().splitlines())
+
+
+def test_import_teams_validates_rows_and_creates_in_bulk(test_coach, test_league, test_position,
+                                                         test_race_position_limit, django_assert_max_num_queries,
+                                                         django_capture_on_commit_callbacks):
+    """
+    Test that a CSV import creates the valid teams with their coaches, players and starting skills in bulk,
+    with a fixed number of queries, and reports every invalid row of the teams it leaves out.
+    """
+    skill, _ = Skill.objects.get_or_create(name='Block')
+    test_position.starting_skills.add(skill)
+    rows = ['team,coach,race,number,name,position']
+    for team, coach in (('Imported One', 'new_coach'), ('Imported Two', test_coach.coach_name)):
+        rows += [f'{team},{coach},Human,{number},Player {number},Test Position' for number in range(1, 5)]
+    rows += ['Broken,new_coach,HUM,1,Thrower,Catcher', 'Broken,new_coach,HUM,1,Lineman,test position',
+             'Second,new_coach,Human,1,Player,Test Position']
+    get_rules()
+    # Includes the queries recording the history points of the new teams once committed.
+    with django_assert_max_num_queries(16), django_capture_on_commit_callbacks(execute=True):
+        report = import_teams(rows, 'csv', league=test_league)
+
+    assert (report.teams, report.players, report.coaches) == (2, 8, 1)
+    assert [row for row, _ in report.errors] == [10, 12]
+    assert "'Catcher' is not a position" in report.errors[0][1]
+    assert 'already a team called Second' in report.errors[1][1]
+    team = Team.objects.get(team_name='Imported One')
+    assert team.coach.user.has_usable_password() is False
+    assert (team.treasury, team.ctv) == (800000, 200000) and team.verify_ctv()
+    assert team.players.filter(skills=skill).count() == 4
+    assert test_league.standings.filter(team=team).exists()
+
+
+def test_import_teams_rejects_existing_users_that_are_not_the_coach(test_coach, test_position,
+                                                                     test_race_position_limit):
+    """
+    Test that a coach name that is the username of an existing user, with no coach or with a coach under
+    another name, is reported as a row error, and that no user or coach is created for it.
+    """
+    User.objects.create_user(username='admin', password='password')
+    renamed = User.objects.create_user(username='renamed', password='password')
+    Coach.objects.create(user=renamed, coach_name='Renamed Coach')
+    rows = ['team,coach,race,number,name,position']
+    for team, coach in (('Admin Team', 'admin'), ('Renamed Team', 'renamed'), ('Fresh Team', 'fresh')):
+        rows.append(f'{team},{coach},Human,1,Player 1,Test Position')
+    coach_count = Coach.objects.count()
+
+    report = import_teams(rows, 'csv')
+
+    assert (report.teams, report.coaches) == (1, 1)
+    assert [row for row, _ in report.errors] == [2, 3]
+    assert 'admin is an existing user' in report.errors[0][1]
+    assert Coach.objects.count() == coach_count + 1
+    assert not Coach.objects.filter(user__username__in=['admin', 'renamed']).exclude(coach_name='Renamed Coach')
+
+
+def test_import_teams_view_is_for_the_commissioner(logged_in_client, test_coach, test_league, test_position,
+                                                   test_race_position_limit):
+    """
+    Test that only the commissioner may upload a file, and that a JSON Lines upload reports its invalid teams.
+    """
+    url = reverse('import_teams', kwargs={'league_pk': test_league.pk})
+    assert logged_in_client.get(url).status_code == 403
+    test_league.commissioner = test_coach
+    test_league.save()
+    lines = '\n'.join(json.dumps({'team': name, 'coach': 'other', 'race': 'Human', 'players': [
+        {'number': number, 'name': f'Player {number}', 'position': 'Test Position'} for number in range(1, size + 1)]})
+        for name, size in (('Uploaded', 3), ('Too Many', 5)))
+    response = logged_in_client.post(url, {'import_format': 'jsonl',
+                                           'file': SimpleUploadedFile('teams.jsonl', lines.encode())})
+    assert response.status_code == 200
+    report = response.context['report']
+    assert (report.teams, report.players) == (1, 3)
+    assert report.errors == [(2, 'Maximum number of this position has been reached for the team.')]
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+# The budget tests check the query budgets in the unit suite, and the time budgets too in the benchmark run.
+timed_budgets = pytest.mark.parametrize('timed', [False, pytest.param(True, marks=pytest.mark.benchmark, id='timed')])
+
+
+@pytest.fixture
+def budget_team(test_coach):
+    """
+    Load the whole rules data and create a coach with 10 Human teams, the first with a roster of 15 players
+    (12 Linemen, 2 Throwers and a Catcher, with their starting skills), for the performance budgets.
+    """
+    call_command('load_rules', stdout=StringIO())
+    race = Race.objects.get(race_type='HUM')
+    teams = [Team.objects.create(coach=test_coach, race=race, team_name=f'Budget Team {index}') for index in range(10)]
+    positions = {position.name: position for position in Position.objects.filter(race=race)}
+    entries = [{'name': f'Player {number}', 'number': number, 'position': positions[name]}
+               for number, name in enumerate(['Human Lineman'] * 12 + ['Human Thrower'] * 2 + ['Human Catcher'],
+                                             start=1)]
+    assert services.hire_players(teams[0], entries)
+    get_rules()
+    return teams[0]
+
+
+@timed_budgets
+def test_manage_team_budgets(logged_in_client, budget_team, within_budget, timed):
+    """
+    Test that the roster page, a staff purchase and a player hire stay within their query budgets with
+    a realistic roster, and within their time budgets in the benchmark run.
+    """
+    url = reverse('manage_team', args=[budget_team.pk])
+    catcher = Position.objects.get(name='Human Catcher', race__race_type='HUM')
+    with within_budget('manage_team.get', timed=timed):
+        response = logged_in_client.get(url)
+    assert 'Player 15' in response.content.decode()
+    with within_budget('manage_team.get.cached', timed=timed):
+        logged_in_client.get(url)
+    with within_budget('manage_team.post.reroll', timed=timed):
+        response = logged_in_client.post(url, {'add_reroll': 'Add Reroll'})
+    assert response.context['purchase_result']
+    with within_budget('manage_team.post.player', timed=timed):
+        response = logged_in_client.post(url, {'submit_player': 'Add', 'name': 'Player 16', 'number': 16,
+                                               'position': catcher.pk})
+    assert budget_team.players.count() == 16
+
+
+@timed_budgets
+def test_form_and_save_budgets(test_coach, budget_team, within_budget, timed):
+    """
+    Test that AddPlayerForm, Team.save and SelectTeamForm stay within their budgets with a realistic roster
+    and a coach with many teams; the time budgets only in the benchmark run.
+    """
+    catcher = Position.objects.get(name='Human Catcher', race__race_type='HUM')
+    with within_budget('add_player_form.init', timed=timed):
+        form = AddPlayerForm({'name': 'Player 16', 'number': 16, 'position': catcher.pk}, team=budget_team)
+    with within_budget('add_player_form.clean', timed=timed):
+        assert form.is_valid()
+    budget_team.cheerleaders += 1
+    with within_budget('team.save', timed=timed):
+        budget_team.save()
+    with within_budget('select_team_form', timed=timed):
+        form = SelectTeamForm({'team': budget_team.pk}, user=test_coach)
+        assert form.is_valid() and len(form.fields['team'].choices) == 11
+
+
+@pytest.mark.django_db
+@timed_budgets
+def test_load_command_budgets(within_budget, timed):
+    """
+    Test that every load command stays within its budget, both into an empty database and for a reload;
+    the time budgets only in the benchmark run.
+    """
+    commands = [('load_skills', 'skills.json'), ('load_traits', 'traits.json'), ('load_races', 'races.json'),
+                ('load_positions', 'teams')]
+    for _ in range(2):
+        for command, path in commands:
+            with within_budget(command, timed=timed):
+                call_command(command, os.path.join(DATA_DIR, path), stdout=StringIO())
+        with within_budget('load_rules', timed=timed):
+            call_command('load_rules', stdout=StringIO())
+    assert Position.objects.count() == 117
+
+
+def test_budget_catches_a_query_per_player(budget_team, within_budget):
+    """
+    Test that a hot path adding a query per player goes over its budget and the error lists the queries.
+    """
+    with pytest.raises(budgets.BudgetExceeded, match='queries, budget 7'):
+        with within_budget('manage_team.get'):
+            for player in budget_team.players.all():
+                list(player.skills.all())
+
+
+@pytest.mark.django_db
+def test_generate_league_is_reproducible_and_follows_the_rules():
+    """
+    Test that the synthetic league generator respects the position limits and team values, creates injured
+    and dead players with graveyard links and consistent standings, writes the matches in chunks of the chunk
+    size, gives the same data for the same seed, and refuses a rerun whose coach or team names are taken.
+    """
+    call_command('load_rules', stdout=StringIO())
+    out = StringIO()
+    with CaptureQueriesContext(connection) as context:
+        call_command('generate_league', 'Scale', '--coaches', '6', '--teams-per-coach', '4', '--rounds', '3',
+                     '--seed', '7', '--chunk-size', '16', stdout=out)
+    assert out.getvalue().startswith('6 coaches, 24 teams')
+    assert sum(query['sql'].startswith('INSERT INTO "bbm_app_match"') for query in context.captured_queries) == 3
+
+    league = League.objects.get(name='Scale')
+    rules = get_rules()
+    teams = list(league.teams.all())
+    for team in teams:
+        counts = {}
+        for position_id in team.players.values_list('position_id', flat=True):
+            counts[position_id] = counts.get(position_id, 0) + 1
+        assert all(count <= rules.position_limit(team.race_id, position_id) for position_id, count in counts.items())
+        assert team.verify_ctv()
+    dead = Player.objects.filter(player_team__in=teams, status='dead')
+    assert dead.exists() and not dead.exclude(graveyard=F('player_team')).exists()
+    assert Player.objects.filter(player_team__in=teams, status='injured').exists()
+    assert league.matches.filter(status='played').count() == 36
+    expected = expected_standings(league)
+    for standing in league.standings.all():
+        assert {field: getattr(standing, field) for field in STANDING_FIELDS} == expected[standing.team_id]
+
+    call_command('generate_league', 'Scale Copy', '--coaches', '6', '--teams-per-coach', '4', '--rounds', '3',
+                 '--seed', '7', stdout=StringIO())
+    copy = League.objects.get(name='Scale Copy')
+
+    def snapshot(league):
+        return [(player.name, player.position_id, player.status, player.spp, player.skills.count())
+                for player in Player.objects.filter(player_team__leagues=league).order_by('pk')]
+    assert snapshot(copy) == snapshot(league)
+
+    # A rerun whose names are partly taken fails before inserting anything.
+    User.objects.create(username='rerun_coach_5')
+    with pytest.raises(CommandError, match='Coaches of Rerun already exist'):
+        call_command('generate_league', 'Rerun', '--coaches', '6', '--teams-per-coach', '1', stdout=StringIO())
+    Team.objects.filter(pk=teams[0].pk).update(team_name='Rerun Team 3')
+    with pytest.raises(CommandError, match='Teams of Rerun already exist'):
+        call_command('generate_league', 'Rerun', '--coaches', '2', '--teams-per-coach', '2', stdout=StringIO())
+    assert not User.objects.filter(username__startswith='rerun_coach_').exclude(username='rerun_coach_5').exists()
+
+
+def test_hot_queries_use_indexes(test_team, test_position):
+    """
+    Test that every hot lookup is planned with an index on the configured database.
+    """
+    add_roster_players(test_team, test_position, range(1, 12))
+    Player.objects.filter(player_team=test_team, number=11).update(status='dead', graveyard=test_team)
+    assert query_plans.check_query_plans(test_team) == dict.fromkeys(query_plans.HOT_PATHS, [])
+    query_plans.assert_no_full_scans(test_team)
+    out = StringIO()
+    call_command('check_query_plans', '--team', str(test_team.pk), stdout=out)
+    assert 'team_value: index' in out.getvalue()
+
+
+@pytest.mark.skipif(connection.vendor != 'sqlite', reason='The plans checked are SQLite plans.')
+def test_sqlite_query_plans(test_team, test_position, monkeypatch):
+    """
+    Test that the hot lookups of the team value and position counts use covering indexes, that the harness
+    reports a full scan in the plan formats of every SQLite version, and that the command fails cleanly on
+    a database it cannot check.
+    """
+    add_roster_players(test_team, test_position, range(1, 11))
+    get_rules()
+    with CaptureQueriesContext(connection) as context:
+        assert test_team.CTV == 500000
+        test_team.players.filter(position=test_position).count()
+    plans = [query_plans.explain(query['sql']) for query in context.captured_queries]
+    assert 'COVERING INDEX player_team_status_value_idx' in plans[0][0]
+    assert 'COVERING INDEX player_team_position_idx' in plans[1][0]
+
+    with CaptureQueriesContext(connection) as context:
+        list(Player.objects.filter(name='Player 1'))
+    assert query_plans.full_scans(context.captured_queries[0]['sql']) == ['SCAN bbm_app_player']
+    assert query_plans.SCAN_PATTERNS['sqlite'].search('SCAN TABLE bbm_app_player').group('table') == 'bbm_app_player'
+
+    monkeypatch.delitem(query_plans.SCAN_PATTERNS, 'sqlite')
+    with pytest.raises(CommandError, match='cannot be checked on sqlite'):
+        call_command('check_query_plans', '--team', str(test_team.pk), stdout=StringIO())
+
+
+def test_roster_slots_are_cached_until_the_roster_changes(logged_in_client, test_team, test_position,
+                                                         test_race_position_limit, django_assert_num_queries):
+    """
+    Test that the roster slots are read once per team revision, follow a hire, and are served by the API.
+    """
+    add_roster_players(test_team, test_position, [1, 2])
+    test_team.refresh_from_db()
+    slots = RosterSlots.for_team(test_team)
+    assert slots.free_numbers == list(range(3, 17))
+    assert slots.remaining(test_position) == 2 and slots.affordable(test_position)
+    with django_assert_num_queries(0):
+        assert RosterSlots.for_team(test_team).roster == slots.roster
+
+    assert services.hire_player(test_team, 'Player 3', test_position, 3)
+    slots = RosterSlots.for_team(test_team)
+    assert slots.remaining(test_position) == 1 and 3 not in slots.free_numbers
+
+    url = reverse('api_team_slots', kwargs={'team_pk': test_team.pk})
+    assert Client().get(url).status_code == 403
+    response = logged_in_client.get(url)
+    assert response.json()['positions'] == [{'id': test_position.pk, 'name': 'Test Position', 'cost': 50000,
+                                             'remaining': 1, 'affordable': True}]
+    assert logged_in_client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 304
+
+
+@pytest.mark.parametrize('backend', ['locmem', 'filebased'])
+def test_roster_fragments_are_cached_until_the_team_changes(client, test_team, test_position, tmp_path, backend,
+                                                            django_assert_num_queries):
+    """
+    Test that the roster table and staff section are served from the cache while the team is unchanged,
+    with the team as the only query, and rendered again after a staff purchase or a new skill.
+    """
+    backends = {
+        'locmem': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'fragments'},
+        'filebased': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': str(tmp_path)},
+    }
+    add_roster_players(test_team, test_position, [1, 2])
+    url = reverse('team_roster', kwargs={'team_pk': test_team.pk})
+    with override_settings(CACHES={'default': backends[backend]}):
+        get_rules()
+        client.get(url)
+        with django_assert_num_queries(1):
+            response = client.get(url)
+        assert 'Player 2' in response.content.decode()
+        assert 'Cheerleaders: 0' in response.content.decode()
+
+        test_team.refresh_from_db()
+        assert services.buy_cheerleader(test_team)
+        assert 'Cheerleaders: 1' in client.get(url).content.decode()
+        skill = Skill.objects.create(name='Sure Feet')
+        test_team.players.get(number=2).skills.add(skill)
+        assert 'Sure Feet' in client.get(url).content.decode()
+
+
+def test_coach_is_loaded_with_the_user_and_kept_in_the_session(client, test_coach, test_team,
+                                                               django_assert_num_queries):
+    """
+    Test that logging in stores the coach id in the session, that an authenticated page only loads the session
+    and the user with its coach before its own queries, and that ownership checks compare coach ids.
+    """
+    assert client.post(reverse('login'), {'coach_name': 'test_coach', 'password': 'password123'}).status_code == 302
+    assert client.session[COACH_SESSION_KEY] == test_coach.pk
+    with django_assert_num_queries(3):
+        response = client.get(reverse('main'))
+    assert test_team.team_name in response.content.decode()
+    user = CoachBackend().get_user(test_coach.user_id)
+    with django_assert_num_queries(0):
+        assert user.coach == test_coach
+
+    other_coach = Coach.objects.create(user=User.objects.create_user(username='other', password='other'),
+                                       coach_name='other')
+    other_team = Team.objects.create(coach=other_coach, team_name='Other Team', race=test_team.race)
+    assert client.get(reverse('manage_team', args=[other_team.pk])).status_code == 403
+    assert client.get(reverse('manage_team', args=[test_team.pk])).status_code == 200
+
+    session = client.session
+    del session[COACH_SESSION_KEY]
+    session.save()
+    assert client.get(reverse('manage_team', args=[test_team.pk])).status_code == 200
+    assert client.session[COACH_SESSION_KEY] == test_coach.pk
+
+
+def test_archive_moves_players_out_of_the_roster(client, test_league, test_team, test_position):
+    """
+    Test that dead, retired and fired players are moved to the archive with their stats, skills and traits,
+    that the team value and roster only keep live players, and that the graveyard, the archive API and the
+    export still read them. A dead player with SPP from an unprocessed match is kept until it is processed,
+    and is in the graveyard meanwhile; once archived its SPP awards are kept on its record.
+    """
+    add_roster_players(test_team, test_position, [1, 2, 3, 4, 5])
+    players = {player.number: player for player in test_team.players.all()}
+    for number in (1, 5):
+        players[number].status = 'dead'
+        players[number].graveyard = test_team
+        players[number].spp = 7
+        players[number].save()
+    opponent = test_league.teams.exclude(pk=test_team.pk).first()
+    record_match_result(Match.objects.create(league=test_league, home_team=test_team, away_team=opponent), 1, 0,
+                        spp_awards={players[5]: 2})
+
+    assert archive_dead_players(Team.objects.filter(pk=test_team.pk)) == 1
+    retire_player(players[2])
+    fire_player(Player.objects.get(pk=players[3].pk))
+    test_team.refresh_from_db()
+    assert sorted(test_team.players.values_list('number', flat=True)) == [4, 5]
+    assert test_team.ctv == 50000 and test_team.verify_ctv()
+
+    unarchived, dead = graveyard(test_team)
+    assert (unarchived.pk, unarchived.status) == (players[5].pk, 'dead')
+    assert (dead.original_id, dead.number, dead.spp, dead.get_level_display()) == (players[1].pk, 1, 7, 'Rookie')
+    assert [str(skill) for skill in dead.skills.all()] == ['Block']
+    assert [str(trait) for trait in dead.traits.all()] == ['Loner']
+    assert sorted(test_team.archived_players.values_list('reason', flat=True)) == ['dead', 'fired', 'retired']
+
+    response = client.get(reverse('api_team_archive', kwargs={'team_pk': test_team.pk}), {'reason': 'dead'})
+    assert [player['id'] for player in response.json()['results']] == [players[1].pk]
+    assert client.get(reverse('api_team_archive', kwargs={'team_pk': test_team.pk}),
+                      {'reason': 'sold'}).status_code == 400
+    rows = [json.loads(line) for line in stream_export(test_league, 'players', 'jsonl')]
+    assert {row['number']: row['status'] for row in rows if row['team_id'] == test_team.pk} == {
+        1: 'dead', 2: 'retired', 3: 'fired', 4: 'active', 5: 'dead'}
+
+    Match.objects.filter(league=test_league).update(processed=True)
+    assert archive_dead_players(Team.objects.filter(pk=test_team.pk)) == 1
+    assert [(dead.original_id, dead.spp_awards) for dead in graveyard(test_team)] == [
+        (players[5].pk, [[Match.objects.get(league=test_league).pk, 2]]), (players[1].pk, [])]
+
+
+def test_advancement_engine_matches_the_orm(client, budget_team, django_assert_max_num_queries):
+    """
+    Test that the legal primary and secondary picks computed with skill masks are the ones the category
+    tables give, that learning a skill removes it and uses a pending pick, and that the league report and
+    the API list the players with pending picks with a query per chunk of players. A characteristic
+    increase uses a pending pick too, while a lasting injury does not give one back.
+    """
+    catcher = budget_team.players.get(position__name='Human Catcher')
+    catcher.spp = 16
+    catcher.check_level_up()
+    catcher.save()
+    known = set(catcher.skills.values_list('pk', flat=True))
+    position = catcher.position
+    expected_primary = set(Skill.objects.filter(categories__primary_positions=position).values_list('pk', flat=True))
+    expected_secondary = set(Skill.objects.filter(categories__secondary_positions=position)
+                             .values_list('pk', flat=True)) - expected_primary
+    primary, secondary = legal_picks(catcher)
+    assert {skill.pk for skill in primary} == expected_primary - known and primary
+    assert {skill.pk for skill in secondary} == expected_secondary - known and secondary
+    assert get_engine() is get_engine()
+
+    catcher.skills.add(primary[0])
+    (player, pending, primary_ids, secondary_ids), = advancements(budget_team.players.all(), chunk_size=4)
+    assert (player.pk, pending) == (catcher.pk, 1) and primary[0].pk not in primary_ids
+
+    league = League.objects.create(name='Advancement League')
+    league.add_team(budget_team)
+    with django_assert_max_num_queries(3 + 2 * 4 + 1):
+        rows = [json.loads(line) for line in stream_export(league, 'advancements', 'jsonl', chunk_size=4)]
+    assert [(row['number'], row['pending']) for row in rows] == [(catcher.number, 1)]
+    assert rows[0]['primary'] == [skill.name for skill in primary[1:]]
+    response = client.get(reverse('api_team_advancements', kwargs={'team_pk': budget_team.pk}))
+    assert [player['pending'] for player in response.json()['results']] == [1]
+
+    Player.objects.filter(pk=catcher.pk).update(movement=position.movement + 1, agility=position.agility + 1)
+    assert list(advancements(budget_team.players.all())) == []
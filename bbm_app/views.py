@@ -1,3 +1,7 @@
+import codecs
+from datetime import datetime, time
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, authenticate
 from django.urls import reverse_lazy
@@ -5,12 +9,23 @@ from django.views.generic.edit import FormView
 from django.views import View
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponseForbidden
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, \
+    StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.contrib.auth.views import LogoutView
 
 
-from .forms import LoginForm, CreateCoachForm, CreateTeamForm, AddPlayerForm, SelectTeamForm
-from .models import Team, Coach
+from .forms import LoginForm, CreateCoachForm, CreateTeamForm, AddPlayerForm, SelectTeamForm, BatchHireFormSet, \
+    MatchResultForm, ImportTeamsForm
+from .matches import MatchAlreadyPlayed, record_match_result, standings_order
+from .events import event_stream, is_live
+from .exports import EXPORT_FORMATS, stream_export
+from .imports import import_teams
+from .history import VALUE_FIELDS, league_history, team_history
+from .models import Team, League, Match
+from . import services
+from .roster import RosterReadModel
 
 
 class LoginView(FormView):
@@ -85,11 +100,11 @@ class CreateTeamView(LoginRequiredMixin, FormView):
         """
         This method is called when the form is valid.
 
-        It creates a new team, associates it with the current user (who is a coach),
+        It creates a new team, associates it with the coach of the current user (read from the session),
         sets the chosen race, saves the team, and then redirects to the manage team page for the newly created team.
         """
         team = form.save(commit=False)
-        team.coach = Coach.objects.get(user=self.request.user)
+        team.coach_id = self.request.coach_id
         team.race = form.cleaned_data['race']
         team.save()
         team.refresh_from_db()
@@ -97,13 +112,11 @@ class CreateTeamView(LoginRequiredMixin, FormView):
         return redirect('manage_team', team_pk=team.pk)
 
 
-class ManageTeamView(LoginRequiredMixin, FormView):
+class TeamCoachRequiredMixin:
     """
-    This view is used to manage a specific team.
-    It requires a user to be logged in, and it uses the FormView Django class for form handling.
-    The page that is rendered with this view uses the template 'manage_team.html'.
+    A mixin for views that modify a specific team.
+    It fetches the team based on the passed team id and only lets the coach of the team in.
     """
-    template_name = "manage_team.html"
 
     def dispatch(self, request, *args, **kwargs):
         """
@@ -111,21 +124,33 @@ class ManageTeamView(LoginRequiredMixin, FormView):
 
         It fetches the team based on the passed team id.
         If the team does not exist or the logged-in user is not the coach of the team, it denies the request.
+        The coach of the team is compared by id with the coach id of the session (see CoachMiddleware).
         """
-        self.team = get_object_or_404(Team, pk=kwargs['team_pk'])
-        if self.team.coach.user != request.user:
+        self.team = get_object_or_404(RosterReadModel.team_queryset(), pk=kwargs['team_pk'])
+        if request.coach_id is None or self.team.coach_id != request.coach_id:
             return HttpResponseForbidden('You are not allowed to modify this team.')
         return super().dispatch(request, *args, **kwargs)
 
+
+class ManageTeamView(LoginRequiredMixin, TeamCoachRequiredMixin, FormView):
+    """
+    This view is used to manage a specific team.
+    It requires a user to be logged in, and it uses the FormView Django class for form handling.
+    The page that is rendered with this view uses the template 'manage_team.html'.
+    """
+    template_name = "manage_team.html"
+
     def get(self, request, *args, **kwargs):
         """
         This method handles GET requests.
 
         It prepares the form and the players data for the team, and renders the page with these data.
+        The roster table and the staff section are read from the cache while the team is unchanged.
         """
         add_player_form = AddPlayerForm(team=self.team)
-        players = self.team.players.order_by('number')
-        return render(request, self.template_name, {'team': self.team, 'add_player_form': add_player_form, 'players': players})
+        roster = RosterReadModel(self.team)
+        context = roster.get_context(manage=True, add_player_form=add_player_form, slots=add_player_form.slots)
+        return render(request, self.template_name, context)
 
     def post(self, request, *args, **kwargs):
         """
@@ -135,100 +160,462 @@ class ManageTeamView(LoginRequiredMixin, FormView):
         it either adds a reroll, an apothecary, an assistant coach, a cheerleader to the team,
         or creates a new player in the team.
 
-        In all cases where the team is modified, the team's treasury is deducted by the respective cost of the action.
+        Every purchase goes through the purchase services, which deduct the cost from the team's treasury
+        in a single conditional statement, so concurrent requests cannot overspend it.
 
         At the end, it renders the page with the updated team data and the form for adding a new player.
         """
-        add_player_form = AddPlayerForm(request.POST or None, team=self.team) if 'submit_player' in request.POST else AddPlayerForm(team=self.team)
+        purchase_result = None
         if 'add_reroll' in request.POST:
-            if self.team.treasury >= self.team.reroll_cost and self.team.team_re_roll < 8:
-                self.team.treasury -= self.team.reroll_cost
-                self.team.team_re_roll += 1
-                self.team.save()
+            purchase_result = services.buy_reroll(self.team)
 
         elif 'add_apothecary' in request.POST:
-            if self.team.treasury >= 50000 and not self.team.apothecary and self.team.race.has_apothecary:
-                self.team.treasury -= 50000
-                self.team.apothecary = True
-                self.team.save()
+            purchase_result = services.buy_apothecary(self.team)
 
         elif 'add_assistant_coach' in request.POST:
-            if self.team.treasury >= 10000 and self.team.assistant_coaches < 8:
-                self.team.treasury -= 10000
-                self.team.assistant_coaches += 1
-                self.team.save()
+            purchase_result = services.buy_assistant_coach(self.team)
 
         elif 'add_cheerleader' in request.POST:
-            if self.team.treasury >= 10000 and self.team.cheerleaders < 8:
-                self.team.treasury -= 10000
-                self.team.cheerleaders += 1
-                self.team.save()
-
-        if 'submit_player' in request.POST and add_player_form.is_valid():
-            player = add_player_form.save(commit=False)
-            player.player_team = self.team
-            position_selected = add_player_form.cleaned_data.get('position')
-            player.movement = position_selected.movement
-            player.strength = position_selected.strength
-            player.agility = position_selected.agility
-            player.armor = position_selected.armor
-            player.passing = position_selected.passing
-            player.value = position_selected.cost
-            player.save()
-            player.traits.set(position_selected.traits.all())
-            player.skills.set(position_selected.starting_skills.all())
-            player.primary_skill_categories.set(position_selected.primary_skill_categories.all())
-            player.secondary_skill_categories.set(position_selected.secondary_skill_categories.all())
-            self.team.treasury -= player.position.cost
-            self.team.save()
-
-        players = self.team.players.all()
-        return render(request, self.template_name, {'team': self.team, 'add_player_form': add_player_form, 'players': players})
-
-
-class MainPageView(LoginRequiredMixin, View):
+            purchase_result = services.buy_cheerleader(self.team)
+
+        if 'submit_player' in request.POST:
+            add_player_form = AddPlayerForm(request.POST, team=self.team)
+            if add_player_form.is_valid():
+                hire_result = services.hire_player(
+                    self.team,
+                    add_player_form.cleaned_data['name'],
+                    add_player_form.cleaned_data['position'],
+                    int(add_player_form.cleaned_data['number']),
+                )
+                if hire_result:
+                    add_player_form = AddPlayerForm(team=self.team)
+                else:
+                    add_player_form.add_error(None, hire_result.message)
+        else:
+            add_player_form = AddPlayerForm(team=self.team)
+
+        roster = RosterReadModel(self.team)
+        context = roster.get_context(manage=True, add_player_form=add_player_form, slots=add_player_form.slots,
+                                     purchase_result=purchase_result)
+        return render(request, self.template_name, context)
+
+
+class BatchHireView(LoginRequiredMixin, TeamCoachRequiredMixin, View):
+    """
+    This view is used to hire a whole list of players for a specific team in one request,
+    for example a full starting roster.
+    The page that is rendered with this view uses the template 'batch_hire.html'.
+    """
+    template_name = 'batch_hire.html'
+
+    def get(self, request, *args, **kwargs):
+        """
+        This method handles GET requests.
+
+        It renders the page with an empty batch hire form.
+        """
+        formset = BatchHireFormSet(team=self.team)
+        return render(request, self.template_name, {'team': self.team, 'formset': formset})
+
+    def post(self, request, *args, **kwargs):
+        """
+        This method handles POST requests.
+
+        It validates every filled row of the form together and hires all players in one transaction.
+        On success it redirects to the manage team page, otherwise it renders the form with the errors.
+        """
+        formset = BatchHireFormSet(request.POST, team=self.team)
+        if formset.is_valid():
+            hire_result = services.hire_players(self.team, formset.entries)
+            if hire_result:
+                return redirect('manage_team', team_pk=self.team.pk)
+            filled_forms = formset.filled_forms
+            for index, message in hire_result.errors:
+                filled_forms[index].add_error(None, message)
+            if not hire_result.errors:
+                formset.non_form_errors().append(hire_result.message)
+        return render(request, self.template_name, {'team': self.team, 'formset': formset})
+
+
+async def load_user(request):
+    """
+    Loads the user of the request from the session in a worker thread, so async views, their
+    permission checks and the templates they render can read request.user without a query.
+    """
+    await sync_to_async(lambda: request.user.is_authenticated)()
+    return request.user
+
+
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    """
+    A LoginRequiredMixin for async views. The user is loaded with load_user before the check.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        """
+        This method is run before handling the request.
+
+        It denies the request if the user is not logged in, otherwise it runs the async handler.
+        """
+        user = await load_user(request)
+        if not user.is_authenticated:
+            return self.handle_no_permission()
+        return await super(LoginRequiredMixin, self).dispatch(request, *args, **kwargs)
+
+
+async def coach_teams(request):
+    """
+    Returns the teams of the coach of the logged-in user, loaded with one async query by the coach id of the session.
+    """
+    return [team async for team in Team.objects.filter(coach_id=request.coach_id)]
+
+
+class MainPageView(AsyncLoginRequiredMixin, View):
     """
     This is a view class for the main page of the application.
 
     The page requires the user to be logged in. If the user is logged in, the page displays a form for selecting a team.
+    The view is async, so an ASGI worker can serve many slow clients at once.
     """
     template_name = 'main.html'
 
-    def get(self, request, *args, **kwargs):
+    async def get(self, request, *args, **kwargs):
         """
         This method handles GET requests.
 
         It renders the main page with the form for selecting a team.
         """
-        select_team_form = SelectTeamForm(user=request.user.coach)
+        select_team_form = SelectTeamForm(teams=await coach_teams(request))
         return render(request, self.template_name, {'select_team_form': select_team_form})
 
 
-class SelectTeamView(LoginRequiredMixin, FormView):
+class SelectTeamView(AsyncLoginRequiredMixin, View):
     """
     This is a view class for the select team form on the main page of the application.
 
     The view requires the user to be logged in. If the user is logged in, and a team is selected via the form,
     the user is redirected to the manage team page of the selected team.
+    The view is async; the form is validated against the teams loaded with the async ORM.
     """
-    form_class = SelectTeamForm
     template_name = 'main.html'
 
-    def get_form_kwargs(self):
+    async def get(self, request, *args, **kwargs):
         """
-        This method returns the keyword arguments for instantiating the form.
+        This method handles GET requests.
 
-        In this case, it adds the currently logged in user's coach instance to the arguments.
+        It renders the page with the form for selecting a team.
         """
-        kwargs = super().get_form_kwargs()
-        kwargs.update({'user': self.request.user.coach})
-        return kwargs
+        form = SelectTeamForm(teams=await coach_teams(request))
+        return render(request, self.template_name, {'form': form, 'select_team_form': form})
 
-    def form_valid(self, form):
+    async def post(self, request, *args, **kwargs):
         """
-        This method is called if the form is valid.
+        This method handles POST requests.
+
+        It redirects the user to the manage team page of the selected team,
+        or renders the form with the errors.
+        """
+        form = SelectTeamForm(request.POST, teams=await coach_teams(request))
+        if form.is_valid():
+            return redirect('manage_team', team_pk=form.cleaned_data['team'].pk)
+        return render(request, self.template_name, {'form': form, 'select_team_form': form})
+
+
+class RecordMatchResultView(LoginRequiredMixin, View):
+    """
+    This view is used to record the result of a scheduled match of a league.
+    Only the league commissioner and the coaches of the two teams may record it.
+    The page that is rendered with this view uses the template 'match_result.html'.
+    """
+    template_name = 'match_result.html'
+
+    def dispatch(self, request, *args, **kwargs):
+        """
+        This method is run before handling the request.
+
+        Anonymous users are redirected to the login page before the match is looked up. Otherwise it
+        fetches the match based on the passed league and match ids, and denies the request if the
+        logged-in user may not record its result.
+        """
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        self.match = get_object_or_404(
+            Match.objects.select_related('league', 'home_team', 'away_team'),
+            pk=kwargs['match_pk'], league_id=kwargs['league_pk'],
+        )
+        allowed_coaches = {self.match.home_team.coach_id, self.match.away_team.coach_id,
+                           self.match.league.commissioner_id}
+        if request.coach_id is None or request.coach_id not in allowed_coaches:
+            return HttpResponseForbidden('You are not allowed to record this match.')
+        return super().dispatch(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        """
+        This method handles GET requests.
+
+        It renders the page with an empty result form.
+        """
+        form = MatchResultForm(match=self.match)
+        return render(request, self.template_name, {'match': self.match, 'form': form})
+
+    def post(self, request, *args, **kwargs):
+        """
+        This method handles POST requests.
+
+        It records the result and the SPP awards, updates the standings and redirects to them.
+        If the form is invalid or the match already has a result, it renders the form with the errors.
+        """
+        form = MatchResultForm(request.POST, match=self.match)
+        if form.is_valid():
+            try:
+                record_match_result(
+                    self.match,
+                    form.cleaned_data['home_score'],
+                    form.cleaned_data['away_score'],
+                    home_casualties=form.cleaned_data['home_casualties'],
+                    away_casualties=form.cleaned_data['away_casualties'],
+                    home_winnings=form.cleaned_data['home_winnings'],
+                    away_winnings=form.cleaned_data['away_winnings'],
+                    spp_awards=form.spp_awards,
+                )
+            except MatchAlreadyPlayed as error:
+                form.add_error(None, str(error))
+            else:
+                return redirect('standings', league_pk=self.match.league_id)
+        return render(request, self.template_name, {'match': self.match, 'form': form})
+
+
+class ImportTeamsView(LoginRequiredMixin, View):
+    """
+    This view is used to register many pre-built teams into a league at once, from an uploaded file.
+    Only the league commissioner may import teams.
+    The page that is rendered with this view uses the template 'import_teams.html'.
+    """
+    template_name = 'import_teams.html'
 
-        It redirects the user to the manage team page of the selected team.
+    def dispatch(self, request, *args, **kwargs):
+        """
+        This method is run before handling the request.
+
+        Anonymous users are redirected to the login page before the league is looked up. Otherwise it
+        fetches the league based on the passed id, and denies the request if the logged-in user
+        is not its commissioner.
+        """
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        self.league = get_object_or_404(League, pk=kwargs['league_pk'])
+        if request.coach_id is None or self.league.commissioner_id != request.coach_id:
+            return HttpResponseForbidden('You are not allowed to import teams into this league.')
+        return super().dispatch(request, *args, **kwargs)
+
+    def get(self, request, *args, **kwargs):
+        """
+        This method handles GET requests.
+
+        It renders the page with an empty upload form.
+        """
+        return render(request, self.template_name, {'league': self.league, 'form': ImportTeamsForm(), 'report': None})
+
+    def post(self, request, *args, **kwargs):
+        """
+        This method handles POST requests.
+
+        It reads the uploaded file line by line, creates the valid teams and renders the report of the rows
+        that were left out. If the file cannot be read, it renders the form with the error.
+        """
+        form = ImportTeamsForm(request.POST, request.FILES)
+        report = None
+        if form.is_valid():
+            lines = codecs.iterdecode(form.cleaned_data['file'], 'utf-8-sig')
+            try:
+                report = import_teams(lines, form.cleaned_data['import_format'], league=self.league)
+            except ValueError as error:
+                form.add_error('file', str(error))
+        return render(request, self.template_name, {'league': self.league, 'form': form, 'report': report})
+
+
+class StandingsView(View):
+    """
+    This view shows the standings table of a league, read straight from the materialized standings rows.
+    The view is async, so an ASGI worker can serve many slow clients at once.
+    The page that is rendered with this view uses the template 'standings.html'.
+    """
+    template_name = 'standings.html'
+
+    async def get(self, request, *args, **kwargs):
+        """
+        This method handles GET requests.
+
+        It renders the standings of the league ordered by points and the tiebreakers. The page only
+        subscribes to the change feed of the league when served by the ASGI entry point.
+        """
+        await load_user(request)
+        try:
+            league = await League.objects.aget(pk=kwargs['league_pk'])
+        except League.DoesNotExist:
+            raise Http404('No league matches the given query.')
+        standings = [standing async for standing in
+                     league.standings.select_related('team').order_by(*standings_order())]
+        return render(request, self.template_name, {'league': league, 'standings': standings,
+                                                    'live_events': is_live(request)})
+
+
+class LeagueEventsView(View):
+    """
+    This view streams the change feed of a league, results and standings, as Server-Sent Events,
+    so spectators and coaches get changes as they happen instead of polling the standings page.
+    Every client holds one long-lived connection, fed from the single live feed of the league in the
+    process. It needs the ASGI entry point: under WSGI, where a worker would be held by every open
+    connection, it answers 501 Not Implemented instead.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        """
+        This method handles GET requests.
+
+        It streams the events of the league, starting after the id in the 'Last-Event-ID' header
+        (sent by browsers when they reconnect) or the 'last_event_id' query parameter, if given.
+        """
+        if not await League.objects.filter(pk=kwargs['league_pk']).aexists():
+            raise Http404('No league matches the given query.')
+        if not is_live(request):
+            return HttpResponse('The league feed needs the ASGI server.', status=501, content_type='text/plain')
+        last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+        last_event_id = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+        response = StreamingHttpResponse(event_stream(kwargs['league_pk'], last_event_id),
+                                         content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+class TeamRosterView(View):
+    """
+    This view shows the roster of a team to anyone, read only: players, team value and staff.
+    The view is async, so an ASGI worker can serve many slow clients at once.
+    The page that is rendered with this view uses the template 'team_roster.html'.
+    """
+    template_name = 'team_roster.html'
+
+    async def get(self, request, *args, **kwargs):
+        """
+        This method handles GET requests.
+
+        It renders the roster of the team, loaded with a fixed number of async queries,
+        or with the team alone while its cached roster table and staff section are current.
+        """
+        await load_user(request)
+        try:
+            team = await RosterReadModel.team_queryset().aget(pk=kwargs['team_pk'])
+        except Team.DoesNotExist:
+            raise Http404('No team matches the given query.')
+        return render(request, self.template_name, await RosterReadModel(team).aget_context())
+
+
+class HistoryRangeMixin:
+    """
+    A mixin for the history views. It reads the optional 'from' and 'to' query parameters,
+    given as ISO dates or date times, and returns the time series as JSON.
+    """
+
+    def get_range(self):
+        """
+        Returns the (start, end) datetimes of the requested range, None where not given.
+        Raises ValueError for a parameter that is not a valid date or date time.
+        """
+        bounds = []
+        for name, end_of_day in (('from', False), ('to', True)):
+            value = self.request.GET.get(name)
+            if not value:
+                bounds.append(None)
+                continue
+            moment = parse_datetime(value)
+            if moment is None:
+                day = parse_date(value)
+                if day is None:
+                    raise ValueError(f"'{name}' must be an ISO date or date time.")
+                moment = datetime.combine(day, time.max if end_of_day else time.min)
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+            bounds.append(moment)
+        return tuple(bounds)
+
+    def serialize(self, team, points):
+        """
+        Returns the JSON representation of the history of a team: one [time, ctv, treasury, fan factor]
+        list per point, which is what charting libraries expect. As in the API, the treasury is only
+        given to the coach of the team; it is null in the points of the teams of other coaches.
+        """
+        private = self.request.coach_id is not None and team.coach_id == self.request.coach_id
+        return {
+            'id': team.pk,
+            'name': team.team_name,
+            'points': [[at.isoformat(), ctv, treasury if private else None, fan_factor]
+                       for at, ctv, treasury, fan_factor in points],
+        }
+
+    def get(self, request, *args, **kwargs):
+        """
+        This method handles GET requests.
+
+        It returns the history as JSON, or a 400 response for an invalid range.
+        """
+        try:
+            start, end = self.get_range()
+        except ValueError as error:
+            return HttpResponseBadRequest(str(error))
+        return JsonResponse({'fields': ['at', *VALUE_FIELDS], **self.get_history(start, end)})
+
+
+class TeamHistoryView(LoginRequiredMixin, HistoryRangeMixin, View):
+    """
+    This view returns the value, treasury and fan factor history of a team as JSON, for charting.
+    The treasury is only given to the coach of the team.
+    """
+
+    def get_history(self, start, end):
+        """
+        Returns the history of the team between 'start' and 'end'.
+        """
+        team = get_object_or_404(Team, pk=self.kwargs['team_pk'])
+        return {'team': self.serialize(team, team_history(team, start, end))}
+
+
+class LeagueExportView(LoginRequiredMixin, View):
+    """
+    This view downloads every team or every player of a league, dead players included, as CSV or JSON Lines.
+    The file is streamed while the players are read in chunks, so it never has to fit in memory.
+    Only the treasuries of the teams of the logged-in coach are exported.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        This method handles GET requests.
+
+        It streams the export named by 'kind' ('teams', 'players' or 'advancements') in 'export_format'
+        ('csv' or 'jsonl'), or returns a 404 response for an unknown kind or format.
+        """
+        league = get_object_or_404(League, pk=kwargs['league_pk'])
+        try:
+            lines = stream_export(league, kwargs['kind'], kwargs['export_format'], coach_id=request.coach_id)
+        except ValueError as error:
+            raise Http404(str(error))
+        response = StreamingHttpResponse(lines, content_type=EXPORT_FORMATS[kwargs['export_format']])
+        response['Content-Disposition'] = \
+            f'attachment; filename="league-{league.pk}-{kwargs["kind"]}.{kwargs["export_format"]}"'
+        return response
+
+
+class LeagueHistoryView(LoginRequiredMixin, HistoryRangeMixin, View):
+    """
+    This view returns the value, treasury and fan factor history of every team of a league as JSON.
+    Only the treasuries of the teams of the logged-in coach are given.
+    """
+
+    def get_history(self, start, end):
+        """
+        Returns the history of every team of the league between 'start' and 'end'.
         """
-        team_pk = form.cleaned_data['team'].pk
-        return redirect('manage_team', team_pk=team_pk)
+        league = get_object_or_404(League, pk=self.kwargs['league_pk'])
+        return {'teams': [self.serialize(team, points)
+                          for team, points in league_history(league, start, end).items()]}
@@ -48,10 +48,14 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'bbm_app.auth.CoachMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Users are loaded together with their coach.
+AUTHENTICATION_BACKENDS = ['bbm_app.auth.CoachBackend']
+
 ROOT_URLCONF = 'blood_bowl_manager.urls'
 
 TEMPLATES = [
@@ -88,6 +92,20 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The rules data version, the roster slots and the rendered roster fragments are cached here.
+# Local memory is per process; with several workers use a shared backend, e.g.
+# 'django.core.cache.backends.filebased.FileBasedCache' or a Redis or Memcached cache.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'blood-bowl-manager',
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -17,7 +17,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path
 
-from bbm_app.views import MainPageView, LoginView, RegistrationView, CreateTeamView, ManageTeamView, LogoutView, SelectTeamView
+from bbm_app.api import RaceListApiView, PositionListApiView, CoachApiView, TeamListApiView, TeamApiView, \
+    PlayerListApiView, TeamSlotsApiView, ArchivedPlayerListApiView, AdvancementListApiView
+from bbm_app.views import MainPageView, LoginView, RegistrationView, CreateTeamView, ManageTeamView, LogoutView, SelectTeamView, \
+    BatchHireView, RecordMatchResultView, StandingsView, TeamHistoryView, LeagueHistoryView, \
+    TeamRosterView, LeagueEventsView, LeagueExportView, ImportTeamsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -27,5 +31,26 @@ urlpatterns = [
     path('registration/', RegistrationView.as_view(), name='registration'),
     path('team_creation/', CreateTeamView.as_view(), name='create_team'),
     path('manage_team/<int:team_pk>/', ManageTeamView.as_view(), name='manage_team'),
+    path('manage_team/<int:team_pk>/hire/', BatchHireView.as_view(), name='batch_hire'),
+    path('team/<int:team_pk>/', TeamRosterView.as_view(), name='team_roster'),
+    path('team/<int:team_pk>/history/', TeamHistoryView.as_view(), name='team_history'),
     path('select_team/', SelectTeamView.as_view(), name='select_team'),
+    path('league/<int:league_pk>/standings/', StandingsView.as_view(), name='standings'),
+    path('league/<int:league_pk>/events/', LeagueEventsView.as_view(), name='league_events'),
+    path('league/<int:league_pk>/export/<slug:kind>.<slug:export_format>', LeagueExportView.as_view(),
+         name='league_export'),
+    path('league/<int:league_pk>/import/', ImportTeamsView.as_view(), name='import_teams'),
+    path('league/<int:league_pk>/history/', LeagueHistoryView.as_view(), name='league_history'),
+    path('league/<int:league_pk>/match/<int:match_pk>/result/', RecordMatchResultView.as_view(),
+         name='record_match_result'),
+    path('api/v1/races/', RaceListApiView.as_view(), name='api_races'),
+    path('api/v1/positions/', PositionListApiView.as_view(), name='api_positions'),
+    path('api/v1/coaches/<int:coach_pk>/', CoachApiView.as_view(), name='api_coach'),
+    path('api/v1/teams/', TeamListApiView.as_view(), name='api_teams'),
+    path('api/v1/teams/<int:team_pk>/', TeamApiView.as_view(), name='api_team'),
+    path('api/v1/teams/<int:team_pk>/players/', PlayerListApiView.as_view(), name='api_team_players'),
+    path('api/v1/teams/<int:team_pk>/slots/', TeamSlotsApiView.as_view(), name='api_team_slots'),
+    path('api/v1/teams/<int:team_pk>/archive/', ArchivedPlayerListApiView.as_view(), name='api_team_archive'),
+    path('api/v1/teams/<int:team_pk>/advancements/', AdvancementListApiView.as_view(),
+         name='api_team_advancements'),
 ]